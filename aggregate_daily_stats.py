@@ -0,0 +1,73 @@
+"""
+Script d'agrégation des statistiques de visites (tables visit_stats_*).
+Agrège les heures closes depuis le dernier passage puis les jours complets.
+
+À exécuter régulièrement (toutes les heures recommandé) via cron ou planificateur de tâches.
+La page /admin/statistiques lance aussi un rattrapage à chaque ouverture.
+
+Options :
+    --rebuild JOURS   Réagrège les N derniers jours (après une correction de données)
+"""
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from app import app, db
+from models.models import VisitorLog
+import visitor_stats
+
+
+def aggregate_stats():
+    """Agrège les visites en attente (incrémental, reprend là où le dernier passage s'est arrêté)"""
+    with app.app_context():
+        started = datetime.utcnow()
+        result = visitor_stats.aggregate_pending(
+            grace_seconds=app.config.get("STATS_AGGREGATION_GRACE", 300)
+        )
+        elapsed = (datetime.utcnow() - started).total_seconds()
+        print(f"✅ Agrégation terminée en {elapsed:.1f}s "
+              f"({result['hour_chunks']} tranche(s) horaire(s), {result['day_chunks']} tranche(s) journalière(s))")
+        print(f"📊 Heures agrégées jusqu'à : {result['hour_watermark']}")
+        print(f"📊 Jours agrégés jusqu'à   : {result['day_watermark']}")
+        if result["skipped"]:
+            print("⏳ Agrégation déjà en cours dans un autre processus : rien à faire.")
+
+
+def rebuild_stats(days):
+    """Réagrège les N derniers jours à partir des lignes brutes encore présentes"""
+    with app.app_context():
+        with visitor_stats.aggregation_lock() as claimed:
+            if not claimed:
+                print("⏳ Agrégation en cours dans un autre processus : relancer plus tard.")
+                return
+            hour_mark = visitor_stats.get_watermark("hour")
+            day_mark = visitor_stats.get_watermark("day")
+            first_visit = db.session.query(func.min(VisitorLog.visited_at)).scalar()
+            if not hour_mark:
+                print("ℹ️  Aucune agrégation existante : lancement d'une agrégation complète.")
+            elif first_visit is None:
+                print("ℹ️  Plus aucune visite brute : les rollups existants sont conservés.")
+            else:
+                # Les rollups antérieurs aux lignes brutes conservées (purge RGPD) ne peuvent
+                # pas être recalculés : seuls les buckets entièrement couverts sont remplacés
+                requested = visitor_stats.floor_day(datetime.utcnow() - timedelta(days=days))
+                hour_start = max(requested, visitor_stats.ceil_hour(first_visit))
+                day_start = max(requested, visitor_stats.ceil_day(first_visit))
+                if hour_start > requested:
+                    print(f"⚠️  Visites brutes disponibles depuis le {first_visit.strftime('%d/%m/%Y %H:%M')} "
+                          f"seulement : rollups antérieurs conservés.")
+                if hour_start < hour_mark:
+                    visitor_stats.aggregate_range("hour", hour_start, hour_mark)
+                if day_mark and day_start < day_mark:
+                    visitor_stats.aggregate_range("day", day_start, day_mark)
+                db.session.commit()
+                print(f"✅ Rollups recalculés depuis le {hour_start.strftime('%d/%m/%Y %H:%M')}")
+    aggregate_stats()
+
+if __name__ == "__main__":
+    print("📈 Agrégation des statistiques de visites...")
+    if len(sys.argv) == 3 and sys.argv[1] == "--rebuild":
+        rebuild_stats(int(sys.argv[2]))
+    else:
+        aggregate_stats()
@@ -29,7 +29,6 @@ from logging.handlers import RotatingFileHandler
 print("✓ Imports standards OK")
 
 import uuid
-import requests  # Pour l'API de géolocalisation
 
 # Import global de boto3 pour éviter NameError
 try:
@@ -61,15 +60,38 @@ from flask import (
     session,
     send_from_directory,
     current_app,
-    abort
+    abort,
+    g
 )
 
 print("✓ Flask importé")
 
 from config import Config
 from models import db
-from models.models import User, Show, PageVisit, VisitorLog
-from seo_cities import FRENCH_CITIES, get_city_by_slug, get_all_city_slugs
+from models.models import User, Show
+from seo_cities import FRENCH_CITIES, get_city_by_slug
+from visitor_tracking import VisitorTracker, VisitEvent
+from geolocation import GeoResolver
+from bot_detection import BotClassifier
+import visitor_stats
+from visitor_retention import RetentionScheduler
+from page_counters import PageCounters
+from catalogue_cache import CatalogueVersion, FacetCache, FeaturedShowsCache, install_catalogue_events
+from auth_identity import forget_user, load_current_user, remember_user
+import catalogue_search
+import catalogue_tags
+from catalogue_tags import category_filter, city_filter
+from keyset_pagination import SortKey, keyset_paginate
+from page_cache import PageCache
+from conditional_get import catalogue_validator, conditional, show_validator
+from sitemap import Sitemap
+from s3_storage import S3Storage
+from media import MediaResolver, S3ObjectProxy, csp_img_sources
+from media_store import MediaStore
+import media_refs
+from media_refs import MediaGarbageCollector
+from image_jobs import ImageJobQueue, needs_webp, remember_upload
+from image_processing import InvalidUpload, inspect_upload
 
 print("✓ Config et models importés")
 
@@ -304,7 +326,8 @@ def create_app() -> Flask:
             strict_transport_security=True,
             content_security_policy={
                 'default-src': "'self'",
-                'img-src': ["'self'", "data:"],
+                # Images servies directement par S3 / le CDN (voir media.py)
+                'img-src': ["'self'", "data:", *csp_img_sources(app.config)],
                 'style-src': ["'self'", "'unsafe-inline'"],
                 'script-src': ["'self'", "'unsafe-inline'"],
             },
@@ -316,86 +339,63 @@ def create_app() -> Flask:
     if os.environ.get("FLASK_ENV") == "production":
         app.config["SESSION_COOKIE_SECURE"] = True  # HTTPS uniquement
     
-    # Fonction de détection des robots/crawlers
-    def is_bot_visitor(user_agent: str, isp: str = None) -> bool:
-        """Détecte si un visiteur est un robot/crawler basé sur le User-Agent et l'ISP
-        
-        Retourne True si c'est un robot, False sinon.
-        """
-        if not user_agent:
-            return False
-        
-        user_agent_lower = user_agent.lower()
-        
-        # Liste des patterns de robots connus
-        bot_patterns = [
-            'bot', 'crawler', 'spider', 'scraper', 'slurp', 'mediapartners',
-            'googlebot', 'bingbot', 'yandexbot', 'baiduspider', 'facebookexternalhit',
-            'twitterbot', 'linkedinbot', 'whatsapp', 'telegrambot', 'discordbot',
-            'slackbot', 'pinterestbot', 'applebot', 'duckduckbot', 'ahrefsbot',
-            'semrushbot', 'mj12bot', 'dotbot', 'rogerbot', 'exabot', 'sogou', 
-            'archive.org', 'wget', 'curl', 'python-requests', 'java/', 'go-http',
-            'phantom', 'headless', 'selenium', 'webdriver', 'prerender'
-        ]
-        
-        # Vérifier si un pattern de bot est présent dans le User-Agent
-        for pattern in bot_patterns:
-            if pattern in user_agent_lower:
-                return True
-        
-        # ISPs connus pour héberger principalement des bots/crawlers
-        if isp:
-            isp_lower = isp.lower()
-            bot_isps = [
-                'amazon', 'aws', 'google cloud', 'microsoft corporation',
-                'tencent', 'alibaba', 'digitalocean', 'ovh', 'hetzner',
-                'linode', 'vultr', 'cloudflare', 'fastly'
-            ]
-            
-            # Si ISP datacenter ET pas de navigateur reconnu dans User-Agent
-            for bot_isp in bot_isps:
-                if bot_isp in isp_lower:
-                    # Vérifier que ce n'est pas un humain via un VPN
-                    human_browsers = ['chrome', 'firefox', 'safari', 'edge', 'opera']
-                    has_human_browser = any(browser in user_agent_lower for browser in human_browsers)
-                    
-                    # Si pas de navigateur humain reconnu, probablement un bot
-                    if not has_human_browser:
-                        return True
-        
-        return False
+    # Détection des robots/crawlers (regex compilées depuis bot_patterns.json, verdicts mémorisés)
+    bot_classifier = BotClassifier.from_app(app)
+    app.extensions["bot_classifier"] = bot_classifier
+    is_bot_visitor = bot_classifier.classify
     
-    # Fonction de géolocalisation IP (API gratuite ip-api.com)
+    # Géolocalisation IP : LRU mémoire → cache SQLite partagé → base locale / ip-api.com
+    geo_resolver = GeoResolver.from_app(app)
+    app.extensions["geo_resolver"] = geo_resolver
+
     def get_ip_geolocation(ip_address):
         """
-        Récupère les informations géographiques d'une IP via l'API ip-api.com
+        Récupère les informations géographiques d'une IP (recherche par préfixe /16 anonymisé)
         Retourne un dict avec city, region, country, isp
         """
-        try:
-            # API gratuite : 45 requêtes/minute sans clé
-            # Format : http://ip-api.com/json/{ip}?fields=city,regionName,country,isp
-            response = requests.get(
-                f"http://ip-api.com/json/{ip_address}",
-                params={"fields": "city,regionName,country,isp,status"},
-                timeout=2  # 2 secondes max
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('status') == 'success':
-                    return {
-                        'city': data.get('city', ''),
-                        'region': data.get('regionName', ''),
-                        'country': data.get('country', ''),
-                        'isp': data.get('isp', '')
-                    }
-        except Exception as e:
-            app.logger.warning(f"[GEO] Erreur géolocalisation pour {ip_address}: {e}")
-        
-        # En cas d'erreur, retourner des valeurs vides
-        return {'city': None, 'region': None, 'country': None, 'isp': None}
+        return geo_resolver.resolve(ip_address)
     
     # 6. Tracking des visiteurs (anonymisé, conforme RGPD)
+    visitor_tracker = VisitorTracker(app, geolocate=get_ip_geolocation, classify=is_bot_visitor)
+
+    # Compteurs de visites par page (incréments en mémoire, flush atomique périodique)
+    PageCounters(app)
+
+    # Client S3 partagé (un par worker, créé à la première utilisation, voir s3_storage.py)
+    app.extensions["s3_storage"] = S3Storage.from_app(app)
+    # URL directes des fichiers uploadés (CDN ou URL présignées) pour les templates
+    app.extensions["media"] = MediaResolver.from_app(app, app.extensions["s3_storage"])
+    app.extensions["media_proxy"] = S3ObjectProxy.from_app(app, app.extensions["s3_storage"])
+    app.extensions["media_store"] = MediaStore.from_app(app, app.extensions["s3_storage"])
+    # Conversion WebP des images uploadées en arrière-plan (pool de processus, voir image_jobs.py)
+    image_jobs = ImageJobQueue(app)
+    # Suppression différée des fichiers qui ne sont plus référencés (voir media_refs.py)
+    media_gc = MediaGarbageCollector(app)
+
+    @app.template_global("media_url")
+    def media_url(filename, external=False):
+        return current_app.extensions["media"].url(filename, external=external)
+
+    @app.template_global("media_img")
+    def media_img(filename, sizes="card"):
+        """Attributs src / srcset / sizes d'une image uploadée (sizes : clé de media.IMAGE_SIZES)."""
+        return current_app.extensions["media"].img_attrs(filename, sizes)
+
+    # Purge RGPD périodique de visitor_log (un seul worker à la fois, voir visitor_retention.py)
+    retention_scheduler = RetentionScheduler(app)
+
+    @app.before_request
+    def start_retention_scheduler():
+        retention_scheduler.ensure_started()
+
+    @app.before_request
+    def resume_image_jobs():
+        image_jobs.ensure_started()
+
+    @app.before_request
+    def collect_media_garbage():
+        media_gc.ensure_started()
+
     @app.before_request
     def track_visitor():
         """Enregistre chaque visite de manière anonymisée (conforme RGPD)"""
@@ -449,36 +449,21 @@ def create_app() -> Flask:
             if 'visitor_id' not in session:
                 session['visitor_id'] = str(uuid.uuid4())
             
-            # Récupérer l'utilisateur connecté (si applicable)
-            user_id = session.get('user_id')
-            
-            # Géolocaliser l'IP (ville, région, FAI)
-            geo_data = get_ip_geolocation(ip)
-            
-            # Détecter si c'est un robot/crawler
-            user_agent_str = request.headers.get('User-Agent', '')[:300]
-            is_bot = is_bot_visitor(user_agent_str, geo_data['isp'])
-            
-            # Enregistrer la visite avec géolocalisation et détection de bot
-            visitor_log = VisitorLog(
+            # Empiler la visite : géolocalisation, détection des robots et
+            # insertion en base sont faites par lots hors du cycle de la requête
+            visitor_tracker.enqueue(VisitEvent(
+                visited_at=datetime.utcnow(),
                 page_url=request.path[:300],
                 referrer=request.referrer[:300] if request.referrer else None,
-                user_agent=user_agent_str,
+                user_agent=request.headers.get('User-Agent', '')[:300],
+                ip=ip,
                 ip_anonymized=ip_anonymized,
                 session_id=session.get('visitor_id'),
-                user_id=user_id,
-                city=geo_data['city'],
-                region=geo_data['region'],
-                country=geo_data['country'],
-                isp=geo_data['isp'],
-                is_bot=is_bot
-            )
-            db.session.add(visitor_log)
-            db.session.commit()
+                user_id=session.get('user_id'),
+            ))
         except Exception as e:
             # Ne pas bloquer le site si le tracking échoue
             app.logger.warning(f"[TRACKING] Erreur lors de l'enregistrement: {e}")
-            db.session.rollback()
     
     # 7. Headers de sécurité additionnels
     @app.after_request
@@ -532,6 +517,9 @@ def create_app() -> Flask:
         db.create_all()
         _run_critical_migrations(app)
         _bootstrap_admin(app)
+        catalogue_search.init_search(app)
+        catalogue_tags.init_tags(app)
+        media_refs.init_media_refs(app)
 
     # Filtre Jinja2 pour formater les âges
     @app.template_filter('format_age')
@@ -551,22 +539,25 @@ def create_app() -> Flask:
             value += 'ans'
         return value
 
+    # Invalidation des caches du catalogue après chaque écriture sur Show / DemandeAnimation
+    install_catalogue_events(db.session)
+    featured_shows_cache = FeaturedShowsCache(app.config.get("FEATURED_SHOWS_CACHE_TTL", 300))
+    facets = FacetCache(app.config.get("FACETS_CACHE_TTL", 300))
+    app.extensions["catalogue_facets"] = facets
+
+    # Cache des pages publiques anonymes, invalidé par la version du catalogue (voir page_cache.py)
+    catalogue_version = CatalogueVersion(app.config.get("PAGE_CACHE_VERSION_CHECK_INTERVAL", 1))
+    app.extensions["catalogue_version"] = catalogue_version
+    app.extensions["page_cache"] = PageCache.from_app(app, catalogue_version)
+    app.extensions["sitemap"] = Sitemap.from_app(app)
+
     # Context processor pour les spectacles à la une (diaporama header)
     @app.context_processor
     def inject_featured_shows():
         """Injecte les spectacles à la une avec images pour le diaporama header"""
         try:
-            # Uniquement les spectacles de la catégorie "à la une"
-            featured = Show.query.filter(
-                Show.approved.is_(True),
-                Show.file_mimetype.ilike("image/%"),
-                or_(
-                    Show.category.ilike('%à la une%'),
-                    Show.category.ilike('%a la une%')
-                )
-            ).order_by(Show.created_at.desc()).all()
-            
-            return {'header_featured_shows': featured}
+            # Liste mise en cache, vidée à chaque écriture sur Show (voir catalogue_cache.py)
+            return {'header_featured_shows': featured_shows_cache.get()}
         except Exception:
             db.session.rollback()
             return {'header_featured_shows': []}
@@ -632,174 +623,76 @@ def validate_file_size(file) -> Tuple[bool, Optional[str]]:
     return True, None
 
 
-def optimize_image_to_webp(file, quality=85, max_width=1920):
+def validate_upload(file) -> Tuple[bool, Optional[str]]:
     """
-    Convertit et compresse une image en WebP.
-    
-    Args:
-        file: Fichier image uploadé (Flask FileStorage)
-        quality: Qualité WebP (0-100, défaut 85)
-        max_width: Largeur maximale en pixels (défaut 1920)
-    
-    Returns:
-        BytesIO contenant l'image WebP optimisée, ou None si erreur
+    Valide la taille puis le contenu d'un fichier : signature et en-tête de
+    l'image seulement (format, dimensions), sans décodage.
+    Retourne (True, None) si valide, (False, message d'erreur) sinon.
     """
+    is_valid, error_msg = validate_file_size(file)
+    if not is_valid or not file:
+        return is_valid, error_msg
     try:
-        from PIL import Image
-        from io import BytesIO
-        
-        # Vérifier si c'est une image
-        if not file.content_type or not file.content_type.startswith('image/'):
-            return None
-        
-        # Ignorer les PDFs
-        if file.content_type == 'application/pdf':
-            return None
-        
-        # Charger l'image
-        file.seek(0)
-        img = Image.open(file)
-        
-        # Convertir en RGB si nécessaire (WebP ne supporte pas tous les modes)
-        if img.mode in ('RGBA', 'LA', 'P'):
-            # Créer un fond blanc pour les images avec transparence
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # Redimensionner si trop large (garder proportions)
-        if img.width > max_width:
-            ratio = max_width / img.width
-            new_height = int(img.height * ratio)
-            img = img.resize((max_width, new_height), Image.Resampling.LANCZOS)
-        
-        # Sauvegarder en WebP dans un BytesIO
-        output = BytesIO()
-        img.save(output, format='WebP', quality=quality, method=6)
-        output.seek(0)
-        
-        # Log de la compression
-        original_size = file.tell() if hasattr(file, 'tell') else 0
-        optimized_size = output.getbuffer().nbytes
-        if original_size > 0:
-            reduction = ((original_size - optimized_size) / original_size) * 100
-            current_app.logger.info(f"[WebP] Image optimisée : {original_size/1024:.1f}KB → {optimized_size/1024:.1f}KB (-{reduction:.1f}%)")
-        
-        return output
-        
-    except Exception as e:
-        current_app.logger.warning(f"[WebP] Impossible d'optimiser l'image : {e}")
-        # En cas d'erreur, retourner None pour utiliser le fichier original
-        file.seek(0)
-        return None
+        inspect_upload(file.stream, current_app.config.get("IMAGE_MAX_PIXELS", 25_000_000))
+    except InvalidUpload as e:
+        current_app.logger.info(f"[UPLOAD] Fichier refusé ({file.filename}) : {e}")
+        return False, str(e)
+    return True, None
 
 
 # Utilitaire : upload d'un fichier sur S3
-def _s3_client():
-    """Crée un client S3 si configuré, sinon retourne None."""
-    s3_bucket = current_app.config.get("S3_BUCKET")
-    s3_key = current_app.config.get("S3_KEY")
-    s3_secret = current_app.config.get("S3_SECRET")
-    s3_region = current_app.config.get("S3_REGION")
-    if not (s3_bucket and s3_key and s3_secret and boto3):
-        return None
-    return boto3.client(
-        "s3",
-        region_name=s3_region,
-        aws_access_key_id=s3_key,
-        aws_secret_access_key=s3_secret,
-    )
+def _s3_storage() -> S3Storage:
+    return current_app.extensions["s3_storage"]
 
 
-def delete_file_s3(key: str) -> None:
-    """Supprime un objet S3 (best-effort)."""
-    s3_bucket = current_app.config.get("S3_BUCKET")
-    client = _s3_client()
-    if not (client and s3_bucket and key):
-        return
-    try:
-        client.delete_object(Bucket=s3_bucket, Key=key)
-        current_app.logger.info("[S3] Fichier supprimé: %s", key)
-    except Exception as e:
-        current_app.logger.warning("[S3] Suppression impossible (%s): %s", key, e)
+def _s3_client():
+    """Client S3 partagé du worker si S3 est configuré, sinon None."""
+    return _s3_storage().client()
 
 
 def upload_file_to_s3(file) -> str:
     """
-    Upload le fichier sur S3 et retourne le nom unique.
+    Upload le fichier sur S3 et retourne son nom, dérivé du contenu (voir media_refs.py).
     Fallback sur stockage local si S3 n'est pas configuré.
-    Les images sont automatiquement converties en WebP pour optimisation.
+    Les images sont enregistrées telles quelles : leur version WebP est produite
+    en arrière-plan après l'enregistrement du spectacle (voir image_jobs.py).
+    Un fichier déjà reçu n'est ni renvoyé ni reconverti : le nom retourné est
+    alors celui de son dérivé WebP s'il existe. Le type MIME à enregistrer
+    dans la fiche est donné par stored_mimetype.
     """
-    from pathlib import Path as _Path
-    
-    # Tentative d'optimisation WebP pour les images
-    optimized_file = optimize_image_to_webp(file)
-    
-    if optimized_file:
-        # Image optimisée en WebP
-        file_to_upload = optimized_file
-        ext = '.webp'
-        content_type = 'image/webp'
-        current_app.logger.info("[WebP] Upload d'une image optimisée en WebP")
+    from io import BytesIO
+
+    file.seek(0)
+    data = file.read()
+    # Type et extension d'après le contenu (signature), pas d'après le navigateur ni le nom du fichier
+    info = inspect_upload(BytesIO(data), current_app.config.get("IMAGE_MAX_PIXELS", 25_000_000))
+    content_type = info.mimetype
+    key = media_refs.content_key(data, info.format)
+
+    if needs_webp(content_type):
+        derivative = media_refs.find_derivative(key)
+        if derivative is not None:
+            media_refs.register(derivative)
+            current_app.logger.info(f"[MEDIA] Contenu déjà converti, réutilisé : {derivative}")
+            g.setdefault("upload_mimetypes", {})[derivative] = "image/webp"
+            return derivative
+    if media_refs.register(key):
+        current_app.logger.info(f"[MEDIA] Contenu déjà enregistré, réutilisé : {key}")
     else:
-        # Fichier original (PDF ou échec d'optimisation)
-        file.seek(0)
-        file_to_upload = file
-        ext = _Path(file.filename).suffix.lower()
-        content_type = file.content_type or "application/octet-stream"
-    
-    unique_name = f"{uuid.uuid4().hex}{ext}"
-    
-    # Vérifier si S3 est configuré
-    s3_bucket = current_app.config.get("S3_BUCKET")
-    s3_client = _s3_client()
+        current_app.extensions["media_store"].put(key, data, content_type)
+    if needs_webp(content_type):
+        remember_upload(key, data)
+    g.setdefault("upload_mimetypes", {})[key] = content_type
+    return key
 
-    if s3_client and s3_bucket:
-        try:
-            # Upload to S3
-            s3_client.upload_fileobj(
-                file_to_upload,
-                s3_bucket,
-                unique_name,
-                ExtraArgs={
-                    "ContentType": content_type
-                }
-            )
-            current_app.logger.info(f"[S3] Fichier uploadé avec succès: {unique_name}")
-            return unique_name
-            
-        except Exception as e:
-            current_app.logger.error(f"[S3] Erreur upload S3, fallback local: {e}")
-            # Fallback to local storage - IMPORTANT: remettre le pointeur au début
-            file_to_upload.seek(0)
-    
-    # Fallback: sauvegarde locale
-    # Remettre le pointeur au début au cas où le fichier a été lu ailleurs
-    file_to_upload.seek(0)
-    save_path = _Path(current_app.config["UPLOAD_FOLDER"]) / unique_name
-    
-    try:
-        # Vérifier que le dossier existe et le créer si nécessaire
-        save_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        # Sauvegarder selon le type (BytesIO ou FileStorage)
-        if hasattr(file_to_upload, 'save'):
-            # FileStorage original
-            file_to_upload.save(save_path.as_posix())
-        else:
-            # BytesIO (image optimisée)
-            with open(save_path, 'wb') as f:
-                f.write(file_to_upload.getvalue())
-        
-        current_app.logger.info(f"[LOCAL] Fichier sauvegardé localement: {unique_name}")
-        return unique_name
-    except Exception as e:
-        current_app.logger.error(f"[LOCAL] Erreur sauvegarde locale: {e}")
-        raise Exception(f"Impossible de sauvegarder le fichier : {e}")
+
+def stored_mimetype(name: str) -> str:
+    """
+    Type MIME de la colonne file_mimetype* pour le fichier ``name`` retourné par
+    upload_file_to_s3 : celui lu dans la signature du contenu, jamais celui
+    annoncé par le navigateur.
+    """
+    return g.get("upload_mimetypes", {})[name]
 
 
 # Alias pour rétrocompatibilité
@@ -808,10 +701,10 @@ def upload_file_local(file) -> str:
     return upload_file_to_s3(file)
 
 def current_user() -> Optional[User]:
-    username = session.get("username")
-    if not username:
-        return None
-    return User.query.filter_by(username=username).first()
+    """Utilisateur connecté, résolu une seule fois par requête (voir auth_identity.py)"""
+    if "current_user" not in g:
+        g.current_user = load_current_user()
+    return g.current_user
 
 def login_required(fn):
     from functools import wraps
@@ -898,6 +791,79 @@ def _run_critical_migrations(app: Flask) -> None:
         app.logger.warning(f"[MIGRATION] Avertissement lors de la migration: {e}")
         # Ne pas bloquer le démarrage si la colonne existe déjà
 
+    try:
+        # Migration: colonne genre_rank (tri du catalogue en base) + index composite
+        from sqlalchemy import inspect, update
+        from models.models import genre_rank_sql
+
+        columns = [col['name'] for col in inspect(db.engine).get_columns('shows')]
+        if 'genre_rank' not in columns:
+            app.logger.info("[MIGRATION] Ajout de la colonne genre_rank à shows...")
+            with db.engine.begin() as conn:
+                conn.execute(text("ALTER TABLE shows ADD COLUMN genre_rank SMALLINT NOT NULL DEFAULT 2"))
+                shows_table = Show.__table__
+                conn.execute(update(shows_table).values(genre_rank=genre_rank_sql(shows_table.c.category)))
+            app.logger.info("[MIGRATION] ✓ Colonne genre_rank ajoutée et remplie")
+
+        # Index des tris paginés (db.create_all ne les ajoute pas aux tables existantes).
+        # ix_shows_catalogue_order (3 colonnes, sans id) est remplacé par _v2 : le même nom
+        # aurait laissé l'ancien index en place avec IF NOT EXISTS
+        with db.engine.begin() as conn:
+            conn.execute(text("DROP INDEX IF EXISTS ix_shows_catalogue_order"))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_shows_catalogue_order_v2 "
+                "ON shows (genre_rank, display_order, created_at DESC, id DESC)"
+            ))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_demande_animation_created "
+                "ON demande_animation (created_at DESC, id DESC)"
+            ))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_visitor_log_visited_session "
+                "ON visitor_log (visited_at, session_id)"
+            ))
+    except Exception as e:
+        app.logger.warning(f"[MIGRATION] Avertissement lors de la migration genre_rank / index: {e}")
+
+    try:
+        # Migration: colonne updated_at (validateurs ETag / Last-Modified des fiches spectacle)
+        from sqlalchemy import inspect
+
+        columns = [col['name'] for col in inspect(db.engine).get_columns('shows')]
+        if 'updated_at' not in columns:
+            app.logger.info("[MIGRATION] Ajout de la colonne updated_at à shows...")
+            with db.engine.begin() as conn:
+                conn.execute(text("ALTER TABLE shows ADD COLUMN updated_at TIMESTAMP"))
+                conn.execute(text("UPDATE shows SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)"))
+            app.logger.info("[MIGRATION] ✓ Colonne updated_at ajoutée et remplie")
+    except Exception as e:
+        app.logger.warning(f"[MIGRATION] Avertissement lors de la migration updated_at: {e}")
+
+    try:
+        # Migration: croquis HyperLogLog des rollups, unicité des dimensions, fin des sessions horaires
+        from sqlalchemy import inspect
+
+        columns = [col['name'] for col in inspect(db.engine).get_columns('visit_stats_rollup')]
+        blob = "BYTEA" if db.engine.dialect.name == "postgresql" else "BLOB"
+        with db.engine.begin() as conn:
+            for name in ("sessions_sketch", "humans_sketch", "bots_sketch"):
+                if name not in columns:
+                    app.logger.info(f"[MIGRATION] Ajout de la colonne {name} à visit_stats_rollup...")
+                    conn.execute(text(f"ALTER TABLE visit_stats_rollup ADD COLUMN {name} {blob}"))
+            conn.execute(text("DROP TABLE IF EXISTS visit_stats_session"))
+        with db.engine.begin() as conn:
+            # Doublons laissés par des agrégations concurrentes : une seule ligne par valeur
+            conn.execute(text(
+                "DELETE FROM visit_stats_dimension WHERE id NOT IN ("
+                "SELECT MIN(id) FROM visit_stats_dimension GROUP BY granularity, bucket_start, dimension, value)"
+            ))
+            conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_visit_stats_dimension_value "
+                "ON visit_stats_dimension (granularity, bucket_start, dimension, value)"
+            ))
+    except Exception as e:
+        app.logger.warning(f"[MIGRATION] Avertissement lors de la migration visit_stats: {e}")
+
 def _bootstrap_admin(app: Flask) -> None:
     """
     Creates an admin user on first startup if the users table is empty.
@@ -952,6 +918,26 @@ def register_error_handlers(app: Flask) -> None:
 # Routes
 # -----------------------------------------------------
 def register_routes(app: Flask) -> None:
+    from models.models import DemandeAnimation as _DemandeAnimation
+
+    # ---------------------------
+    # Pagination par clé des listes publiques (voir keyset_pagination.py)
+    # ---------------------------
+    def pagination_options() -> dict:
+        return {
+            "link_pages": current_app.config.get("PAGINATION_LINK_PAGES", 5),
+            "count_cap": current_app.config.get("PAGINATION_COUNT_CAP", 1000),
+        }
+
+    demandes_keys = (
+        SortKey(_DemandeAnimation.created_at, desc=True),
+        SortKey(_DemandeAnimation.id, desc=True),
+    )
+
+    # Pages publiques mises en cache pour les visiteurs anonymes (voir page_cache.py)
+    page_cache = app.extensions["page_cache"]
+    paginated = ("page", "cursor")
+
     # ---------------------------
     # Route de test d'envoi de mail (à la fin pour éviter les erreurs)
     # ---------------------------
@@ -1114,7 +1100,7 @@ def register_routes(app: Flask) -> None:
 
             user = User.query.filter_by(username=username).first()
             if user and user.check_password(password):
-                session["username"] = user.username
+                remember_user(user)
                 flash("Connecté.", "success")
                 
                 # Sécuriser la redirection (open redirect fix)
@@ -1136,7 +1122,7 @@ def register_routes(app: Flask) -> None:
     @app.route("/logout")
     def logout():
         if session.get("username"):
-            session.pop("username", None)
+            forget_user()
             flash("Déconnecté.", "success")
         return redirect(url_for("home"))
 
@@ -1202,6 +1188,7 @@ def register_routes(app: Flask) -> None:
     # Page des événements annoncés
     # ---------------------------
     @app.route("/evenements", endpoint="evenements")
+    @page_cache.cached()
     def evenements():
         """Affiche les événements annoncés (is_event=True)"""
         try:
@@ -1224,29 +1211,26 @@ def register_routes(app: Flask) -> None:
     # ---------------------------
     # Accueil & listing (recherche)
     # ---------------------------
-    @app.route("/", endpoint="home")
-    def home():
-        """Page d'accueil avec les deux blocs hero et le compteur"""
-        # Incrémenter le compteur de visites (une seule fois par session)
+    def count_home_visit():
+        """Incrémente le compteur de l'accueil (une seule fois par session), y compris pour une page servie depuis le cache"""
+        # Incrément en mémoire, écrit en base par lots atomiques (voir page_counters.py)
         try:
-            # Vérifier si l'utilisateur a déjà été compté dans cette session
             if not session.get('home_visit_counted'):
-                visit_counter = PageVisit.query.filter_by(page_name='home').first()
-                if not visit_counter:
-                    visit_counter = PageVisit(page_name='home', visit_count=1)
-                    db.session.add(visit_counter)
-                else:
-                    visit_counter.visit_count += 1
-                    visit_counter.last_visit = datetime.utcnow()
-                db.session.commit()
+                current_app.extensions["page_counters"].increment('home')
                 # Marquer que cette session a été comptée
                 session['home_visit_counted'] = True
-            
-            # Récupérer le compteur actuel
-            visit_counter = PageVisit.query.filter_by(page_name='home').first()
-            visit_count = visit_counter.visit_count if visit_counter else 0
         except Exception as e:
             print(f"Erreur lors de l'incrémentation du compteur: {e}")
+
+    @app.route("/", endpoint="home")
+    @page_cache.cached(before=count_home_visit)
+    def home():
+        """Page d'accueil avec les deux blocs hero et le compteur"""
+        # Compteur affiché : valeur figée pendant la durée de vie de la page en cache
+        try:
+            visit_count = current_app.extensions["page_counters"].get('home')
+        except Exception as e:
+            print(f"Erreur lors de la lecture du compteur: {e}")
             visit_count = 0
         
         # Récupérer les spectacles "à la une" pour les afficher
@@ -1270,6 +1254,8 @@ def register_routes(app: Flask) -> None:
         )
 
     @app.route("/catalogue", endpoint="catalogue")
+    @conditional(catalogue_validator)
+    @page_cache.cached(allowed_args=paginated)
     def catalogue():
         """Page catalogue avec les cartes des spectacles"""
         q = request.args.get("q", "", type=str).strip()
@@ -1291,61 +1277,17 @@ def register_routes(app: Flask) -> None:
         # Note: Le filtre is_event a été temporairement désactivé
         # Les événements apparaîtront aussi sur la page d'accueil
 
-        # Recherche texte + âges (6, 6 ans, 6-10, 6/10, 6 à 10, etc.)
+        # Recherche plein texte + âges (6, 6 ans, 6-10, 6/10, 6 à 10, etc.) : voir catalogue_search.py
+        relevance = None
         if q:
-            like = f"%{q}%"
-
-            variants = {q}
-            if any(c.isdigit() for c in q):
-                cleaned = q.lower().replace("ans", "").strip()
-                seps = [" - ", "-", "—", "–", "à", "a", "/", " "]
-                norm = cleaned
-                for sep in seps:
-                    norm = norm.replace(sep, "/")
-
-                variants.update({
-                    cleaned,
-                    cleaned.replace(" ", ""),
-                    cleaned.replace("-", "/"),
-                    cleaned.replace("/", "-"),
-                    cleaned.replace(" ", "-"),
-                    cleaned.replace(" ", "/"),
-                    norm,
-                    norm.replace("/", "-"),
-                    norm.replace("/", ""),
-                })
-
-            conditions = [
-                Show.title.ilike(like),
-                Show.description.ilike(like),
-                Show.location.ilike(like),
-                Show.category.ilike(like),
-            ]
-
-            # Facultatif si le champ existe
-            try:
-                Show.contact_email  # type: ignore[attr-defined]
-                conditions.append(Show.contact_email.ilike(like))  # type: ignore[attr-defined]
-            except Exception:
-                pass
-
-            for v in {v for v in variants if v}:
-                v_like = f"%{v}%"
-                try:
-                    conditions.append(Show.age_range.ilike(v_like))
-                except Exception:
-                    pass
-                conditions.append(Show.description.ilike(v_like))
-
-            shows = shows.filter(or_(*conditions))
+            shows, relevance = catalogue_search.apply_search(shows, q)
 
         # Filtres simples
+        # (étiquettes normalisées + index, voir catalogue_tags.py)
         if category:
-            from sqlalchemy import func
-            shows = shows.filter(func.lower(Show.category).like(f"%{category.lower()}%"))
+            shows = shows.filter(category_filter(category))
         if location:
-            like = f"%{location}%"
-            shows = shows.filter(or_(Show.location.ilike(like), Show.region.ilike(like)))
+            shows = shows.filter(or_(city_filter(location), Show.region.ilike(f"%{location}%")))
 
         # Type de fichier
         if type_filter == "image":
@@ -1369,12 +1311,23 @@ def register_routes(app: Flask) -> None:
             if d2:
                 shows = shows.filter(Show.date <= d2)
 
-        # Tri : par display_order d'abord (plus petit = plus haut), puis par date de création
-        shows = shows.order_by(Show.display_order.asc(), Show.created_at.desc())
+        # Tri en base (index ix_shows_catalogue_order_v2) : à la une, enfant, autres, atelier (genre_rank),
+        # puis display_order (plus petit = plus haut), puis date de création ; pertinence d'abord si recherche
+        catalogue_keys = (
+            SortKey(Show.genre_rank),
+            SortKey(Show.display_order),
+            SortKey(Show.created_at, desc=True),
+            SortKey(Show.id, desc=True),
+        )
 
-        # Pagination : 16 résultats par page
+        # Pagination par clé : 16 résultats par page (?page=N puis ?cursor=..., voir keyset_pagination.py)
         try:
-            pagination = shows.paginate(page=page, per_page=16, error_out=False)
+            pagination = keyset_paginate(
+                shows, catalogue_keys, per_page=16, page=page,
+                cursor=request.args.get("cursor"),
+                order_prefix=[relevance] if relevance is not None else None,
+                **pagination_options(),
+            )
             shows_list = pagination.items
         except Exception as e:
             db.session.rollback()
@@ -1383,13 +1336,15 @@ def register_routes(app: Flask) -> None:
             pagination = None
             shows_list = []
 
+        # Facettes (spectacles validés) servies depuis le cache, avec leurs effectifs
+        facets = current_app.extensions["catalogue_facets"]
         try:
-            categories = [c[0] for c in db.session.query(Show.category).distinct().all() if c[0]]
-            locations = [l[0] for l in db.session.query(Show.location).distinct().all() if l[0]]
+            category_facets = facets.get("show_category")
+            location_facets = facets.get("show_location")
         except Exception:
             db.session.rollback()
-            categories = []
-            locations = []
+            category_facets = []
+            location_facets = []
 
         # Générer un H1 SEO dynamique selon les filtres
         h1_title = "Spectacles et animations pour mairies, écoles et CSE partout en France"
@@ -1400,29 +1355,17 @@ def register_routes(app: Flask) -> None:
         elif location:
             h1_title = f"Spectacles et animations à {location} - Artistes professionnels"
 
-        # Tri personnalisé : Spectacle enfant d'abord, Atelier en dernier, autres entre les deux
-
-        def genre_order(show):
-            cat = (show.category or '').strip().lower()
-            if 'à la une' in cat or 'a la une' in cat or 'une' in cat:
-                return 0
-            elif 'enfant' in cat:
-                return 1
-            elif 'atelier' in cat:
-                return 3
-            else:
-                return 2
-        shows_list_sorted = sorted(shows_list, key=genre_order)
-
         return render_template(
             "catalogue.html",
-            shows=shows_list_sorted,
+            shows=shows_list,
             pagination=pagination,
             q=q,
             category=category,
             location=location,
-            categories=sorted(categories),
-            locations=sorted(locations),
+            categories=[f.value for f in category_facets],
+            locations=[f.value for f in location_facets],
+            category_facets=category_facets,
+            location_facets=location_facets,
             type_filter=type_filter,
             sort=sort,
             date_from=date_from,
@@ -1444,90 +1387,17 @@ def register_routes(app: Flask) -> None:
         return redirect(url_for("static", filename="img/favicon.svg"))
 
     @app.route("/sitemap.xml")
+    @conditional(catalogue_validator)
     def sitemap_xml():
-        """Génère dynamiquement un sitemap XML"""
-        from flask import make_response
-        
-        pages = []
-        # Page d'accueil
-        pages.append({
-            'loc': url_for('home', _external=True),
-            'lastmod': datetime.utcnow().strftime('%Y-%m-%d'),
-            'changefreq': 'daily',
-            'priority': '1.0'
-        })
-        
-        # Page demande d'animation
-        pages.append({
-            'loc': url_for('demande_animation', _external=True),
-            'changefreq': 'monthly',
-            'priority': '0.8'
-        })
-        
-        # Pages thématiques SEO (haute priorité)
-        seo_pages = [
-            ('spectacles_enfants', '0.9'),
-            ('animations_enfants', '0.9'),
-            ('spectacles_noel', '0.85'),
-            ('animations_entreprises', '0.9'),
-            ('marionnettes', '0.85'),
-            ('magiciens', '0.85'),
-            ('clowns', '0.85'),
-            ('animations_anniversaire', '0.85'),
-            ('booker_artiste', '0.8'),
-            ('demandes_animation', '0.8'),
-        ]
-        
-        for endpoint, priority in seo_pages:
-            try:
-                pages.append({
-                    'loc': url_for(endpoint, _external=True),
-                    'changefreq': 'weekly',
-                    'priority': priority
-                })
-            except Exception:
-                pass  # Si la route n'existe pas, on ignore
-        
-        # Pages SEO des villes françaises
-        try:
-            for city_slug in get_all_city_slugs():
-                pages.append({
-                    'loc': url_for('city_spectacles', city_slug=city_slug, _external=True),
-                    'changefreq': 'weekly',
-                    'priority': '0.8'
-                })
-        except Exception:
-            pass  # Si la fonction n'est pas encore disponible, on ignore
-        
-        # Tous les spectacles approuvés
-        shows = Show.query.filter(Show.approved.is_(True)).all()
-        for show in shows:
-            pages.append({
-                'loc': url_for('show_detail', show_id=show.id, _external=True),
-                'lastmod': show.created_at.strftime('%Y-%m-%d') if show.created_at else datetime.utcnow().strftime('%Y-%m-%d'),
-                'changefreq': 'weekly',
-                'priority': '0.7'
-            })
-        
-        # Générer le XML
-        sitemap_xml = '<?xml version="1.0" encoding="UTF-8"?>\n'
-        sitemap_xml += '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
-        
-        for page in pages:
-            sitemap_xml += '  <url>\n'
-            sitemap_xml += f'    <loc>{page["loc"]}</loc>\n'
-            if 'lastmod' in page:
-                sitemap_xml += f'    <lastmod>{page["lastmod"]}</lastmod>\n'
-            if 'changefreq' in page:
-                sitemap_xml += f'    <changefreq>{page["changefreq"]}</changefreq>\n'
-            if 'priority' in page:
-                sitemap_xml += f'    <priority>{page["priority"]}</priority>\n'
-            sitemap_xml += '  </url>\n'
-        
-        sitemap_xml += '</urlset>'
-        
-        response = make_response(sitemap_xml)
-        response.headers["Content-Type"] = "application/xml"
+        """Sitemap XML (urlset, ou index des fichiers par section au-delà de 50 000 URL, voir sitemap.py)"""
+        return current_app.extensions["sitemap"].root_response()
+
+    @app.route("/sitemap-<section>-<int:page>.xml", endpoint="sitemap_section")
+    @conditional(catalogue_validator)
+    def sitemap_section(section: str, page: int):
+        response = current_app.extensions["sitemap"].section_response(section, page)
+        if response is None:
+            abort(404)
         return response
 
     # ---------------------------
@@ -1569,6 +1439,26 @@ def register_routes(app: Flask) -> None:
         status_code = 200 if db_status == "ok" else 503
         return jsonify(status), status_code
 
+    @app.route("/health/tracking")
+    def tracking_health_check():
+        """Compteurs du pipeline de tracking (profondeur de file, pertes, latence des flushs, cache géo)"""
+        from flask import jsonify
+
+        tracker = current_app.extensions.get("visitor_tracker")
+        if not tracker:
+            return jsonify({"status": "disabled"}), 200
+
+        stats = tracker.stats()
+        stats["status"] = "ok" if stats["failed"] == 0 else "degraded"
+        stats["pid"] = os.getpid()
+        geo_resolver = current_app.extensions.get("geo_resolver")
+        if geo_resolver:
+            stats["geolocation"] = geo_resolver.stats()
+        bot_classifier = current_app.extensions.get("bot_classifier")
+        if bot_classifier:
+            stats["bot_detection"] = bot_classifier.stats()
+        return jsonify(stats), 200
+
     @app.route("/health/s3")
     def s3_health_check():
         """Endpoint pour vérifier la connectivité S3"""
@@ -1595,20 +1485,17 @@ def register_routes(app: Flask) -> None:
         
         try:
             import botocore
-            s3_client = boto3.client(
-                "s3",
-                region_name=s3_region,
-                aws_access_key_id=s3_key,
-                aws_secret_access_key=s3_secret
-            )
+            storage = _s3_storage()
             # Test: list bucket (requires s3:ListBucket permission)
-            s3_client.head_bucket(Bucket=s3_bucket)
+            with storage.timed("head_bucket"):
+                storage.client().head_bucket(Bucket=s3_bucket)
             
             return jsonify({
                 "status": "ok",
                 "bucket": s3_bucket,
                 "region": s3_region,
-                "message": "S3 connection successful"
+                "message": "S3 connection successful",
+                "client": storage.stats(),
             }), 200
             
         except botocore.exceptions.ClientError as e:
@@ -1672,8 +1559,8 @@ def register_routes(app: Flask) -> None:
                     flash("Type de fichier non autorisé (png/jpg/jpeg/gif/webp/pdf).", "danger")
                     return redirect(request.url)
 
-                # Vérifier la taille du fichier
-                is_valid, error_msg = validate_file_size(file)
+                # Vérifier la taille et le contenu du fichier (en-tête seulement)
+                is_valid, error_msg = validate_upload(file)
                 if not is_valid:
                     flash(error_msg, "danger")
                     return redirect(request.url)
@@ -1681,7 +1568,7 @@ def register_routes(app: Flask) -> None:
                 # Sauvegarde locale du fichier
                 try:
                     file_name = upload_file_local(file)
-                    file_mimetype = file.mimetype
+                    file_mimetype = stored_mimetype(file_name)
                 except Exception as e:
                     current_app.logger.error(f"Erreur upload fichier principal: {e}")
                     flash("Erreur lors de l'enregistrement du fichier. Veuillez réessayer.", "danger")
@@ -1694,7 +1581,7 @@ def register_routes(app: Flask) -> None:
                 if not allowed_file(file2.filename):
                     flash("Photo 2 : Type de fichier non autorisé.", "danger")
                     return redirect(request.url)
-                is_valid2, error_msg2 = validate_file_size(file2)
+                is_valid2, error_msg2 = validate_upload(file2)
                 if not is_valid2:
                     flash(f"Photo 2 : {error_msg2}", "danger")
                     return redirect(request.url)
@@ -1712,7 +1599,7 @@ def register_routes(app: Flask) -> None:
                 if not allowed_file(file3.filename):
                     flash("Photo 3 : Type de fichier non autorisé.", "danger")
                     return redirect(request.url)
-                is_valid3, error_msg3 = validate_file_size(file3)
+                is_valid3, error_msg3 = validate_upload(file3)
                 if not is_valid3:
                     flash(f"Photo 3 : {error_msg3}", "danger")
                     return redirect(request.url)
@@ -1745,6 +1632,7 @@ def register_routes(app: Flask) -> None:
             )
             db.session.add(show)
             db.session.commit()
+            current_app.extensions["image_jobs"].enqueue_uploads(show)
 
             if getattr(current_app, "mail", None) and current_app.config.get("MAIL_USERNAME") and current_app.config.get("MAIL_PASSWORD"):
                 try:
@@ -1789,40 +1677,32 @@ def register_routes(app: Flask) -> None:
 
     @app.route("/uploads/<path:filename>")
     def uploaded_file(filename):
-        from flask import abort, Response
-        import mimetypes
+        from flask import abort
         
         # Tente d'abord de servir le fichier localement (pour compatibilité)
         local_path = Path(current_app.config["UPLOAD_FOLDER"]) / filename
         if local_path.exists():
             return send_from_directory(current_app.config["UPLOAD_FOLDER"], filename, as_attachment=False)
         
-        # Sinon, tente de servir depuis S3
+        # Fichier sur S3 : redirection vers l'URL directe (CDN ou présignée, voir media.py),
+        # le worker ne relaie les octets qu'en mode proxy (MEDIA_URL_MODE=proxy)
+        media = current_app.extensions["media"]
+        if media.direct:
+            response = redirect(media.url(filename), code=302)
+            response.headers["Cache-Control"] = f"public, max-age={media.redirect_max_age()}"
+            return response
+
         s3_bucket = current_app.config.get("S3_BUCKET")
-        s3_key = current_app.config.get("S3_KEY")
-        s3_secret = current_app.config.get("S3_SECRET")
-        s3_region = current_app.config.get("S3_REGION")
+        s3_client = _s3_client()
         
-        if not (s3_bucket and s3_key and s3_secret and boto3):
+        if not (s3_bucket and s3_client):
             current_app.logger.warning(f"[UPLOADS] Fichier non trouvé localement et S3 non configuré: {filename}")
             abort(404)
         
         try:
             import botocore
-            s3_client = boto3.client(
-                "s3",
-                region_name=s3_region,
-                aws_access_key_id=s3_key,
-                aws_secret_access_key=s3_secret
-            )
-            s3_response = s3_client.get_object(Bucket=s3_bucket, Key=filename)
-            file_data = s3_response["Body"].read()
-            content_type = s3_response.get("ContentType") or mimetypes.guess_type(filename)[0] or "application/octet-stream"
-            
-            # Add cache headers for better performance
-            response = Response(file_data, mimetype=content_type)
-            response.headers["Cache-Control"] = "public, max-age=31536000"  # 1 year cache
-            return response
+            # Relais en flux : 304 / plages d'octets / en-têtes de l'objet (voir media.S3ObjectProxy)
+            response = current_app.extensions["media_proxy"].response(filename)
             
         except botocore.exceptions.ClientError as e:
             current_app.logger.error(f"[S3] Erreur lecture fichier {filename}: {e}")
@@ -1830,8 +1710,12 @@ def register_routes(app: Flask) -> None:
         except Exception as e:
             current_app.logger.error(f"[S3] Erreur inattendue pour {filename}: {e}")
             abort(404)
+        if response is None:
+            abort(404)
+        return response
 
     @app.route("/show/<int:show_id>")
+    @conditional(show_validator)
     def show_detail(show_id: int):
         show = Show.query.get_or_404(show_id)
         # Seuls les spectacles approuvés sont visibles (sauf pour les admins)
@@ -1845,7 +1729,7 @@ def register_routes(app: Flask) -> None:
         # Récupérer les spectacles "à la une" pour les afficher en dessous
         spectacles_une = Show.query.filter(
             Show.approved.is_(True),
-            Show.category.ilike('%Spectacle à la une%'),
+            category_filter('Spectacle à la une'),
             Show.id != show_id  # Exclure le spectacle actuel
         ).order_by(Show.created_at.desc()).limit(8).all()
         
@@ -1899,27 +1783,18 @@ def register_routes(app: Flask) -> None:
                     flash("Type de fichier non autorisé (png/jpg/jpeg/gif/webp/pdf).", "danger")
                     return redirect(request.url)
                 
-                # Vérifier la taille du fichier
-                is_valid, error_msg = validate_file_size(file)
+                # Vérifier la taille et le contenu du fichier (en-tête seulement)
+                is_valid, error_msg = validate_upload(file)
                 if not is_valid:
                     flash(error_msg, "danger")
                     return redirect(request.url)
 
-                # Supprimer l'ancien fichier (best-effort)
-                if s.file_name:
-                    delete_file_s3(s.file_name)
-                    try:
-                        old_local = Path(current_app.config["UPLOAD_FOLDER"]) / s.file_name
-                        if old_local.exists():
-                            old_local.unlink()
-                    except Exception:
-                        pass
-
+                # L'ancien fichier est libéré au COMMIT (suppression différée, voir media_refs.py)
                 # Upload S3 (fallback local si S3 non configuré)
                 try:
                     new_name = upload_file_local(file)
                     s.file_name = new_name
-                    s.file_mimetype = file.mimetype
+                    s.file_mimetype = stored_mimetype(new_name)
                 except Exception as e:
                     current_app.logger.error(f"Erreur upload fichier principal: {e}")
                     flash("Erreur lors de l'enregistrement du fichier. Veuillez réessayer.", "danger")
@@ -1931,21 +1806,13 @@ def register_routes(app: Flask) -> None:
                 if not allowed_file(file2.filename):
                     flash("Photo 2 : Type de fichier non autorisé.", "danger")
                     return redirect(request.url)
-                is_valid, error_msg = validate_file_size(file2)
+                is_valid, error_msg = validate_upload(file2)
                 if not is_valid:
                     flash(f"Photo 2 : {error_msg}", "danger")
                     return redirect(request.url)
-                if s.file_name2:
-                    delete_file_s3(s.file_name2)
-                    try:
-                        old_local = Path(current_app.config["UPLOAD_FOLDER"]) / s.file_name2
-                        if old_local.exists():
-                            old_local.unlink()
-                    except Exception:
-                        pass
                 try:
                     s.file_name2 = upload_file_local(file2)
-                    s.file_mimetype2 = file2.mimetype
+                    s.file_mimetype2 = stored_mimetype(s.file_name2)
                 except Exception as e:
                     current_app.logger.error(f"Erreur upload photo 2: {e}")
                     flash("Erreur lors de l'enregistrement de la photo 2. Veuillez réessayer.", "danger")
@@ -1957,27 +1824,20 @@ def register_routes(app: Flask) -> None:
                 if not allowed_file(file3.filename):
                     flash("Photo 3 : Type de fichier non autorisé.", "danger")
                     return redirect(request.url)
-                is_valid, error_msg = validate_file_size(file3)
+                is_valid, error_msg = validate_upload(file3)
                 if not is_valid:
                     flash(f"Photo 3 : {error_msg}", "danger")
                     return redirect(request.url)
-                if s.file_name3:
-                    delete_file_s3(s.file_name3)
-                    try:
-                        old_local = Path(current_app.config["UPLOAD_FOLDER"]) / s.file_name3
-                        if old_local.exists():
-                            old_local.unlink()
-                    except Exception:
-                        pass
                 try:
                     s.file_name3 = upload_file_local(file3)
-                    s.file_mimetype3 = file3.mimetype
+                    s.file_mimetype3 = stored_mimetype(s.file_name3)
                 except Exception as e:
                     current_app.logger.error(f"Erreur upload photo 3: {e}")
                     flash("Erreur lors de l'enregistrement de la photo 3. Veuillez réessayer.", "danger")
                     return redirect(request.url)
 
             db.session.commit()
+            current_app.extensions["image_jobs"].enqueue_uploads(s)
             flash("Spectacle mis à jour.", "success")
             return render_template("flash_only_child.html", user=u)
 
@@ -1993,17 +1853,7 @@ def register_routes(app: Flask) -> None:
             flash("Accès refusé.", "danger")
             return redirect(url_for("company_dashboard"))
 
-        # Supprimer tous les fichiers (photo 1, 2 et 3)
-        for fname in [s.file_name, s.file_name2, s.file_name3]:
-            if fname:
-                delete_file_s3(fname)
-                p = Path(current_app.config["UPLOAD_FOLDER"]) / fname
-                if p.exists():
-                    try:
-                        p.unlink()
-                    except Exception:
-                        pass
-
+        # Fichiers libérés au COMMIT, supprimés plus tard s'ils ne servent plus (voir media_refs.py)
         db.session.delete(s)
         db.session.commit()
         flash("Spectacle supprimé.", "success")
@@ -2040,7 +1890,6 @@ def register_routes(app: Flask) -> None:
     @admin_required
     def admin_statistics():
         """Page de statistiques des visiteurs (conforme RGPD - données anonymisées)"""
-        from sqlalchemy import func, desc, text
         from sqlalchemy.exc import ProgrammingError
         from datetime import timedelta
         
@@ -2058,184 +1907,59 @@ def register_routes(app: Flask) -> None:
             date_limit = datetime.utcnow() - timedelta(days=days)
             period_label = f"{days} dernier{'s' if days > 1 else ''} jour{'s' if days > 1 else ''}"
         
-        # Nombre total de visites sur la période
-        total_visits = VisitorLog.query.filter(VisitorLog.visited_at >= date_limit).count()
-        
-        # Séparation robots vs humains
-        total_bots = VisitorLog.query.filter(
-            VisitorLog.visited_at >= date_limit,
-            VisitorLog.is_bot == True
-        ).count()
-        
-        total_humans = VisitorLog.query.filter(
-            VisitorLog.visited_at >= date_limit,
-            VisitorLog.is_bot == False
-        ).count()
-        
-        # Visiteurs uniques (basé sur session_id)
-        unique_visitors = db.session.query(func.count(func.distinct(VisitorLog.session_id))).\
-            filter(VisitorLog.visited_at >= date_limit).scalar()
-        
-        # Visiteurs uniques humains (non-bots)
-        unique_humans = db.session.query(func.count(func.distinct(VisitorLog.session_id))).\
-            filter(
-                VisitorLog.visited_at >= date_limit,
-                VisitorLog.is_bot == False
-            ).scalar()
-        
-        # Visiteurs uniques robots
-        unique_bots = db.session.query(func.count(func.distinct(VisitorLog.session_id))).\
-            filter(
-                VisitorLog.visited_at >= date_limit,
-                VisitorLog.is_bot == True
-            ).scalar()
-        
-        # Pages les plus visitées
-        top_pages = db.session.query(
-            VisitorLog.page_url,
-            func.count(VisitorLog.id).label('visits')
-        ).filter(VisitorLog.visited_at >= date_limit).\
-            group_by(VisitorLog.page_url).\
-            order_by(desc('visits')).\
-            limit(10).all()
-        
-        # Référents (d'où viennent les visiteurs)
-        top_referrers = db.session.query(
-            VisitorLog.referrer,
-            func.count(VisitorLog.id).label('visits')
-        ).filter(
-            VisitorLog.visited_at >= date_limit,
-            VisitorLog.referrer.isnot(None)
-        ).group_by(VisitorLog.referrer).\
-            order_by(desc('visits')).\
-            limit(10).all()
-        
-        # Visites par jour/heure (selon lapériode) - HUMAINS UNIQUEMENT pour le graphique
-        if period in ['today', '1']:
-            # Pour 24h : regrouper par heure
-            # Détection du type de base de données
-            db_uri = app.config.get('SQLALCHEMY_DATABASE_URI', '')
-            is_postgres = 'postgresql' in db_uri
-            
-            if is_postgres:
-                # PostgreSQL : utiliser DATE_TRUNC
-                visits_by_day = db.session.query(
-                    func.date_trunc('hour', VisitorLog.visited_at).label('date'),
-                    func.count(VisitorLog.id).label('visits')
-                ).filter(
-                    VisitorLog.visited_at >= date_limit,
-                    VisitorLog.is_bot == False  # HUMAINS UNIQUEMENT
-                ).group_by(func.date_trunc('hour', VisitorLog.visited_at)).\
-                    order_by(func.date_trunc('hour', VisitorLog.visited_at)).all()
-                
-                # Visiteurs uniques par heure (pour le graphique) - HUMAINS UNIQUEMENT
-                visitors_by_day = db.session.query(
-                    func.date_trunc('hour', VisitorLog.visited_at).label('date'),
-                    func.count(func.distinct(VisitorLog.session_id)).label('visitors')
-                ).filter(
-                    VisitorLog.visited_at >= date_limit,
-                    VisitorLog.is_bot == False  # HUMAINS UNIQUEMENT
-                ).group_by(func.date_trunc('hour', VisitorLog.visited_at)).\
-                    order_by(func.date_trunc('hour', VisitorLog.visited_at)).all()
-            else:
-                # SQLite : utiliser strftime
-                visits_by_day = db.session.query(
-                    func.strftime('%Y-%m-%d %H:00:00', VisitorLog.visited_at).label('date'),
-                    func.count(VisitorLog.id).label('visits')
-                ).filter(
-                    VisitorLog.visited_at >= date_limit,
-                    VisitorLog.is_bot == False  # HUMAINS UNIQUEMENT
-                ).group_by(func.strftime('%Y-%m-%d %H:00:00', VisitorLog.visited_at)).\
-                    order_by(func.strftime('%Y-%m-%d %H:00:00', VisitorLog.visited_at)).all()
-                
-                # Visiteurs uniques par heure (pour le graphique) - HUMAINS UNIQUEMENT
-                visitors_by_day = db.session.query(
-                    func.strftime('%Y-%m-%d %H:00:00', VisitorLog.visited_at).label('date'),
-                    func.count(func.distinct(VisitorLog.session_id)).label('visitors')
-                ).filter(
-                    VisitorLog.visited_at >= date_limit,
-                    VisitorLog.is_bot == False  # HUMAINS UNIQUEMENT
-                ).group_by(func.strftime('%Y-%m-%d %H:00:00', VisitorLog.visited_at)).\
-                    order_by(func.strftime('%Y-%m-%d %H:00:00', VisitorLog.visited_at)).all()
-        else:
-            # Pour les autres périodes : regrouper par jour - HUMAINS UNIQUEMENT
-            visits_by_day = db.session.query(
-                func.date(VisitorLog.visited_at).label('date'),
-                func.count(VisitorLog.id).label('visits')
-            ).filter(
-                VisitorLog.visited_at >= date_limit,
-                VisitorLog.is_bot == False  # HUMAINS UNIQUEMENT
-            ).group_by(func.date(VisitorLog.visited_at)).\
-                order_by('date').all()
-            
-            # Visiteurs uniques par jour (pour le graphique) - HUMAINS UNIQUEMENT
-            visitors_by_day = db.session.query(
-                func.date(VisitorLog.visited_at).label('date'),
-                func.count(func.distinct(VisitorLog.session_id)).label('visitors')
-            ).filter(
-                VisitorLog.visited_at >= date_limit,
-                VisitorLog.is_bot == False  # HUMAINS UNIQUEMENT
-            ).group_by(func.date(VisitorLog.visited_at)).\
-                order_by('date').all()
+        is_hourly = period in ['today', '1']
+        bucket = "hour" if is_hourly else "day"
         
-        # Derniers visiteurs uniques (groupés par session)
-        # Chaque ligne = 1 visiteur avec le nombre de pages vues
-        recent_visitors = db.session.query(
-            VisitorLog.session_id,
-            func.min(VisitorLog.visited_at).label('first_visit'),
-            func.max(VisitorLog.visited_at).label('last_visit'),
-            func.count(VisitorLog.id).label('page_count'),
-            VisitorLog.city,
-            VisitorLog.region,
-            VisitorLog.country,
-            VisitorLog.isp,
-            VisitorLog.ip_anonymized,
-            VisitorLog.user_agent,
-            VisitorLog.user_id,
-            func.max(VisitorLog.is_bot).label('is_bot')  # max() compatible SQLite et PostgreSQL
-        ).filter(VisitorLog.visited_at >= date_limit).\
-            group_by(
-                VisitorLog.session_id,
-                VisitorLog.city,
-                VisitorLog.region,
-                VisitorLog.country,
-                VisitorLog.isp,
-                VisitorLog.ip_anonymized,
-                VisitorLog.user_agent,
-                VisitorLog.user_id
-            ).\
-            order_by(desc('first_visit')).\
-            limit(50).all()
+        def build_statistics():
+            # Rattrapage des rollups (heures closes depuis le dernier passage, rapide si à jour)
+            try:
+                visitor_stats.aggregate_pending(grace_seconds=app.config.get("STATS_AGGREGATION_GRACE", 300))
+            except Exception as e:
+                db.session.rollback()
+                app.logger.warning(f"[STATS] Agrégation incrémentale impossible: {e}")
+            
+            # Rollups pour les périodes closes + un seul passage groupé sur les lignes brutes récentes.
+            # Derniers visiteurs : lignes brutes des STATS_RECENT_VISITORS_HOURS dernières heures
+            recent_since = datetime.utcnow() - timedelta(hours=app.config.get("STATS_RECENT_VISITORS_HOURS", 24))
+            report = visitor_stats.period_report(date_limit, bucket, recent_since)
+            counters = report["counters"]
+            
+            return dict(
+                total_visits=counters.visits,
+                total_bots=counters.bot_visits,
+                total_humans=counters.human_visits,
+                # Visiteurs uniques (sessions distinctes sur toute la période, voir visitor_stats.py)
+                unique_visitors=counters.unique_sessions,
+                unique_humans=counters.unique_humans,
+                unique_bots=counters.unique_bots,
+                top_pages=report["top_pages"],
+                top_referrers=report["top_referrers"],
+                top_cities=report["top_cities"],
+                top_regions=report["top_regions"],
+                # Visites et visiteurs uniques par heure (24h) ou par jour - HUMAINS UNIQUEMENT
+                visits_by_day=report["series"],
+                visitors_by_day=report["series"],
+                recent_visitors=report["recent_visitors"],
+                active_users=report["active_users"],
+            )
         
-        # Utilisateurs connectés actifs
-        active_users = db.session.query(
-            User.username,
-            func.count(VisitorLog.id).label('visits')
-        ).join(VisitorLog, VisitorLog.user_id == User.id).\
-            filter(VisitorLog.visited_at >= date_limit).\
-            group_by(User.username).\
-            order_by(desc('visits')).\
-            limit(10).all()
+        # Résultat mis en cache par (période, granularité) : les rafraîchissements ne relisent pas la table
+        cache_key = ("admin_statistics", period, bucket)
+        statistics = visitor_stats.cached(
+            cache_key,
+            app.config.get("STATS_CACHE_TTL", 60),
+            build_statistics,
+            refresh=bool(request.args.get("refresh")),
+        )
         
         return render_template(
             "admin_statistics.html",
             user=current_user(),
-            total_visits=total_visits,
-            total_bots=total_bots,
-            total_humans=total_humans,
-            unique_visitors=unique_visitors,
-            unique_humans=unique_humans,
-            unique_bots=unique_bots,
-            top_pages=top_pages,
-            top_referrers=top_referrers,
-            visits_by_day=visits_by_day,
-            visitors_by_day=visitors_by_day,
-            recent_visitors=recent_visitors,
-            active_users=active_users,
             days=days,
             period=period,
             period_label=period_label,
-            is_hourly=(period in ['today', '1'])
+            is_hourly=is_hourly,
+            **statistics
         )
     
     # Route temporaire pour migration is_bot (À SUPPRIMER après exécution)
@@ -2545,8 +2269,8 @@ def register_routes(app: Flask) -> None:
                     flash("Type de fichier non autorisé (png/jpg/jpeg/gif/webp/pdf).", "danger")
                     return redirect(request.url)
 
-                # Vérifier la taille du fichier
-                is_valid, error_msg = validate_file_size(file)
+                # Vérifier la taille et le contenu du fichier (en-tête seulement)
+                is_valid, error_msg = validate_upload(file)
                 if not is_valid:
                     flash(error_msg, "danger")
                     return redirect(request.url)
@@ -2554,7 +2278,7 @@ def register_routes(app: Flask) -> None:
                 # 🔥 Envoi sur S3 au lieu du disque local
                 try:
                     file_name = upload_file_local(file)
-                    file_mimetype = file.mimetype
+                    file_mimetype = stored_mimetype(file_name)
                 except Exception as e:
                     current_app.logger.error(f"Erreur upload fichier principal: {e}")
                     flash("Erreur lors de l'enregistrement du fichier. Veuillez réessayer.", "danger")
@@ -2569,13 +2293,13 @@ def register_routes(app: Flask) -> None:
                 if not allowed_file(file2.filename):
                     flash("Photo 2 : Type de fichier non autorisé.", "danger")
                     return redirect(request.url)
-                is_valid, error_msg = validate_file_size(file2)
+                is_valid, error_msg = validate_upload(file2)
                 if not is_valid:
                     flash(f"Photo 2 : {error_msg}", "danger")
                     return redirect(request.url)
                 try:
                     file_name2 = upload_file_local(file2)
-                    file_mimetype2 = file2.mimetype
+                    file_mimetype2 = stored_mimetype(file_name2)
                 except Exception as e:
                     current_app.logger.error(f"Erreur upload photo 2: {e}")
                     flash("Erreur lors de l'enregistrement de la photo 2. Veuillez réessayer.", "danger")
@@ -2589,13 +2313,13 @@ def register_routes(app: Flask) -> None:
                 if not allowed_file(file3.filename):
                     flash("Photo 3 : Type de fichier non autorisé.", "danger")
                     return redirect(request.url)
-                is_valid, error_msg = validate_file_size(file3)
+                is_valid, error_msg = validate_upload(file3)
                 if not is_valid:
                     flash(f"Photo 3 : {error_msg}", "danger")
                     return redirect(request.url)
                 try:
                     file_name3 = upload_file_local(file3)
-                    file_mimetype3 = file3.mimetype
+                    file_mimetype3 = stored_mimetype(file_name3)
                 except Exception as e:
                     current_app.logger.error(f"Erreur upload photo 3: {e}")
                     flash("Erreur lors de l'enregistrement de la photo 3. Veuillez réessayer.", "danger")
@@ -2622,6 +2346,7 @@ def register_routes(app: Flask) -> None:
             )
             db.session.add(show)
             db.session.commit()
+            current_app.extensions["image_jobs"].enqueue_uploads(show)
 
             # L'email de notification sera envoyé lors de la validation par l'admin
 
@@ -2665,27 +2390,18 @@ def register_routes(app: Flask) -> None:
                     flash("Type de fichier non autorisé (pdf/jpg/jpeg/png/webp/gif).", "danger")
                     return redirect(request.url)
 
-                # Vérifier la taille du fichier
-                is_valid, error_msg = validate_file_size(file)
+                # Vérifier la taille et le contenu du fichier (en-tête seulement)
+                is_valid, error_msg = validate_upload(file)
                 if not is_valid:
                     flash(error_msg, "danger")
                     return redirect(request.url)
 
-                # Supprimer l'ancien fichier (best-effort)
-                if show.file_name:
-                    delete_file_s3(show.file_name)
-                    try:
-                        old_local = Path(current_app.config["UPLOAD_FOLDER"]) / show.file_name
-                        if old_local.exists():
-                            old_local.unlink()
-                    except Exception:
-                        pass
-
+                # L'ancien fichier est libéré au COMMIT (suppression différée, voir media_refs.py)
                 # Upload S3 (fallback local si S3 non configuré)
                 try:
                     new_name = upload_file_local(file)
                     show.file_name = new_name
-                    show.file_mimetype = file.mimetype
+                    show.file_mimetype = stored_mimetype(new_name)
                 except Exception as e:
                     current_app.logger.error(f"Erreur upload fichier principal: {e}")
                     flash("Erreur lors de l'enregistrement du fichier. Veuillez réessayer.", "danger")
@@ -2697,22 +2413,13 @@ def register_routes(app: Flask) -> None:
                 if not allowed_file(file2.filename):
                     flash("Photo 2 : Type de fichier non autorisé.", "danger")
                     return redirect(request.url)
-                is_valid, error_msg = validate_file_size(file2)
+                is_valid, error_msg = validate_upload(file2)
                 if not is_valid:
                     flash(f"Photo 2 : {error_msg}", "danger")
                     return redirect(request.url)
-                # Supprimer l'ancienne photo 2
-                if show.file_name2:
-                    delete_file_s3(show.file_name2)
-                    try:
-                        old_local = Path(current_app.config["UPLOAD_FOLDER"]) / show.file_name2
-                        if old_local.exists():
-                            old_local.unlink()
-                    except Exception:
-                        pass
                 try:
                     show.file_name2 = upload_file_local(file2)
-                    show.file_mimetype2 = file2.mimetype
+                    show.file_mimetype2 = stored_mimetype(show.file_name2)
                 except Exception as e:
                     current_app.logger.error(f"Erreur upload photo 2: {e}")
                     flash("Erreur lors de l'enregistrement de la photo 2. Veuillez réessayer.", "danger")
@@ -2724,28 +2431,20 @@ def register_routes(app: Flask) -> None:
                 if not allowed_file(file3.filename):
                     flash("Photo 3 : Type de fichier non autorisé.", "danger")
                     return redirect(request.url)
-                is_valid, error_msg = validate_file_size(file3)
+                is_valid, error_msg = validate_upload(file3)
                 if not is_valid:
                     flash(f"Photo 3 : {error_msg}", "danger")
                     return redirect(request.url)
-                # Supprimer l'ancienne photo 3
-                if show.file_name3:
-                    delete_file_s3(show.file_name3)
-                    try:
-                        old_local = Path(current_app.config["UPLOAD_FOLDER"]) / show.file_name3
-                        if old_local.exists():
-                            old_local.unlink()
-                    except Exception:
-                        pass
                 try:
                     show.file_name3 = upload_file_local(file3)
-                    show.file_mimetype3 = file3.mimetype
+                    show.file_mimetype3 = stored_mimetype(show.file_name3)
                 except Exception as e:
                     current_app.logger.error(f"Erreur upload photo 3: {e}")
                     flash("Erreur lors de l'enregistrement de la photo 3. Veuillez réessayer.", "danger")
                     return redirect(request.url)
 
             db.session.commit()
+            current_app.extensions["image_jobs"].enqueue_uploads(show)
             flash("Annonce mise à jour.", "success")
             return redirect(url_for("admin_dashboard"))
 
@@ -2757,17 +2456,7 @@ def register_routes(app: Flask) -> None:
     def show_delete(show_id: int):
         show = Show.query.get_or_404(show_id)
 
-        # Supprimer tous les fichiers (photo 1, 2 et 3)
-        for fname in [show.file_name, show.file_name2, show.file_name3]:
-            if fname:
-                delete_file_s3(fname)
-                p = Path(current_app.config["UPLOAD_FOLDER"]) / fname
-                if p.exists():
-                    try:
-                        p.unlink()
-                    except Exception:
-                        pass
-
+        # Fichiers libérés au COMMIT, supprimés plus tard s'ils ne servent plus (voir media_refs.py)
         db.session.delete(show)
         db.session.commit()
         flash("Annonce supprimée.", "success")
@@ -3016,7 +2705,7 @@ Accessibilité: {accessibilite}
         # Récupérer les spectacles "à la une" pour affichage
         spectacles_une = Show.query.filter(
             Show.approved.is_(True),
-            Show.category.ilike('%Spectacle à la une%')
+            category_filter('Spectacle à la une')
         ).order_by(Show.created_at.desc()).limit(8).all()
 
         return render_template("demande_animation.html", user=current_user(), spectacles_une=spectacles_une)
@@ -3029,32 +2718,31 @@ Accessibilité: {accessibilite}
     # Pages thématiques SEO
     # ---------------------------
     @app.route("/spectacles-enfants")
+    @page_cache.cached()
     def spectacles_enfants():
         shows = Show.query.filter(
             Show.approved.is_(True),
             or_(
-                Show.category.ilike('%enfant%'),
-                Show.category.ilike('%jeune public%'),
-                Show.category.ilike('%famille%'),
+                category_filter('enfant', 'jeune public', 'famille'),
                 Show.age_range.ilike('%ans%')
             )
         ).all()
         return render_template("spectacles_enfants.html", shows=shows, user=current_user())
 
     @app.route("/animations-enfants")
+    @page_cache.cached()
     def animations_enfants():
         shows = Show.query.filter(
             Show.approved.is_(True),
             or_(
-                Show.category.ilike('%animation%'),
-                Show.category.ilike('%atelier%'),
-                Show.category.ilike('%jeu%'),
+                category_filter('animation', 'atelier', 'jeu'),
                 Show.title.ilike('%animation%')
             )
         ).all()
         return render_template("animations_enfants.html", shows=shows, user=current_user())
 
     @app.route("/spectacles-noel")
+    @page_cache.cached()
     def spectacles_noel():
         shows = Show.query.filter(
             Show.approved.is_(True),
@@ -3063,20 +2751,18 @@ Accessibilité: {accessibilite}
                 Show.title.ilike('%noel%'),
                 Show.description.ilike('%noël%'),
                 Show.description.ilike('%noel%'),
-                Show.category.ilike('%noël%'),
-                Show.category.ilike('%noel%')
+                category_filter('noel')
             )
         ).all()
         return render_template("spectacles_noel.html", shows=shows, user=current_user())
 
     @app.route("/animations-entreprises")
+    @page_cache.cached()
     def animations_entreprises():
         shows = Show.query.filter(
             Show.approved.is_(True),
             or_(
-                Show.category.ilike('%entreprise%'),
-                Show.category.ilike('%corporate%'),
-                Show.category.ilike('%CSE%'),
+                category_filter('entreprise', 'corporate', 'CSE'),
                 Show.description.ilike('%entreprise%'),
                 Show.description.ilike('%corporate%')
             )
@@ -3084,11 +2770,12 @@ Accessibilité: {accessibilite}
         return render_template("animations_entreprises.html", shows=shows, user=current_user())
 
     @app.route("/marionnettes")
+    @page_cache.cached()
     def marionnettes():
         shows = Show.query.filter(
             Show.approved.is_(True),
             or_(
-                Show.category.ilike('%marionnette%'),
+                category_filter('marionnette'),
                 Show.title.ilike('%marionnette%'),
                 Show.description.ilike('%marionnette%')
             )
@@ -3096,18 +2783,19 @@ Accessibilité: {accessibilite}
         return render_template("marionnettes.html", shows=shows, user=current_user())
 
     @app.route("/booker-artiste")
+    @page_cache.cached()
     def booker_artiste():
         # Afficher tous les spectacles pour la réservation d'artistes
         shows = Show.query.filter(Show.approved.is_(True)).all()
         return render_template("booker_artiste.html", shows=shows, user=current_user())
 
     @app.route("/magiciens")
+    @page_cache.cached()
     def magiciens():
         shows = Show.query.filter(
             Show.approved.is_(True),
             or_(
-                Show.category.ilike('%magie%'),
-                Show.category.ilike('%magicien%'),
+                category_filter('magie', 'magicien'),
                 Show.title.ilike('%magie%'),
                 Show.title.ilike('%magicien%')
             )
@@ -3115,11 +2803,12 @@ Accessibilité: {accessibilite}
         return render_template("magiciens.html", shows=shows, user=current_user())
 
     @app.route("/clowns")
+    @page_cache.cached()
     def clowns():
         shows = Show.query.filter(
             Show.approved.is_(True),
             or_(
-                Show.category.ilike('%clown%'),
+                category_filter('clown'),
                 Show.title.ilike('%clown%'),
                 Show.description.ilike('%clown%')
             )
@@ -3127,15 +2816,14 @@ Accessibilité: {accessibilite}
         return render_template("clowns.html", shows=shows, user=current_user())
 
     @app.route("/animations-anniversaire")
+    @page_cache.cached()
     def animations_anniversaire():
         shows = Show.query.filter(
             Show.approved.is_(True),
             or_(
-                Show.category.ilike('%anniversaire%'),
+                category_filter('anniversaire', 'enfant', 'animation'),
                 Show.title.ilike('%anniversaire%'),
-                Show.description.ilike('%anniversaire%'),
-                Show.category.ilike('%enfant%'),
-                Show.category.ilike('%animation%')
+                Show.description.ilike('%anniversaire%')
             )
         ).all()
         return render_template("animations_anniversaire.html", shows=shows, user=current_user())
@@ -3195,8 +2883,9 @@ Accessibilité: {accessibilite}
         # 2) recherche textuelle
         base = Show.query
         if q:
-            like = f"%{q}%"
-            base = base.filter(Show.title.ilike(like) | Show.description.ilike(like))
+            base, relevance = catalogue_search.apply_search(base, q)
+            if relevance is not None:
+                base = base.order_by(relevance)
 
         shows = base.all()
         results = []
@@ -3248,6 +2937,7 @@ Accessibilité: {accessibilite}
         return render_template("contact.html")
 
     @app.route("/demandes-animation")
+    @page_cache.cached(allowed_args=paginated)
     def demandes_animation():
         from models.models import DemandeAnimation
         page = request.args.get('page', 1, type=int)
@@ -3256,28 +2946,34 @@ Accessibilité: {accessibilite}
         region = request.args.get('region', '').strip()
         
         # Base de la requête - TOUJOURS filtrer les demandes privées sur la page publique
-        demandes_query = DemandeAnimation.query.filter(DemandeAnimation.is_private == False).order_by(DemandeAnimation.created_at.desc())
+        demandes_query = DemandeAnimation.query.filter(DemandeAnimation.is_private == False)
         
         if categorie:
             demandes_query = demandes_query.filter(DemandeAnimation.genre_recherche.ilike(f"%{categorie}%"))
         if region:
             demandes_query = demandes_query.filter(DemandeAnimation.lieu_ville.ilike(f"%{region}%"))
         
-        total = demandes_query.count()
-        demandes = demandes_query.offset((page-1)*per_page).limit(per_page).all()
-        nb_pages = (total // per_page) + (1 if total % per_page > 0 else 0)
+        # Plus récentes d'abord, pagination par clé (voir keyset_pagination.py)
+        pagination = keyset_paginate(
+            demandes_query, demandes_keys, per_page=per_page, page=page,
+            cursor=request.args.get("cursor"), **pagination_options(),
+        )
+        demandes = pagination.items
+        total = pagination.total
+        nb_pages = pagination.pages
         
-        # Pour le moteur de recherche : liste unique des catégories et régions existantes
-        categories = [c[0] for c in db.session.query(DemandeAnimation.genre_recherche).distinct().all() if c[0]]
-        regions = [r[0] for r in db.session.query(DemandeAnimation.lieu_ville).distinct().all() if r[0]]
+        # Pour le moteur de recherche : catégories et villes des demandes publiques (cache des facettes)
+        facets = current_app.extensions["catalogue_facets"]
+        categories = facets.values("demande_genre")
+        regions = facets.values("demande_ville")
         
         # Récupérer les spectacles "à la une" pour affichage
         spectacles_une = Show.query.filter(
             Show.approved.is_(True),
-            Show.category.ilike('%Spectacle à la une%')
+            category_filter('Spectacle à la une')
         ).order_by(Show.created_at.desc()).limit(8).all()
         
-        return render_template("demandes_animation.html", demandes=demandes, page=page, nb_pages=nb_pages, total=total, per_page=per_page, user=current_user(), categories=categories, regions=regions, categorie=categorie, region=region, spectacles_une=spectacles_une)
+        return render_template("demandes_animation.html", demandes=demandes, page=pagination.page, nb_pages=nb_pages, total=total, per_page=per_page, pagination=pagination, user=current_user(), categories=categories, regions=regions, categorie=categorie, region=region, spectacles_une=spectacles_une)
 
     @app.route("/mes-appels-offres")
     @login_required
@@ -3290,22 +2986,28 @@ Accessibilité: {accessibilite}
         region = request.args.get('region', '').strip()
         
         # Les utilisateurs connectés voient toutes les demandes publiques avec toutes les infos
-        demandes_query = DemandeAnimation.query.filter(DemandeAnimation.is_private == False).order_by(DemandeAnimation.created_at.desc())
+        demandes_query = DemandeAnimation.query.filter(DemandeAnimation.is_private == False)
         
         if categorie:
             demandes_query = demandes_query.filter(DemandeAnimation.genre_recherche.ilike(f"%{categorie}%"))
         if region:
             demandes_query = demandes_query.filter(DemandeAnimation.lieu_ville.ilike(f"%{region}%"))
         
-        total = demandes_query.count()
-        demandes = demandes_query.offset((page-1)*per_page).limit(per_page).all()
-        nb_pages = (total // per_page) + (1 if total % per_page > 0 else 0)
+        # Plus récentes d'abord, pagination par clé (voir keyset_pagination.py)
+        pagination = keyset_paginate(
+            demandes_query, demandes_keys, per_page=per_page, page=page,
+            cursor=request.args.get("cursor"), **pagination_options(),
+        )
+        demandes = pagination.items
+        total = pagination.total
+        nb_pages = pagination.pages
         
-        # Pour le moteur de recherche : liste unique des catégories et régions existantes
-        categories = [c[0] for c in db.session.query(DemandeAnimation.genre_recherche).distinct().all() if c[0]]
-        regions = [r[0] for r in db.session.query(DemandeAnimation.lieu_ville).distinct().all() if r[0]]
+        # Pour le moteur de recherche : catégories et villes des demandes publiques (cache des facettes)
+        facets = current_app.extensions["catalogue_facets"]
+        categories = facets.values("demande_genre")
+        regions = facets.values("demande_ville")
         
-        return render_template("mes_appels_offres.html", demandes=demandes, page=page, nb_pages=nb_pages, total=total, per_page=per_page, user=current_user(), categories=categories, regions=regions, categorie=categorie, region=region)
+        return render_template("mes_appels_offres.html", demandes=demandes, page=pagination.page, nb_pages=nb_pages, total=total, per_page=per_page, pagination=pagination, user=current_user(), categories=categories, regions=regions, categorie=categorie, region=region)
 
     @app.route("/test-demandes")
     def test_demandes():
@@ -3484,8 +3186,7 @@ Accessibilité: {accessibilite}
             query = Show.query.filter(Show.approved.is_(True))
             
             if categories:
-                category_filters = [Show.category.ilike(f"%{cat}%") for cat in categories]
-                query = query.filter(or_(*category_filters))
+                query = query.filter(category_filter(*categories))
             
             # Filtrer par région si des régions sont sélectionnées
             if regions:
@@ -3685,8 +3386,7 @@ L'équipe Spectacle'ment VØtre
         
         # Récupérer les catégories des spectacles existants
         try:
-            existing_categories = db.session.query(Show.category).filter(Show.approved.is_(True)).distinct().all()
-            existing_categories_list = [c[0] for c in existing_categories if c[0]]
+            existing_categories_list = current_app.extensions["catalogue_facets"].values("show_category")
         except Exception:
             db.session.rollback()
             existing_categories_list = []
@@ -3706,6 +3406,8 @@ L'équipe Spectacle'ment VØtre
     # Routes SEO pour les villes
     # ----------------------------
     @app.route("/spectacles-<city_slug>")
+    @conditional(catalogue_validator)
+    @page_cache.cached(allowed_args=paginated)
     def city_spectacles(city_slug):
             """Page SEO dédiée pour chaque ville française avec spectacles locaux"""
             # Récupérer les données de la ville
@@ -3728,28 +3430,32 @@ L'équipe Spectacle'ment VØtre
             city_name = city['name']
             shows = shows.filter(
                 or_(
-                    Show.location.ilike(f"%{city_name}%"),
+                    city_filter(city_name),
                     Show.region.ilike(f"%{city['region']}%")
                 )
             )
             
             # Filtrer par catégorie si spécifiée
             if category:
-                shows = shows.filter(Show.category.ilike(f"%{category}%"))
+                shows = shows.filter(category_filter(category))
             
             # Filtrer par âge si spécifié
             if age_range:
                 shows = shows.filter(Show.age_range.ilike(f"%{age_range}%"))
             
-            # Trier par ordre d'affichage puis date
-            shows = shows.order_by(Show.display_order.asc(), Show.created_at.desc())
-            
-            # Pagination (12 spectacles par page)
-            per_page = 12
-            shows_paginated = shows.paginate(page=page, per_page=per_page, error_out=False)
+            # Trier par ordre d'affichage puis date ; pagination par clé (12 spectacles par page)
+            city_keys = (
+                SortKey(Show.display_order),
+                SortKey(Show.created_at, desc=True),
+                SortKey(Show.id, desc=True),
+            )
+            shows_paginated = keyset_paginate(
+                shows, city_keys, per_page=12, page=page,
+                cursor=request.args.get("cursor"), **pagination_options(),
+            )
             
-            # Compter le nombre de spectacles pour cette ville
-            total_shows = shows.count()
+            # Nombre de spectacles pour cette ville (comptage plafonné, fait par la pagination)
+            total_shows = shows_paginated.total
             
             # Générer les méta-données SEO
             meta_title = f"Spectacles à {city_name} ({city['department']}) - Artistes et Compagnies"
@@ -3947,13 +3653,8 @@ def admin_delete_photo(show_id, photo_field):
     
     if file_to_delete:
         try:
-            # Supprimer le fichier du système (si stockage local)
-            file_path = Path(current_app.config["UPLOAD_FOLDER"]) / file_to_delete
-            if file_path.exists():
-                file_path.unlink()
-                current_app.logger.info(f"[ADMIN] Fichier {file_to_delete} supprimé du disque")
-            
-            # Supprimer la référence dans la base de données
+            # Supprimer la référence dans la base de données : le fichier (S3 et local) est
+            # supprimé par le ramasse-miettes s'il ne sert à aucun autre spectacle (voir media_refs.py)
             setattr(show, photo_field, None)
             if photo_field == 'file_name':
                 # Si c'est la photo principale, supprimer aussi le mimetype
@@ -0,0 +1,104 @@
+"""
+Identité de l'utilisateur connecté, sans requête SQL à chaque appel.
+
+- ``current_user()`` (app.py) mémorise le résultat sur ``flask.g`` : une seule
+  résolution par requête, quel que soit le nombre d'appels (décorateurs, vue,
+  template).
+- Au login, l'id et un instantané minimal (id, username, is_admin,
+  raison_sociale) sont stockés dans la session, signée par Flask. Tant que
+  l'instantané a moins de IDENTITY_CACHE_TTL secondes, aucune requête SQL n'est
+  faite : ``UserIdentity`` répond à partir de la session et ne charge le
+  ``User`` complet (par clé primaire) que si un autre attribut est demandé.
+- Les visiteurs anonymes ne déclenchent jamais de requête.
+
+Un changement de droits (is_admin) ou une suppression de compte est donc pris
+en compte au plus tard après IDENTITY_CACHE_TTL secondes.
+"""
+import time
+
+from flask import current_app, session
+
+from models import db
+from models.models import User
+
+
+IDENTITY_KEY = "identity"
+SNAPSHOT_FIELDS = ("id", "username", "is_admin", "raison_sociale")
+
+
+class UserIdentity:
+    """Utilisateur connecté reconstitué depuis la session ; charge le ``User`` complet à la demande."""
+    __slots__ = SNAPSHOT_FIELDS + ("_user",)
+
+    def __init__(self, snapshot: dict):
+        for field in SNAPSHOT_FIELDS:
+            object.__setattr__(self, field, snapshot.get(field))
+        object.__setattr__(self, "_user", None)
+
+    @property
+    def user(self) -> User:
+        if self._user is None:
+            object.__setattr__(self, "_user", db.session.get(User, self.id))
+        return self._user
+
+    def __getattr__(self, name):
+        # Appelé uniquement pour les attributs absents de l'instantané (email, shows, set_password...)
+        return getattr(self.user, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.user, name, value)
+        if name in SNAPSHOT_FIELDS:
+            object.__setattr__(self, name, value)
+
+    def __eq__(self, other):
+        if isinstance(other, (User, UserIdentity)):
+            return self.id == other.id
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(("user", self.id))
+
+    def __repr__(self):
+        return f"<UserIdentity {self.username!r}>"
+
+
+def remember_user(user: User) -> None:
+    """Enregistre l'identité dans la session (login, ou rafraîchissement après expiration)."""
+    session["username"] = user.username
+    session["user_id"] = user.id
+    snapshot = {field: getattr(user, field) for field in SNAPSHOT_FIELDS}
+    snapshot["exp"] = time.time() + current_app.config.get("IDENTITY_CACHE_TTL", 60)
+    session[IDENTITY_KEY] = snapshot
+
+
+def forget_user() -> None:
+    for key in ("username", "user_id", IDENTITY_KEY):
+        session.pop(key, None)
+
+
+def load_current_user():
+    """Résout l'utilisateur connecté : instantané de session valide, sinon requête par clé primaire."""
+    username = session.get("username")
+    if not username:
+        return None
+
+    snapshot = session.get(IDENTITY_KEY)
+    if (snapshot and snapshot.get("username") == username
+            and snapshot.get("exp", 0) > time.time()):
+        return UserIdentity(snapshot)
+
+    user = None
+    user_id = session.get("user_id")
+    if user_id:
+        user = db.session.get(User, user_id)
+        if user is not None and user.username != username:
+            user = None
+    if user is None:
+        # Sessions ouvertes avant le stockage de l'id
+        user = User.query.filter_by(username=username).first()
+    if user is None:
+        session.pop(IDENTITY_KEY, None)
+        return None
+
+    remember_user(user)
+    return user
@@ -0,0 +1,119 @@
+"""
+Micro-benchmark de la détection des robots : ancienne boucle de sous-chaînes
+contre BotClassifier (regex compilée + verdicts mémorisés).
+
+Usage :
+    python bench_bot_classifier.py            # corpus intégré (~5000 UA)
+    python bench_bot_classifier.py --db       # User-Agents réels de visitor_log
+
+Vérifie aussi que les deux implémentations rendent exactement les mêmes verdicts.
+"""
+import random
+import sys
+import time
+
+from bot_detection import BotClassifier, DEFAULT_PATTERNS
+
+
+def legacy_is_bot_visitor(user_agent: str, isp: str = None) -> bool:
+    """Implémentation d'origine (boucles de sous-chaînes), conservée comme référence."""
+    if not user_agent:
+        return False
+    user_agent_lower = user_agent.lower()
+    for pattern in DEFAULT_PATTERNS["user_agent"]:
+        if pattern in user_agent_lower:
+            return True
+    if isp:
+        isp_lower = isp.lower()
+        for bot_isp in DEFAULT_PATTERNS["datacenter_isps"]:
+            if bot_isp in isp_lower:
+                has_human_browser = any(b in user_agent_lower for b in DEFAULT_PATTERNS["human_browsers"])
+                if not has_human_browser:
+                    return True
+    return False
+
+
+# User-Agents réels (navigateurs, mobiles, robots, outils) servant de gabarits
+SAMPLE_USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{v}.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.{v} Safari/605.1.15",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:{v}.0) Gecko/20100101 Firefox/{v}.0",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_{v} like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Linux; Android 14; SM-S918B) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{v}.0.0.0 Mobile Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{v}.0.0.0 Safari/537.36 Edg/{v}.0.0.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{v}.0.0.0 Safari/537.36 OPR/{v}.0.0.0",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{v}.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    "Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)",
+    "Mozilla/5.0 (compatible; AhrefsBot/7.0; +http://ahrefs.com/robot/)",
+    "Mozilla/5.0 (compatible; SemrushBot/7~bl; +http://www.semrush.com/bot.html)",
+    "Mozilla/5.0 (compatible; YandexBot/3.0; +http://yandex.com/bots)",
+    "facebookexternalhit/1.1 (+http://www.facebook.com/externalhit_uatext.php)",
+    "WhatsApp/2.23.{v}.76 A",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) HeadlessChrome/{v}.0.0.0 Safari/537.36",
+    "python-requests/2.{v}.0",
+    "curl/8.{v}.0",
+    "Wget/1.21.{v}",
+    "Go-http-client/1.1",
+    "Java/17.0.{v}",
+]
+SAMPLE_ISPS = [None, None, None, "Orange", "Free SAS", "SFR", "Bouygues Telecom",
+               "Amazon.com, Inc.", "OVH SAS", "Hetzner Online GmbH", "Google Cloud"]
+
+
+def build_corpus(size: int = 5000, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        ua = rng.choice(SAMPLE_USER_AGENTS).format(v=rng.randint(90, 130))
+        corpus.append((ua, rng.choice(SAMPLE_ISPS)))
+    return corpus
+
+
+def load_corpus_from_db(limit: int = 5000) -> list:
+    from app import app
+    from models.models import VisitorLog
+    with app.app_context():
+        rows = (VisitorLog.query
+                .with_entities(VisitorLog.user_agent, VisitorLog.isp)
+                .filter(VisitorLog.user_agent.isnot(None))
+                .order_by(VisitorLog.id.desc())
+                .limit(limit)
+                .all())
+    return [(ua, isp) for ua, isp in rows]
+
+
+def bench(label: str, func, corpus: list, rounds: int = 5) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for ua, isp in corpus:
+            func(ua, isp)
+        best = min(best, time.perf_counter() - started)
+    per_call_us = best / len(corpus) * 1e6
+    print(f"   {label:<38} {per_call_us:8.3f} µs/appel")
+    return per_call_us
+
+
+if __name__ == "__main__":
+    corpus = load_corpus_from_db() if "--db" in sys.argv else build_corpus()
+    if not corpus:
+        print("❌ Corpus vide (aucun User-Agent en base ?)")
+        sys.exit(1)
+    distinct = len({ua for ua, _ in corpus})
+    print(f"🤖 Benchmark détection des robots : {len(corpus)} appels, {distinct} User-Agents distincts\n")
+
+    classifier = BotClassifier(reload_interval=None)
+    mismatches = [(ua, isp) for ua, isp in corpus
+                  if legacy_is_bot_visitor(ua, isp) != classifier.classify(ua, isp)]
+    if mismatches:
+        print(f"❌ {len(mismatches)} verdicts différents, ex : {mismatches[0]}")
+        sys.exit(1)
+    print("✅ Verdicts identiques entre les deux implémentations\n")
+
+    before = bench("Ancienne boucle de sous-chaînes", legacy_is_bot_visitor, corpus)
+    cold = BotClassifier(cache_size=0, reload_interval=None)
+    bench("Regex compilée (sans cache)", cold.classify, corpus)
+    warm = BotClassifier(reload_interval=None)
+    after = bench("Regex compilée + cache par UA", warm.classify, corpus)
+    print(f"\n📊 Gain : x{before / after:.1f} par appel")
@@ -0,0 +1,161 @@
+"""
+Détection des robots/crawlers en une seule passe.
+
+Les listes de patterns (User-Agent, ISP de datacenters, navigateurs) sont lues
+depuis ``bot_patterns.json`` (ou BOT_PATTERNS_FILE) et compilées en une
+expression régulière par liste. Le fichier est relu automatiquement quand il
+change : on peut ajouter un robot sans redéployer.
+
+Le verdict d'un User-Agent est mémorisé (LRU bornée) : les mêmes UA reviennent
+en permanence, la plupart des appels ne coûtent donc qu'une recherche dans un dict.
+Benchmark : ``python bench_bot_classifier.py``.
+"""
+import json
+import re
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+
+
+DEFAULT_PATTERNS_FILE = Path(__file__).resolve().parent / "bot_patterns.json"
+
+# Utilisés si le fichier de patterns est absent ou invalide au démarrage
+DEFAULT_PATTERNS = {
+    "user_agent": [
+        'bot', 'crawler', 'spider', 'scraper', 'slurp', 'mediapartners',
+        'googlebot', 'bingbot', 'yandexbot', 'baiduspider', 'facebookexternalhit',
+        'twitterbot', 'linkedinbot', 'whatsapp', 'telegrambot', 'discordbot',
+        'slackbot', 'pinterestbot', 'applebot', 'duckduckbot', 'ahrefsbot',
+        'semrushbot', 'mj12bot', 'dotbot', 'rogerbot', 'exabot', 'sogou',
+        'archive.org', 'wget', 'curl', 'python-requests', 'java/', 'go-http',
+        'phantom', 'headless', 'selenium', 'webdriver', 'prerender'
+    ],
+    "datacenter_isps": [
+        'amazon', 'aws', 'google cloud', 'microsoft corporation',
+        'tencent', 'alibaba', 'digitalocean', 'ovh', 'hetzner',
+        'linode', 'vultr', 'cloudflare', 'fastly'
+    ],
+    "human_browsers": ['chrome', 'firefox', 'safari', 'edge', 'opera'],
+}
+
+
+def compile_patterns(patterns) -> re.Pattern | None:
+    """Compile une liste de sous-chaînes (minuscules) en une seule alternative."""
+    cleaned = sorted({p.lower() for p in patterns if p}, key=len, reverse=True)
+    if not cleaned:
+        return None
+    return re.compile("|".join(re.escape(p) for p in cleaned))
+
+
+class BotClassifier:
+    """Classifieur User-Agent/ISP compilé, mémorisé et rechargeable à chaud."""
+
+    def __init__(self, path=None, cache_size: int = 4096, reload_interval: float = 60, logger=None):
+        self.path = Path(path) if path else DEFAULT_PATTERNS_FILE
+        self.cache_size = cache_size
+        self.reload_interval = reload_interval
+        self.logger = logger
+        self._mtime = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._ua_re = self._isp_re = self._browser_re = None
+        self._ua_verdict = lru_cache(maxsize=cache_size)(self._compute_ua_verdict)
+        if not self._load():
+            self._compile(DEFAULT_PATTERNS)
+
+    @classmethod
+    def from_app(cls, app) -> "BotClassifier":
+        return cls(
+            app.config.get("BOT_PATTERNS_FILE"),
+            cache_size=app.config.get("BOT_CACHE_SIZE", 4096),
+            reload_interval=app.config.get("BOT_PATTERNS_RELOAD_INTERVAL", 60),
+            logger=app.logger,
+        )
+
+    # -------------------------------------------------
+    # Chargement des patterns
+    # -------------------------------------------------
+    def _compile(self, data: dict) -> None:
+        # Remplacement atomique des trois expressions, puis purge des verdicts
+        self._ua_re, self._isp_re, self._browser_re = (
+            compile_patterns(data.get("user_agent", [])),
+            compile_patterns(data.get("datacenter_isps", [])),
+            compile_patterns(data.get("human_browsers", [])),
+        )
+        self._ua_verdict.cache_clear()
+
+    def _load(self) -> bool:
+        """Charge le fichier de patterns. Retourne False s'il est absent ou invalide."""
+        try:
+            mtime = self.path.stat().st_mtime
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self._compile(data)
+            self._mtime = mtime
+            if self.logger:
+                self.logger.info(
+                    f"[BOTS] {len(data.get('user_agent', []))} patterns chargés depuis {self.path}"
+                )
+            return True
+        except (OSError, ValueError) as e:
+            if self.logger:
+                self.logger.warning(f"[BOTS] Fichier de patterns inutilisable ({self.path}): {e}")
+            return False
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + self.reload_interval
+            try:
+                mtime = self.path.stat().st_mtime
+            except OSError:
+                return
+            if mtime != self._mtime:
+                self._load()
+
+    # -------------------------------------------------
+    # Classification
+    # -------------------------------------------------
+    def _compute_ua_verdict(self, user_agent: str) -> tuple:
+        """(UA de robot, navigateur humain reconnu) pour un User-Agent exact."""
+        ua = user_agent.lower()
+        is_bot = bool(self._ua_re and self._ua_re.search(ua))
+        has_browser = bool(self._browser_re and self._browser_re.search(ua))
+        return is_bot, has_browser
+
+    def classify(self, user_agent: str, isp: str = None) -> bool:
+        """Détecte si un visiteur est un robot/crawler basé sur le User-Agent et l'ISP
+
+        Retourne True si c'est un robot, False sinon.
+        """
+        if not user_agent:
+            return False
+        if self.reload_interval is not None:
+            self._maybe_reload()
+
+        is_bot, has_browser = self._ua_verdict(user_agent)
+        if is_bot:
+            return True
+
+        # ISP de datacenter ET pas de navigateur reconnu (un humain via VPN garde son navigateur)
+        if isp and not has_browser and self._isp_re is not None:
+            return bool(self._isp_re.search(isp.lower()))
+        return False
+
+    __call__ = classify
+
+    def stats(self) -> dict:
+        info = self._ua_verdict.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            "patterns_file": str(self.path),
+            "cache_entries": info.currsize,
+            "cache_hits": info.hits,
+            "cache_misses": info.misses,
+            "hit_ratio": round(info.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,289 @@
+"""
+Caches du catalogue de spectacles et leur invalidation.
+
+``install_catalogue_events(session)`` branche des événements SQLAlchemy qui
+détectent toute écriture sur les modèles surveillés (``Show`` : création,
+modification, validation, suppression, réordonnancement, y compris les
+``query.update()`` en masse ; ``DemandeAnimation`` de la même façon).
+Après le COMMIT, les fonctions enregistrées via ``on_catalogue_change``
+(écritures sur Show) ou ``on_model_change`` (autre modèle) sont appelées :
+chaque cache s'y abonne pour se vider.
+
+Les événements ne concernent que le worker qui a fait l'écriture : les
+autres workers gunicorn convergent grâce au TTL de chaque cache, ou en
+relisant la version du catalogue stockée en base (``CatalogueVersion``).
+"""
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from itertools import chain
+
+from sqlalchemy import event, func, select
+
+from catalogue_tags import _insert_ignore, category_filter
+from models import db
+from models.models import CacheVersion, Category, City, DemandeAnimation, Show, show_category, show_city
+
+
+_listeners = {}
+_installed_on = set()
+
+
+def on_model_change(model, func):
+    """Enregistre une fonction appelée après chaque COMMIT modifiant une ligne de ``model``."""
+    _listeners.setdefault(model, []).append(func)
+    return func
+
+
+def on_catalogue_change(func):
+    """Enregistre une fonction appelée après chaque COMMIT modifiant un spectacle (utilisable en décorateur)."""
+    return on_model_change(Show, func)
+
+
+def notify_model_change(model) -> None:
+    for fn in list(_listeners.get(model, ())):
+        try:
+            fn()
+        except Exception as e:
+            print(f"⚠️  [CACHE] Erreur lors de l'invalidation du cache {model.__name__} ({fn!r}): {e}")
+
+
+def notify_catalogue_change() -> None:
+    notify_model_change(Show)
+
+
+def _flag(session, model) -> None:
+    session.info.setdefault("changed_models", set()).add(model)
+
+
+def _watched(obj):
+    return type(obj) if type(obj) in _listeners else None
+
+
+def install_catalogue_events(session) -> None:
+    """Branche la détection des écritures sur les modèles surveillés sur la session (db.session)."""
+    if id(session) in _installed_on:
+        return
+    _installed_on.add(id(session))
+
+    @event.listens_for(session, "before_flush")
+    def _detect_writes(sess, flush_context, instances):
+        for obj in chain(sess.new, sess.deleted):
+            model = _watched(obj)
+            if model is not None:
+                _flag(sess, model)
+        for obj in sess.dirty:
+            model = _watched(obj)
+            if model is not None and sess.is_modified(obj):
+                _flag(sess, model)
+
+    @event.listens_for(session, "do_orm_execute")
+    def _detect_bulk_writes(orm_execute_state):
+        # Model.query.filter(...).update(...) / .delete() ne passent pas par le flush
+        if orm_execute_state.is_update or orm_execute_state.is_delete:
+            for mapper in orm_execute_state.all_mappers:
+                if mapper.class_ in _listeners:
+                    _flag(orm_execute_state.session, mapper.class_)
+
+    @event.listens_for(session, "after_commit")
+    def _fire_after_commit(sess):
+        for model in sess.info.pop("changed_models", ()):
+            notify_model_change(model)
+
+    @event.listens_for(session, "after_rollback")
+    def _reset_after_rollback(sess):
+        sess.info.pop("changed_models", None)
+
+
+# -----------------------------------------------------
+# Spectacles « à la une » du diaporama (base.html)
+# -----------------------------------------------------
+class FeaturedShow:
+    """Enregistrement léger utilisé par le diaporama du header (pas d'instance ORM en cache)."""
+    __slots__ = ("id", "title", "file_name", "images")
+
+    def __init__(self, show: Show):
+        self.id = show.id
+        self.title = show.title
+        self.file_name = show.file_name
+        self.images = tuple(show.get_all_images())
+
+    def get_all_images(self):
+        return self.images
+
+
+class FeaturedShowsCache:
+    """Liste des spectacles à la une, recalculée après une écriture sur Show ou au bout du TTL."""
+
+    def __init__(self, ttl: float = 300):
+        self.ttl = ttl
+        self._value = None
+        self._expires_at = 0.0
+        self._generation = 0
+        self._lock = threading.Lock()
+        on_catalogue_change(self.invalidate)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._value = None
+            self._generation += 1
+
+    def get(self) -> list:
+        now = time.monotonic()
+        with self._lock:
+            if self._value is not None and self._expires_at > now:
+                return self._value
+            generation = self._generation
+        value = self._load()
+        with self._lock:
+            # Ne pas mémoriser un résultat lu pendant une invalidation
+            if generation == self._generation:
+                self._value = value
+                self._expires_at = now + self.ttl
+        return value
+
+    @staticmethod
+    def _load() -> list:
+        # Uniquement les spectacles de la catégorie "à la une"
+        shows = Show.query.filter(
+            Show.approved.is_(True),
+            Show.file_mimetype.ilike("image/%"),
+            category_filter("à la une"),
+        ).order_by(Show.created_at.desc()).all()
+        return [FeaturedShow(show) for show in shows]
+
+
+# -----------------------------------------------------
+# Facettes (listes de valeurs + nombre de spectacles/demandes)
+# -----------------------------------------------------
+class FacetValue(namedtuple("FacetValue", "value count")):
+    """Valeur d'une facette et son effectif, ex. ``FacetValue("Magie", 42).label`` → "Magie (42)"."""
+    __slots__ = ()
+
+    @property
+    def label(self) -> str:
+        return f"{self.value} ({self.count})"
+
+
+def _show_tag_counts(tag_model, assoc, key):
+    """Effectif de chaque étiquette (catégorie, ville) parmi les spectacles validés."""
+    return db.session.query(tag_model.name, func.count(assoc.c.show_id)) \
+        .join(assoc, assoc.c[key] == tag_model.id) \
+        .join(Show, Show.id == assoc.c.show_id) \
+        .filter(Show.approved.is_(True)) \
+        .group_by(tag_model.id, tag_model.name).all()
+
+
+def _public_demande_counts(column):
+    return db.session.query(column, func.count()).filter(
+        DemandeAnimation.is_private == False,  # noqa: E712
+        column.isnot(None),
+        column != "",
+    ).group_by(column).all()
+
+
+# nom → (modèle dont les écritures invalident la facette, requête (valeur, effectif))
+FACETS = {
+    "show_category": (Show, lambda: _show_tag_counts(Category, show_category, "category_id")),
+    "show_location": (Show, lambda: _show_tag_counts(City, show_city, "city_id")),
+    "demande_genre": (DemandeAnimation, lambda: _public_demande_counts(DemandeAnimation.genre_recherche)),
+    "demande_ville": (DemandeAnimation, lambda: _public_demande_counts(DemandeAnimation.lieu_ville)),
+}
+
+
+class FacetCache:
+    """
+    Facettes du catalogue et des appels d'offres, calculées par un GROUP BY
+    (étiquettes des spectacles validés / demandes publiques uniquement) et
+    servies depuis la mémoire. Vidées après une écriture sur le modèle concerné, ou au bout du TTL.
+    """
+
+    def __init__(self, ttl: float = 300):
+        self.ttl = ttl
+        self._values = {}
+        self._generations = {name: 0 for name in FACETS}
+        self._lock = threading.Lock()
+        for model in {model for model, _ in FACETS.values()}:
+            on_model_change(model, lambda model=model: self.invalidate(model))
+
+    def invalidate(self, model=None) -> None:
+        with self._lock:
+            for name, (facet_model, _) in FACETS.items():
+                if model is None or facet_model is model:
+                    self._values.pop(name, None)
+                    self._generations[name] += 1
+
+    def get(self, name: str) -> list:
+        """Liste de ``FacetValue`` triée par valeur."""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._values.get(name)
+            if cached is not None and cached[0] > now:
+                return cached[1]
+            generation = self._generations[name]
+        value = self._load(name)
+        with self._lock:
+            # Ne pas mémoriser un résultat lu pendant une invalidation
+            if generation == self._generations[name]:
+                self._values[name] = (now + self.ttl, value)
+        return value
+
+    def values(self, name: str) -> list:
+        return [facet.value for facet in self.get(name)]
+
+    @staticmethod
+    def _load(name: str) -> list:
+        _, load_counts = FACETS[name]
+        return sorted(FacetValue(value, count) for value, count in load_counts())
+
+
+# -----------------------------------------------------
+# Version du catalogue (cache des pages, voir page_cache.py)
+# -----------------------------------------------------
+class CatalogueVersion:
+    """
+    Compteur des écritures sur les spectacles et les appels d'offres, stocké
+    dans la table cache_version pour être partagé par tous les workers.
+    Le worker qui écrit l'incrémente après le COMMIT ; les autres le relisent
+    au plus toutes les ``check_interval`` secondes.
+    """
+    NAME = "catalogue"
+
+    def __init__(self, check_interval: float = 1.0):
+        self.check_interval = check_interval
+        self._value = None  # (version, changed_at)
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        for model in (Show, DemandeAnimation):
+            on_model_change(model, self.bump)
+
+    def get(self) -> tuple:
+        """(version, date de la dernière écriture) ; (0, None) avant la première écriture."""
+        now = time.monotonic()
+        with self._lock:
+            if self._value is not None and self._checked_at + self.check_interval > now:
+                return self._value
+        table = CacheVersion.__table__
+        with db.engine.connect() as conn:
+            row = conn.execute(
+                select(table.c.version, table.c.changed_at).where(table.c.name == self.NAME)
+            ).first()
+        value = (row[0], row[1]) if row else (0, None)
+        with self._lock:
+            self._value = value
+            self._checked_at = now
+        return value
+
+    def bump(self) -> None:
+        table = CacheVersion.__table__
+        now = datetime.utcnow()
+        with db.engine.begin() as conn:
+            updated = conn.execute(
+                table.update().where(table.c.name == self.NAME)
+                .values(version=table.c.version + 1, changed_at=now)
+            ).rowcount
+            if not updated:
+                _insert_ignore(conn, table, [{"name": self.NAME, "version": 1, "changed_at": now}])
+        with self._lock:
+            self._value = None  # Relue à la prochaine requête
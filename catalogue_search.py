@@ -0,0 +1,294 @@
+"""
+Recherche plein texte du catalogue de spectacles.
+
+Chaque spectacle est indexé à partir d'un document normalisé en Python
+(minuscules, sans accents) : titre, catégorie, lieu/région, description,
+âges et email de contact. Les âges sont convertis en jetons canoniques, de
+sorte que « 6-10 ans », « 6/10 », « 6 à 10 » et ``enfant_6_10`` se retrouvent :
+    - ``age6a10`` pour la tranche,
+    - ``age6``, ``age7``... ``age10`` pour chaque âge couvert (jusqu'à 18 ans).
+
+Backends :
+    - PostgreSQL : colonne ``shows.search_vector`` (tsvector, configuration
+      'french' → racinisation) pondérée titre > catégorie > lieu > reste,
+      index GIN, classement ``ts_rank_cd``.
+    - SQLite : table FTS5 ``shows_fts`` (rowid = id du spectacle), classement bm25.
+    - Autre / FTS5 indisponible : ancienne recherche ILIKE (``legacy_filter``).
+
+L'index est tenu à jour par des événements SQLAlchemy (insert/update/delete
+sur Show) et reconstruit au démarrage s'il est incomplet.
+"""
+import re
+import unicodedata
+
+from sqlalchemy import Column, Integer, MetaData, Table, Text, event, func, literal_column, or_, text
+
+from models import db
+from models.models import Show
+
+
+# Table FTS5 SQLite (métadonnées séparées : jamais créée par db.create_all)
+_fts_metadata = MetaData()
+shows_fts = Table("shows_fts", _fts_metadata, Column("rowid", Integer), Column("shows_fts", Text))
+
+MAX_AGE_EXPANSION = 18
+_RANGE_SEPARATORS = r"(?:-|–|—|/|à|a|au)"
+_RANGE_RE = re.compile(rf"(?<!\d)(\d{{1,2}})\s*(?:ans?)?\s*{_RANGE_SEPARATORS}\s*(\d{{1,2}})(?!\d)")
+_LOOSE_RANGE_RE = re.compile(r"(?<!\d)(\d{1,2})\s+(\d{1,2})(?!\d)")
+_SINGLE_AGE_RE = re.compile(r"(?<!\d)(\d{1,2})\s*ans\b")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def strip_accents(value: str) -> str:
+    return "".join(
+        c for c in unicodedata.normalize("NFKD", value) if not unicodedata.combining(c)
+    )
+
+
+def normalize(value: str) -> str:
+    """Minuscules, sans accents, ponctuation remplacée par des espaces (hors séparateurs d'âge)."""
+    value = strip_accents((value or "").lower()).replace("_", " ")
+    return re.sub(r"[^a-z0-9/\-–—]+", " ", value).strip()
+
+
+def _range_tokens(start: int, end: int) -> list:
+    if start > end:
+        start, end = end, start
+    tokens = [f"age{start}a{end}"]
+    tokens += [f"age{n}" for n in range(start, min(end, MAX_AGE_EXPANSION) + 1)]
+    return tokens
+
+
+def age_tokens(value: str, loose: bool = False) -> list:
+    """Jetons d'âge canoniques d'un texte (``loose`` : « 2 10 » vaut une tranche, pour age_range)."""
+    text_value = normalize(value)
+    tokens = []
+    for regex in ([_RANGE_RE, _LOOSE_RANGE_RE] if loose else [_RANGE_RE]):
+        for match in regex.finditer(text_value):
+            tokens += _range_tokens(int(match.group(1)), int(match.group(2)))
+    for match in _SINGLE_AGE_RE.finditer(text_value):
+        tokens.append(f"age{int(match.group(1))}")
+    return list(dict.fromkeys(tokens))
+
+
+def words(value: str) -> list:
+    return _WORD_RE.findall(normalize(value))
+
+
+def document_fields(show: Show) -> dict:
+    """Champs indexés d'un spectacle (texte normalisé)."""
+    ages = age_tokens(show.age_range or "", loose=True) + age_tokens(show.description or "")
+    return {
+        "title": " ".join(words(show.title or "")),
+        "category": " ".join(words(show.category or "")),
+        "location": " ".join(words(f"{show.location or ''} {show.region or ''}")),
+        "body": " ".join(words(f"{show.description or ''} {show.raison_sociale or ''} {show.contact_email or ''}")),
+        "ages": " ".join(dict.fromkeys(ages)),
+    }
+
+
+def parse_query(q: str):
+    """Découpe une recherche en mots (préfixes) et groupes d'âges (alternatives)."""
+    value = normalize(q)
+    age_groups = []
+    for match in _RANGE_RE.finditer(value):
+        age_groups.append(_range_tokens(int(match.group(1)), int(match.group(2))))
+    value = _RANGE_RE.sub(" ", value)
+    for match in _SINGLE_AGE_RE.finditer(value):
+        age_groups.append([f"age{int(match.group(1))}"])
+    value = _SINGLE_AGE_RE.sub(" ", value)
+
+    terms = []
+    for word in _WORD_RE.findall(value):
+        if word.isdigit() and len(word) <= 2:
+            # Nombre seul : un âge (« 6 » → spectacles couvrant 6 ans)
+            age_groups.append([f"age{int(word)}"])
+        elif word not in ("ans", "an"):
+            terms.append(word)
+    return terms, age_groups
+
+
+# -----------------------------------------------------
+# Backends
+# -----------------------------------------------------
+class PostgresSearch:
+    name = "postgresql"
+    weights = (("title", "A"), ("category", "B"), ("location", "B"), ("ages", "C"), ("body", "D"))
+
+    def ensure_schema(self, conn) -> None:
+        conn.execute(text("ALTER TABLE shows ADD COLUMN IF NOT EXISTS search_vector tsvector"))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_shows_search_vector ON shows USING GIN (search_vector)"
+        ))
+
+    def missing_count(self, conn) -> int:
+        return conn.execute(text("SELECT COUNT(*) FROM shows WHERE search_vector IS NULL")).scalar()
+
+    def index(self, conn, show_id: int, fields: dict) -> None:
+        vector = " || ".join(
+            f"setweight(to_tsvector('simple', :{f}_ages), '{w}')" if f == "ages"
+            else f"setweight(to_tsvector('french', :{f}), '{w}')"
+            for f, w in self.weights
+        )
+        params = {f"{f}_ages" if f == "ages" else f: fields[f] for f, _ in self.weights}
+        conn.execute(text(f"UPDATE shows SET search_vector = {vector} WHERE id = :id"), {**params, "id": show_id})
+
+    def delete(self, conn, show_id: int) -> None:
+        pass  # La colonne disparaît avec la ligne
+
+    def clear(self, conn) -> None:
+        conn.execute(text("UPDATE shows SET search_vector = NULL"))
+
+    def apply(self, query, terms, age_groups):
+        parts = [f"{t}:*" for t in terms]
+        parts += ["(" + " | ".join(group) + ")" for group in age_groups]
+        tsquery = func.to_tsquery("french", " & ".join(parts))
+        vector = literal_column("shows.search_vector")
+        query = query.filter(vector.op("@@")(tsquery))
+        return query, func.ts_rank_cd(vector, tsquery).desc()
+
+
+class SQLiteSearch:
+    name = "sqlite-fts5"
+    columns = ("title", "category", "location", "body", "ages")
+
+    def ensure_schema(self, conn) -> None:
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS shows_fts USING fts5("
+            "title, category, location, body, ages, tokenize='unicode61 remove_diacritics 2')"
+        ))
+
+    def missing_count(self, conn) -> int:
+        return conn.execute(text(
+            "SELECT COUNT(*) FROM shows WHERE id NOT IN (SELECT rowid FROM shows_fts)"
+        )).scalar()
+
+    def index(self, conn, show_id: int, fields: dict) -> None:
+        conn.execute(text("DELETE FROM shows_fts WHERE rowid = :id"), {"id": show_id})
+        conn.execute(text(
+            "INSERT INTO shows_fts (rowid, title, category, location, body, ages) "
+            "VALUES (:id, :title, :category, :location, :body, :ages)"
+        ), {"id": show_id, **fields})
+
+    def delete(self, conn, show_id: int) -> None:
+        conn.execute(text("DELETE FROM shows_fts WHERE rowid = :id"), {"id": show_id})
+
+    def clear(self, conn) -> None:
+        conn.execute(text("DELETE FROM shows_fts"))
+
+    def apply(self, query, terms, age_groups):
+        parts = [f"{t}*" for t in terms]
+        parts += ["(" + " OR ".join(group) + ")" for group in age_groups]
+        query = query.join(shows_fts, shows_fts.c.rowid == Show.id).filter(
+            shows_fts.c.shows_fts.op("MATCH")(" AND ".join(parts))
+        )
+        # bm25 : plus petit = plus pertinent ; poids titre > catégorie > lieu/âges > description
+        return query, literal_column("bm25(shows_fts, 10.0, 5.0, 3.0, 1.0, 3.0)").asc()
+
+
+_backend = None
+
+
+def get_backend():
+    return _backend
+
+
+def init_search(app) -> None:
+    """Crée l'index si besoin, le complète au démarrage et branche sa mise à jour automatique."""
+    global _backend
+    dialect = db.engine.dialect.name
+    backend = PostgresSearch() if dialect == "postgresql" else SQLiteSearch() if dialect == "sqlite" else None
+    if backend is None:
+        app.logger.info(f"[SEARCH] Pas d'index plein texte pour {dialect} : recherche ILIKE")
+        return
+    try:
+        with db.engine.begin() as conn:
+            backend.ensure_schema(conn)
+            missing = backend.missing_count(conn)
+        _backend = backend
+        if missing:
+            count = rebuild_index()
+            app.logger.info(f"[SEARCH] Index plein texte ({backend.name}) reconstruit : {count} spectacles")
+    except Exception as e:
+        _backend = None
+        app.logger.warning(f"[SEARCH] Index plein texte indisponible ({backend.name}), recherche ILIKE : {e}")
+
+
+def rebuild_index() -> int:
+    """Réindexe tous les spectacles. Retourne le nombre de spectacles indexés."""
+    backend = _backend
+    if backend is None:
+        return 0
+    shows = Show.query.all()
+    with db.engine.begin() as conn:
+        backend.clear(conn)
+        for show in shows:
+            backend.index(conn, show.id, document_fields(show))
+    return len(shows)
+
+
+@event.listens_for(Show, "after_insert")
+@event.listens_for(Show, "after_update")
+def _index_show(mapper, connection, show):
+    if _backend is not None:
+        _backend.index(connection, show.id, document_fields(show))
+
+
+@event.listens_for(Show, "after_delete")
+def _unindex_show(mapper, connection, show):
+    if _backend is not None:
+        _backend.delete(connection, show.id)
+
+
+# -----------------------------------------------------
+# Requêtes
+# -----------------------------------------------------
+def apply_search(query, q: str):
+    """
+    Filtre ``query`` (sur Show) par la recherche ``q``.
+    Retourne (query, critère de tri par pertinence ou None).
+    """
+    if _backend is None:
+        return query.filter(legacy_filter(q)), None
+    terms, age_groups = parse_query(q)
+    if not terms and not age_groups:
+        return query, None
+    return _backend.apply(query, terms, age_groups)
+
+
+def legacy_filter(q: str):
+    """Ancienne recherche ILIKE (titre, description, lieu, catégorie, email, variantes d'âges)."""
+    like = f"%{q}%"
+
+    variants = {q}
+    if any(c.isdigit() for c in q):
+        cleaned = q.lower().replace("ans", "").strip()
+        seps = [" - ", "-", "—", "–", "à", "a", "/", " "]
+        norm = cleaned
+        for sep in seps:
+            norm = norm.replace(sep, "/")
+
+        variants.update({
+            cleaned,
+            cleaned.replace(" ", ""),
+            cleaned.replace("-", "/"),
+            cleaned.replace("/", "-"),
+            cleaned.replace(" ", "-"),
+            cleaned.replace(" ", "/"),
+            norm,
+            norm.replace("/", "-"),
+            norm.replace("/", ""),
+        })
+
+    conditions = [
+        Show.title.ilike(like),
+        Show.description.ilike(like),
+        Show.location.ilike(like),
+        Show.category.ilike(like),
+        Show.contact_email.ilike(like),
+    ]
+    for v in {v for v in variants if v}:
+        v_like = f"%{v}%"
+        conditions.append(Show.age_range.ilike(v_like))
+        conditions.append(Show.description.ilike(v_like))
+    return or_(*conditions)
@@ -0,0 +1,174 @@
+"""
+Étiquettes normalisées des spectacles : catégories et villes.
+
+``Show.category`` et ``Show.location`` restent des champs texte libres
+(« Magie, Spectacle enfant », « Lyon | Villeurbanne ») saisis par les
+compagnies. Chaque écriture d'un spectacle les découpe en étiquettes
+stockées dans ``category`` / ``city`` (une ligne par libellé, clé ``slug``
+sans accents) et reliées au spectacle par ``show_category`` / ``show_city``.
+
+Les filtres (catalogue, pages SEO, villes, envoi des appels d'offres)
+passent par ``category_filter`` / ``city_filter`` : le terme est cherché
+dans le petit dictionnaire des étiquettes, puis les spectacles sont
+atteints par l'index de la table d'association, au lieu d'un
+``ILIKE '%terme%'`` sur toutes les lignes de ``shows``.
+"""
+import re
+
+from sqlalchemy import event, false, inspect, or_, select
+
+from catalogue_search import strip_accents
+from models import db
+from models.models import Category, City, Show, show_category, show_city
+
+
+SEPARATORS = re.compile(r"[,;|\n]+")
+
+# type d'étiquette → (colonne source de Show, modèle, table d'association, colonne de la clé)
+KINDS = {
+    "category": ("category", Category, show_category, "category_id"),
+    "city": ("location", City, show_city, "city_id"),
+}
+
+
+def slugify(value: str) -> str:
+    value = strip_accents((value or "").lower())
+    return re.sub(r"[^a-z0-9]+", "-", value).strip("-")
+
+
+def split_tags(value: str) -> dict:
+    """« Magie, Spectacle enfant » → {"magie": "Magie", "spectacle-enfant": "Spectacle enfant"}"""
+    tags = {}
+    for part in SEPARATORS.split(value or ""):
+        name = " ".join(part.split())[:200]
+        slug = slugify(name)[:200]
+        if slug and slug not in tags:
+            tags[slug] = name
+    return tags
+
+
+def _insert_ignore(conn, table, rows) -> None:
+    """INSERT ... ON CONFLICT DO NOTHING (plusieurs workers peuvent créer la même étiquette)."""
+    if not rows:
+        return
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.exc import IntegrityError
+        for row in rows:
+            try:
+                with conn.begin_nested():
+                    conn.execute(table.insert().values(**row))
+            except IntegrityError:
+                pass
+        return
+    conn.execute(insert(table).on_conflict_do_nothing(), rows)
+
+
+def sync_show_tags(conn, show_id: int, kind: str, raw_value: str) -> None:
+    """Remplace les étiquettes ``kind`` du spectacle par celles de ``raw_value``."""
+    _, model, assoc, key = KINDS[kind]
+    tags = split_tags(raw_value)
+    tag_ids = []
+    if tags:
+        _insert_ignore(conn, model.__table__, [{"slug": slug, "name": name} for slug, name in tags.items()])
+        tag_ids = list(conn.execute(
+            select(model.__table__.c.id).where(model.__table__.c.slug.in_(list(tags)))
+        ).scalars())
+
+    delete = assoc.delete().where(assoc.c.show_id == show_id)
+    if tag_ids:
+        delete = delete.where(assoc.c[key].notin_(tag_ids))
+    conn.execute(delete)
+    _insert_ignore(conn, assoc, [{"show_id": show_id, key: tag_id} for tag_id in tag_ids])
+
+
+@event.listens_for(Show, "after_insert")
+def _tag_new_show(mapper, connection, show):
+    for kind, (column, _, _, _) in KINDS.items():
+        sync_show_tags(connection, show.id, kind, getattr(show, column))
+
+
+@event.listens_for(Show, "after_update")
+def _retag_show(mapper, connection, show):
+    state = inspect(show)
+    for kind, (column, _, _, _) in KINDS.items():
+        if state.attrs[column].history.has_changes():
+            sync_show_tags(connection, show.id, kind, getattr(show, column))
+
+
+@event.listens_for(Show, "after_delete")
+def _untag_show(mapper, connection, show):
+    # ON DELETE CASCADE n'est pas appliqué par SQLite sans PRAGMA foreign_keys
+    for _, _, assoc, _ in KINDS.values():
+        connection.execute(assoc.delete().where(assoc.c.show_id == show.id))
+
+
+# -----------------------------------------------------
+# Filtres
+# -----------------------------------------------------
+def _tag_filter(kind: str, terms):
+    _, model, assoc, key = KINDS[kind]
+    slugs = [slug for slug in (slugify(term) for term in terms) if slug]
+    if not slugs:
+        return false()
+    # Sous-requête sur le dictionnaire des étiquettes (quelques centaines de lignes),
+    # puis jointure par l'index (category_id, show_id)
+    matching = select(model.id).where(or_(*[model.slug.contains(slug) for slug in slugs]))
+    return Show.id.in_(select(assoc.c.show_id).where(assoc.c[key].in_(matching)))
+
+
+def category_filter(*terms):
+    """Spectacles ayant une catégorie contenant l'un des termes (« enfant » → « Spectacle enfant »)."""
+    return _tag_filter("category", terms)
+
+
+def city_filter(*terms):
+    """Spectacles associés à une ville contenant l'un des termes (« saint-etienne » → « Saint-Étienne »)."""
+    return _tag_filter("city", terms)
+
+
+# -----------------------------------------------------
+# Remplissage initial
+# -----------------------------------------------------
+def missing_count(conn) -> int:
+    """Spectacles dont la catégorie ou le lieu n'a pas encore été découpé en étiquettes."""
+    shows = Show.__table__
+    query = select(db.func.count()).select_from(shows).where(or_(
+        (shows.c.category.isnot(None)) & (shows.c.category != "")
+        & shows.c.id.notin_(select(show_category.c.show_id)),
+        (shows.c.location.isnot(None)) & (shows.c.location != "")
+        & shows.c.id.notin_(select(show_city.c.show_id)),
+    ))
+    return conn.execute(query).scalar()
+
+
+def backfill_tags(conn, only_missing: bool = False) -> int:
+    """Découpe category / location de chaque spectacle en étiquettes. Retourne le nombre de spectacles traités."""
+    shows = Show.__table__
+    query = select(shows.c.id, shows.c.category, shows.c.location)
+    if only_missing:
+        query = query.where(or_(
+            shows.c.id.notin_(select(show_category.c.show_id)),
+            shows.c.id.notin_(select(show_city.c.show_id)),
+        ))
+    count = 0
+    for show_id, category, location in conn.execute(query).all():
+        sync_show_tags(conn, show_id, "category", category)
+        sync_show_tags(conn, show_id, "city", location)
+        count += 1
+    return count
+
+
+def init_tags(app) -> None:
+    """Complète les étiquettes au démarrage si des spectacles n'en ont pas encore (première mise en production)."""
+    try:
+        with db.engine.begin() as conn:
+            if missing_count(conn):
+                count = backfill_tags(conn, only_missing=True)
+                app.logger.info(f"[TAGS] Étiquettes catégories/villes créées pour {count} spectacle(s)")
+    except Exception as e:
+        app.logger.warning(f"[TAGS] Remplissage des étiquettes impossible : {e}")
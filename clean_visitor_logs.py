@@ -3,32 +3,65 @@ Script de nettoyage des données de tracking (Conformité RGPD)
 Supprime automatiquement les données de visite de plus de 30 jours.
 
 À exécuter régulièrement (quotidien recommandé) via cron ou planificateur de tâches.
+La suppression se fait par tranches (voir visitor_retention.py) : le script peut
+être interrompu sans risque, le passage suivant reprend là où il s'est arrêté.
+L'application lance aussi cette purge toutes les 6h (RETENTION_SCHEDULER_ENABLED).
+
+Options :
+    --days N          Durée de conservation (défaut : RETENTION_DAYS, 30)
+    --chunk-size N    Lignes supprimées par tranche (défaut : RETENTION_CHUNK_SIZE, 5000)
+    --max-chunks N    Arrêter après N tranches (reprise au prochain passage)
+    --dry-run         Compter seulement, ne rien supprimer
 """
-from app import app, db
-from models.models import VisitorLog
-from datetime import datetime, timedelta
+import argparse
+from datetime import datetime
+
+from app import app
+import visitor_retention
+
 
-def clean_old_visitor_logs(days=30):
-    """Supprime les logs de visiteurs de plus de X jours"""
+def clean_old_visitor_logs(days=30, chunk_size=5000, max_chunks=None, dry_run=False):
+    """Supprime les logs de visiteurs de plus de X jours, par tranches"""
     with app.app_context():
-        # Calculer la date limite
-        date_limit = datetime.utcnow() - timedelta(days=days)
-        
-        # Compter les enregistrements à supprimer
-        old_logs = VisitorLog.query.filter(VisitorLog.visited_at < date_limit).all()
-        count = len(old_logs)
-        
-        if count == 0:
+        if visitor_retention.is_partitioned():
+            created = visitor_retention.ensure_partitions(app.config.get("RETENTION_PARTITIONS_AHEAD", 2))
+            for name in created:
+                print(f"🧱 Partition créée : {name}")
+
+        result = visitor_retention.purge_expired(
+            days=days,
+            chunk_size=chunk_size,
+            max_chunks=max_chunks,
+            pause=app.config.get("RETENTION_CHUNK_PAUSE", 0.1),
+            dry_run=dry_run,
+        )
+
+        if result["user_stats"]:
+            print(f"🕶️  {result['user_stats']} statistiques par utilisateur supprimées (plus de {days} jours).")
+        if result["expired"] == 0:
             print(f"✅ Aucune donnée de plus de {days} jours à supprimer.")
             return
-        
-        # Supprimer les anciens logs
-        VisitorLog.query.filter(VisitorLog.visited_at < date_limit).delete()
-        db.session.commit()
-        
-        print(f"✅ {count} enregistrements de plus de {days} jours supprimés.")
+
+        if dry_run:
+            print(f"ℹ️  {result['expired']} enregistrements de plus de {days} jours seraient supprimés (dry-run).")
+            return
+
+        for name in result["partitions"]:
+            print(f"🗑️  Partition supprimée : {name}")
+        print(f"✅ {result['deleted']} enregistrements de plus de {days} jours supprimés "
+              f"({result['chunks']} tranche(s), {result['elapsed_s']}s).")
+        if not result["complete"]:
+            print("⏸️  Purge interrompue (--max-chunks) : relancer le script pour continuer.")
         print(f"📊 Conformité RGPD : Données nettoyées le {datetime.utcnow().strftime('%d/%m/%Y %H:%M:%S')}")
 
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Purge RGPD de visitor_log")
+    parser.add_argument("--days", type=int, default=app.config.get("RETENTION_DAYS", 30))
+    parser.add_argument("--chunk-size", type=int, default=app.config.get("RETENTION_CHUNK_SIZE", 5000))
+    parser.add_argument("--max-chunks", type=int, default=None)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
     print("🗑️  Nettoyage des données de tracking...")
-    clean_old_visitor_logs(30)  # Supprimer les données de plus de 30 jours
+    clean_old_visitor_logs(args.days, args.chunk_size, args.max_chunks, args.dry_run)
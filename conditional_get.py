@@ -0,0 +1,130 @@
+"""
+Requêtes conditionnelles (ETag / Last-Modified → 304) des pages du catalogue.
+
+Chaque vue déclare sa source de fraîcheur : une fonction appelée avec les
+arguments de la route, qui retourne un ``Validator`` sans rien rendre.
+
+- ``catalogue_validator`` : version du catalogue et date de la dernière
+  écriture (table cache_version, voir catalogue_cache.CatalogueVersion) ;
+  listes, pages villes, sitemap.
+- ``show_validator`` : ligne du spectacle (updated_at) et version du
+  catalogue (la fiche affiche aussi les spectacles à la une).
+
+L'ETag (fort) est une empreinte de la source, de l'URL et de
+``CONDITIONAL_ETAG_SALT`` (révision déployée : une nouvelle version des
+templates change les ETag). Si le client présente un ETag identique
+(If-None-Match) ou, à défaut, une date If-Modified-Since postérieure à la
+dernière modification, la réponse est un 304 vide sans exécuter la vue.
+Les réponses 200 portent ETag, Last-Modified et ``Cache-Control: no-cache``
+(le navigateur revalide à chaque affichage).
+
+Uniquement pour les visiteurs anonymes sans message flash en attente : le
+HTML des utilisateurs connectés est personnalisé.
+
+Usage (sous @app.route, au-dessus de @page_cache.cached) :
+    @conditional(show_validator)
+"""
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+from typing import NamedTuple, Optional
+
+from flask import current_app, make_response, request
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+from media import generation_started_at, url_generation
+from models import db
+from models.models import Show
+from page_cache import is_anonymous_request
+
+
+class Validator(NamedTuple):
+    """Valeurs dont dépend le contenu de la page, et date de leur dernière modification (UTC)."""
+    parts: tuple
+    last_modified: Optional[datetime] = None
+
+
+# ---------------------------
+# Sources de fraîcheur
+# ---------------------------
+def catalogue_validator(**_view_args) -> Validator:
+    version, changed_at = current_app.extensions["catalogue_version"].get()
+    return Validator(("catalogue", version), changed_at)
+
+
+def show_validator(show_id: int, **_view_args) -> Optional[Validator]:
+    row = db.session.execute(
+        select(Show.approved, Show.updated_at).where(Show.id == show_id)
+    ).first()
+    if row is None or not row.approved:
+        return None  # 404 / redirection gérées par la vue
+    version, changed_at = current_app.extensions["catalogue_version"].get()
+    dates = [value for value in (row.updated_at, changed_at) if value]
+    return Validator(("show", show_id, row.updated_at, version), max(dates) if dates else None)
+
+
+# ---------------------------
+# Validation
+# ---------------------------
+def compute_etag(validator: Validator) -> str:
+    salt = current_app.config.get("CONDITIONAL_ETAG_SALT", "")
+    # La fenêtre des URL présignées des images (voir media.py) change l'ETag : une page
+    # revalidée (304) ne garde pas des URL d'images expirées
+    media_generation = str(url_generation(current_app))
+    raw = "|".join([salt, media_generation, request.host, request.full_path, *map(str, validator.parts)])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _etag_matches(etag: str) -> bool:
+    if_none_match = request.if_none_match
+    if if_none_match.star_tag:
+        return True
+    # Flask-Compress suffixe les ETag forts par l'algorithme utilisé (« abc:gzip »)
+    return any(tag == etag or tag.startswith(etag + ":") for tag in if_none_match)
+
+
+def is_not_modified(etag: str, last_modified: Optional[datetime]) -> bool:
+    if request.if_none_match:
+        return _etag_matches(etag)  # If-Modified-Since est ignoré en présence d'If-None-Match
+    since = request.if_modified_since
+    if last_modified is None or since is None:
+        return False
+    # Last-Modified est envoyé à la seconde près
+    return last_modified.replace(microsecond=0, tzinfo=timezone.utc) <= since
+
+
+def conditional(validator_func):
+    """Décorateur de vue : répond 304 si le client a déjà la version courante de la page."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ("GET", "HEAD") or not is_anonymous_request():
+                return view(*args, **kwargs)
+            try:
+                validator = validator_func(**kwargs)
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                current_app.logger.warning(f"[HTTP_CACHE] Source de fraîcheur illisible ({request.path}): {e}")
+                validator = None
+            if validator is None:
+                return view(*args, **kwargs)
+
+            etag = compute_etag(validator)
+            # Pas plus ancien que la fenêtre courante des URL présignées (clients sans If-None-Match)
+            last_modified = max(
+                (d for d in (validator.last_modified, generation_started_at(current_app)) if d), default=None
+            )
+            if is_not_modified(etag, last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
@@ -58,10 +58,80 @@ class Config:
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = "Lax"
     
+    # Durée de validité de l'identité mise en cache dans la session (voir auth_identity.py)
+    IDENTITY_CACHE_TTL = int(os.environ.get("IDENTITY_CACHE_TTL", 60))
+    
     # En production, forcer HTTPS
     if os.environ.get("FLASK_ENV") == "production":
         SESSION_COOKIE_SECURE = True
 
+    # Tracking des visiteurs : file bornée + écriture par lots (voir visitor_tracking.py)
+    # TRACKING_ASYNC=False pour écrire immédiatement (scripts, tests)
+    TRACKING_ASYNC = os.environ.get("TRACKING_ASYNC", "True") == "True"
+    TRACKING_QUEUE_SIZE = int(os.environ.get("TRACKING_QUEUE_SIZE", 5000))
+    TRACKING_BATCH_SIZE = int(os.environ.get("TRACKING_BATCH_SIZE", 100))
+    TRACKING_FLUSH_INTERVAL = float(os.environ.get("TRACKING_FLUSH_INTERVAL", 5))
+
+    # Géolocalisation IP (voir geolocation.py)
+    GEO_CACHE_SIZE = int(os.environ.get("GEO_CACHE_SIZE", 10000))           # entrées LRU par worker
+    GEO_CACHE_TTL = int(os.environ.get("GEO_CACHE_TTL", 86400))             # 24h en mémoire
+    GEO_PERSISTENT_TTL = int(os.environ.get("GEO_PERSISTENT_TTL", 30 * 86400))  # 30 jours sur disque
+    GEO_CACHE_PATH = os.environ.get("GEO_CACHE_PATH")                       # défaut : instance/geo_cache.sqlite
+    GEO_OFFLINE_DB = os.environ.get("GEO_OFFLINE_DB")                       # CSV de plages d'IP (optionnel)
+    GEO_ONLINE_LOOKUP = os.environ.get("GEO_ONLINE_LOOKUP", "True") == "True"
+
+    # Détection des robots (voir bot_detection.py)
+    BOT_PATTERNS_FILE = os.environ.get("BOT_PATTERNS_FILE")                 # défaut : bot_patterns.json
+    BOT_CACHE_SIZE = int(os.environ.get("BOT_CACHE_SIZE", 4096))            # verdicts mémorisés par UA
+    BOT_PATTERNS_RELOAD_INTERVAL = float(os.environ.get("BOT_PATTERNS_RELOAD_INTERVAL", 60))
+
+    # Statistiques pré-agrégées (voir visitor_stats.py / aggregate_daily_stats.py)
+    # Délai avant de figer une heure close (laisse le tracking asynchrone finir d'écrire)
+    STATS_AGGREGATION_GRACE = int(os.environ.get("STATS_AGGREGATION_GRACE", 300))
+    # Durée de mise en cache de la page /admin/statistiques par période (secondes)
+    STATS_CACHE_TTL = int(os.environ.get("STATS_CACHE_TTL", 60))
+    # Fenêtre des « derniers visiteurs » (heures, lue sur les lignes brutes)
+    STATS_RECENT_VISITORS_HOURS = int(os.environ.get("STATS_RECENT_VISITORS_HOURS", 24))
+
+    # Purge RGPD de visitor_log (voir visitor_retention.py / clean_visitor_logs.py)
+    RETENTION_DAYS = int(os.environ.get("RETENTION_DAYS", 30))
+    RETENTION_CHUNK_SIZE = int(os.environ.get("RETENTION_CHUNK_SIZE", 5000))     # lignes par DELETE
+    RETENTION_CHUNK_PAUSE = float(os.environ.get("RETENTION_CHUNK_PAUSE", 0.1))  # pause entre tranches (s)
+    RETENTION_SCHEDULER_ENABLED = os.environ.get("RETENTION_SCHEDULER_ENABLED", "True") == "True"
+    RETENTION_INTERVAL = int(os.environ.get("RETENTION_INTERVAL", 6 * 3600))      # une purge toutes les 6h
+    RETENTION_PARTITIONS_AHEAD = int(os.environ.get("RETENTION_PARTITIONS_AHEAD", 2))  # mois pré-créés (PostgreSQL partitionné)
+
+    # Compteurs de visites par page (voir page_counters.py) : délai entre deux écritures en base
+    # 0 = écriture immédiate (scripts, tests)
+    PAGE_COUNTER_FLUSH_INTERVAL = float(os.environ.get("PAGE_COUNTER_FLUSH_INTERVAL", 10))
+
+    # Caches du catalogue (voir catalogue_cache.py) : vidés à chaque écriture sur un spectacle,
+    # le TTL fait converger les autres workers gunicorn
+    FEATURED_SHOWS_CACHE_TTL = int(os.environ.get("FEATURED_SHOWS_CACHE_TTL", 300))
+    FACETS_CACHE_TTL = int(os.environ.get("FACETS_CACHE_TTL", 300))  # listes catégories/lieux + effectifs
+
+    # Pagination par clé (voir keyset_pagination.py) : pages numérotées ?page=N pour les premières
+    # pages (SEO), curseurs au-delà ; total plafonné (« 1000+ résultats »)
+    PAGINATION_LINK_PAGES = int(os.environ.get("PAGINATION_LINK_PAGES", 5))
+    PAGINATION_COUNT_CAP = int(os.environ.get("PAGINATION_COUNT_CAP", 1000))
+
+    # Cache des pages publiques pour les visiteurs anonymes (voir page_cache.py) : LRU par worker,
+    # fichier SQLite partagé optionnel ; invalidé par la version du catalogue (relue toutes les N s)
+    PAGE_CACHE_ENABLED = os.environ.get("PAGE_CACHE_ENABLED", "True") == "True"
+    PAGE_CACHE_TTL = int(os.environ.get("PAGE_CACHE_TTL", 300))
+    PAGE_CACHE_MAX_ENTRIES = int(os.environ.get("PAGE_CACHE_MAX_ENTRIES", 500))
+    PAGE_CACHE_SHARED_PATH = os.environ.get("PAGE_CACHE_SHARED_PATH")  # ex. /tmp/page_cache.sqlite
+    PAGE_CACHE_VERSION_CHECK_INTERVAL = float(os.environ.get("PAGE_CACHE_VERSION_CHECK_INTERVAL", 1))
+
+    # Requêtes conditionnelles ETag / Last-Modified (voir conditional_get.py) : révision déployée
+    # incluse dans les ETag pour qu'un changement de templates les invalide
+    CONDITIONAL_ETAG_SALT = os.environ.get("CONDITIONAL_ETAG_SALT") or os.environ.get("RENDER_GIT_COMMIT", "")
+
+    # Sitemap (voir sitemap.py) : index + fichiers par section au-delà de SITEMAP_MAX_URLS URL,
+    # régénéré après chaque écriture sur le catalogue
+    SITEMAP_MAX_URLS = int(os.environ.get("SITEMAP_MAX_URLS", 50000))
+    SITEMAP_CACHE_TTL = int(os.environ.get("SITEMAP_CACHE_TTL", 86400))
+
     # Configuration Amazon S3 (chargée depuis .env ou variables d'environnement)
     S3_BUCKET = os.environ.get("S3_BUCKET")
     S3_KEY = os.environ.get("S3_KEY")
@@ -69,6 +139,42 @@ class Config:
     S3_REGION = os.environ.get("S3_REGION")
     S3_CUSTOM_DOMAIN = os.environ.get("S3_CUSTOM_DOMAIN")
 
+    # Client S3 partagé (voir s3_storage.py) : pool de connexions, tentatives et délais de botocore
+    S3_MAX_POOL_CONNECTIONS = int(os.environ.get("S3_MAX_POOL_CONNECTIONS", 20))
+    S3_MAX_ATTEMPTS = int(os.environ.get("S3_MAX_ATTEMPTS", 3))
+    S3_CONNECT_TIMEOUT = float(os.environ.get("S3_CONNECT_TIMEOUT", 3))
+    S3_READ_TIMEOUT = float(os.environ.get("S3_READ_TIMEOUT", 10))
+
+    # URL des fichiers uploadés dans les templates (voir media.py) : "auto" = S3_CUSTOM_DOMAIN si défini,
+    # sinon URL présignées ; "proxy" = relais par /uploads (bucket privé sans URL présignées)
+    MEDIA_URL_MODE = os.environ.get("MEDIA_URL_MODE", "auto")
+    MEDIA_PRESIGN_EXPIRES = int(os.environ.get("MEDIA_PRESIGN_EXPIRES", 6 * 3600))
+    MEDIA_PRESIGN_MARGIN = int(os.environ.get("MEDIA_PRESIGN_MARGIN", 3600))  # > PAGE_CACHE_TTL
+    MEDIA_URL_CACHE_SIZE = int(os.environ.get("MEDIA_URL_CACHE_SIZE", 20000))  # une entrée par largeur d'image
+    # Relais /uploads en mode proxy : cache des head_object (304 sans lire S3), taille des morceaux lus
+    MEDIA_PROXY_HEAD_TTL = int(os.environ.get("MEDIA_PROXY_HEAD_TTL", 300))
+    MEDIA_PROXY_HEAD_CACHE_SIZE = int(os.environ.get("MEDIA_PROXY_HEAD_CACHE_SIZE", 2000))
+    MEDIA_PROXY_CHUNK_SIZE = int(os.environ.get("MEDIA_PROXY_CHUNK_SIZE", 64 * 1024))
+
+    # Conversion WebP des images uploadées en arrière-plan (voir image_jobs.py) : processus du pool
+    # par worker gunicorn (0 = conversion dans la requête), reprise des tâches abandonnées
+    IMAGE_JOB_WORKERS = int(os.environ.get("IMAGE_JOB_WORKERS", 1))
+    IMAGE_JOB_START_METHOD = os.environ.get("IMAGE_JOB_START_METHOD", "spawn")
+    IMAGE_JOB_MAX_ATTEMPTS = int(os.environ.get("IMAGE_JOB_MAX_ATTEMPTS", 3))
+    IMAGE_JOB_STALE_AFTER = int(os.environ.get("IMAGE_JOB_STALE_AFTER", 600))
+    IMAGE_JOB_SWEEP_INTERVAL = int(os.environ.get("IMAGE_JOB_SWEEP_INTERVAL", 60))
+    IMAGE_JOB_KEEP_ORIGINALS = os.environ.get("IMAGE_JOB_KEEP_ORIGINALS", "False") == "True"
+    IMAGE_WEBP_QUALITY = int(os.environ.get("IMAGE_WEBP_QUALITY", 85))
+    # Largeurs des dérivés (srcset) ; la plus grande remplace l'original dans la fiche du spectacle
+    IMAGE_WIDTHS = tuple(int(w) for w in os.environ.get("IMAGE_WIDTHS", "320,640,1024,1920").split(","))
+    # Images refusées avant décodage au-delà de ce nombre de pixels (lu dans l'en-tête, voir image_processing.py)
+    IMAGE_MAX_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", 25_000_000))
+    # Fichiers adressés par leur contenu (voir media_refs.py) : un fichier sans référence est supprimé
+    # (S3 et local) après MEDIA_GC_GRACE secondes, par un passage toutes les MEDIA_GC_INTERVAL secondes (0 = jamais)
+    MEDIA_GC_GRACE = int(os.environ.get("MEDIA_GC_GRACE", 24 * 3600))
+    MEDIA_GC_INTERVAL = int(os.environ.get("MEDIA_GC_INTERVAL", 3600))
+    MEDIA_GC_BATCH_SIZE = int(os.environ.get("MEDIA_GC_BATCH_SIZE", 500))
+
     # Ajout de toutes les variables du .env pour accès via app.config
     # (si d'autres variables sont ajoutées dans .env, les ajouter ici)
     # Exemple :
@@ -0,0 +1,415 @@
+"""
+Géolocalisation IP avec cache à deux niveaux (conforme RGPD).
+
+Les recherches sont indexées par préfixe anonymisé (/16 en IPv4, /32 en IPv6) :
+l'IP brute n'est jamais envoyée à un service externe ni écrite sur disque.
+
+Ordre de résolution :
+    1. LRU en mémoire (par worker) avec TTL
+    2. Cache SQLite sur disque, partagé entre les workers gunicorn et
+       conservé après un redémarrage
+    3. Backends, dans l'ordre : base locale de plages d'IP (GEO_OFFLINE_DB,
+       fichier CSV, aucune requête réseau) puis ip-api.com (GEO_ONLINE_LOOKUP)
+
+Les taux de hit et la latence de chaque backend sont exposés par stats().
+"""
+import bisect
+import csv
+import ipaddress
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+
+EMPTY_GEO = {'city': None, 'region': None, 'country': None, 'isp': None}
+
+
+def anonymize_prefix(ip_address: str) -> str | None:
+    """Retourne l'adresse réseau anonymisée (ex: 192.168.0.0) ou None si l'IP est invalide."""
+    try:
+        ip = ipaddress.ip_address((ip_address or "").strip())
+    except ValueError:
+        return None
+    prefix = 16 if ip.version == 4 else 32
+    return str(ipaddress.ip_network(f"{ip}/{prefix}", strict=False).network_address)
+
+
+class LRUCache:
+    """LRU bornée avec expiration (thread-safe)."""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 86400):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float | None = None) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class PersistentGeoCache:
+    """Cache SQLite partagé entre workers (une connexion par thread et par processus)."""
+
+    def __init__(self, path: str, ttl: float = 30 * 86400):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS geo_cache (
+                    prefix TEXT PRIMARY KEY,
+                    city TEXT, region TEXT, country TEXT, isp TEXT,
+                    resolved_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rate_window (
+                    name TEXT PRIMARY KEY,
+                    minute INTEGER NOT NULL,
+                    count INTEGER NOT NULL
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _conn(self) -> sqlite3.Connection:
+        # Nouvelle connexion après un fork (les connexions SQLite ne se partagent pas)
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.conn = self._connect()
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def get(self, prefix: str):
+        row = self._conn().execute(
+            "SELECT city, region, country, isp, resolved_at FROM geo_cache WHERE prefix = ?",
+            (prefix,),
+        ).fetchone()
+        if not row or row[4] + self.ttl < time.time():
+            return None
+        return {'city': row[0], 'region': row[1], 'country': row[2], 'isp': row[3]}
+
+    def set(self, prefix: str, geo: dict) -> None:
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO geo_cache (prefix, city, region, country, isp, resolved_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (prefix, geo['city'], geo['region'], geo['country'], geo['isp'], time.time()),
+        )
+        conn.commit()
+
+    def take_slot(self, name: str, per_minute: int) -> bool:
+        """
+        Réserve un appel dans la minute en cours pour ``name``, tous workers
+        confondus (un seul UPSERT conditionnel, atomique). False si le quota est atteint.
+        """
+        conn = self._conn()
+        minute = int(time.time() // 60)
+        taken = conn.execute(
+            "INSERT INTO rate_window (name, minute, count) VALUES (?, ?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET "
+            "count = CASE WHEN minute = excluded.minute THEN count + 1 ELSE 1 END, minute = excluded.minute "
+            "WHERE minute != excluded.minute OR count < ?",
+            (name, minute, per_minute),
+        ).rowcount
+        conn.commit()
+        return taken == 1
+
+
+# -----------------------------------------------------
+# Backends
+# -----------------------------------------------------
+class OfflineRangeBackend:
+    """
+    Base locale de plages d'IP chargée depuis un CSV (recherche par dichotomie).
+
+    Le fichier doit avoir une ligne d'en-tête. Colonnes reconnues :
+      - début de plage : ip_start, ip_from, start
+      - fin de plage   : ip_end, ip_to, end
+      - country / country_name, region / region_name / stateprov,
+        city / city_name, isp / organization (optionnelles)
+    Les bornes peuvent être des adresses (1.2.3.0) ou des entiers
+    (formats DB-IP lite et IP2Location LITE).
+    """
+    name = "offline"
+
+    _ALIASES = {
+        'start': ('ip_start', 'ip_from', 'start'),
+        'end': ('ip_end', 'ip_to', 'end'),
+        'country': ('country', 'country_name'),
+        'region': ('region', 'region_name', 'stateprov'),
+        'city': ('city', 'city_name'),
+        'isp': ('isp', 'organization', 'org'),
+    }
+
+    def __init__(self, path: str):
+        self.path = path
+        self._starts = []
+        self._ranges = []
+        self._load()
+
+    @staticmethod
+    def _to_int(value: str) -> int:
+        value = value.strip()
+        return int(value) if value.isdigit() else int(ipaddress.ip_address(value))
+
+    def _load(self) -> None:
+        with open(self.path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            fields = {name.lower(): name for name in (reader.fieldnames or [])}
+            columns = {
+                key: next((fields[a] for a in aliases if a in fields), None)
+                for key, aliases in self._ALIASES.items()
+            }
+            if not (columns['start'] and columns['end']):
+                raise ValueError(f"{self.path}: colonnes de début/fin de plage introuvables")
+            rows = []
+            for row in reader:
+                try:
+                    start = self._to_int(row[columns['start']])
+                    end = self._to_int(row[columns['end']])
+                except (ValueError, KeyError):
+                    continue
+                geo = {
+                    key: (row.get(columns[key]) or None) if columns[key] else None
+                    for key in ('city', 'region', 'country', 'isp')
+                }
+                rows.append((start, end, geo))
+        rows.sort(key=lambda r: r[0])
+        self._starts = [r[0] for r in rows]
+        self._ranges = rows
+
+    def lookup(self, address: str):
+        target = int(ipaddress.ip_address(address))
+        idx = bisect.bisect_right(self._starts, target) - 1
+        if idx >= 0:
+            start, end, geo = self._ranges[idx]
+            if start <= target <= end:
+                return dict(geo)
+        return None
+
+    def __len__(self) -> int:
+        return len(self._ranges)
+
+
+class IpApiBackend:
+    """
+    API gratuite ip-api.com (45 requêtes/minute sans clé, par adresse IP du serveur).
+
+    Le quota est compté dans le cache SQLite partagé (``limiter``) : il vaut pour
+    tous les workers gunicorn de la machine. Sans cache partagé, ou s'il est
+    indisponible, chaque worker se limite à sa part (``per_minute // workers``).
+    """
+    name = "ip-api"
+
+    def __init__(self, timeout: float = 2, per_minute: int = 45, limiter=None, workers: int = 1):
+        self.timeout = timeout
+        self.per_minute = per_minute
+        self.limiter = limiter
+        self.local_per_minute = max(1, per_minute // max(1, workers))
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._lock = threading.Lock()
+
+    def _acquire_local(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= 60:
+                self._window_start = now
+                self._window_count = 0
+            if self._window_count >= self.local_per_minute:
+                return False
+            self._window_count += 1
+            return True
+
+    def _acquire(self) -> bool:
+        if self.limiter is not None:
+            try:
+                return self.limiter.take_slot(self.name, self.per_minute)
+            except sqlite3.Error:
+                pass
+        return self._acquire_local()
+
+    def lookup(self, address: str):
+        if not self._acquire():
+            raise RuntimeError("quota ip-api.com atteint pour la minute en cours")
+        response = requests.get(
+            f"http://ip-api.com/json/{address}",
+            params={"fields": "city,regionName,country,isp,status"},
+            timeout=self.timeout,
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        data = response.json()
+        if data.get('status') != 'success':
+            # Adresse privée / réservée : réponse définitive, pas une erreur
+            return dict(EMPTY_GEO)
+        return {
+            'city': data.get('city') or None,
+            'region': data.get('regionName') or None,
+            'country': data.get('country') or None,
+            'isp': data.get('isp') or None,
+        }
+
+
+# -----------------------------------------------------
+# Résolveur
+# -----------------------------------------------------
+class GeoResolver:
+    """Enchaîne LRU mémoire → cache persistant → backends, et mesure chaque niveau."""
+
+    def __init__(self, backends, memory_cache: LRUCache, persistent_cache=None,
+                 negative_ttl: float = 300, logger=None):
+        self.backends = list(backends)
+        self.memory = memory_cache
+        self.persistent = persistent_cache
+        self.negative_ttl = negative_ttl
+        self.logger = logger
+        self._lock = threading.Lock()
+        self.counters = {'lookups': 0, 'memory_hits': 0, 'persistent_hits': 0,
+                         'backend_hits': 0, 'misses': 0}
+        self.backend_stats = {
+            b.name: {'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+            for b in self.backends
+        }
+
+    @classmethod
+    def from_app(cls, app) -> "GeoResolver":
+        cfg = app.config
+        backends = []
+        offline_path = cfg.get("GEO_OFFLINE_DB")
+        if offline_path:
+            try:
+                backend = OfflineRangeBackend(offline_path)
+                backends.append(backend)
+                app.logger.info(f"[GEO] Base locale chargée : {offline_path} ({len(backend)} plages)")
+            except Exception as e:
+                app.logger.warning(f"[GEO] Base locale inutilisable ({offline_path}): {e}")
+
+        persistent = None
+        cache_path = cfg.get("GEO_CACHE_PATH") or os.path.join(app.instance_path, "geo_cache.sqlite")
+        try:
+            persistent = PersistentGeoCache(cache_path, ttl=cfg.get("GEO_PERSISTENT_TTL", 30 * 86400))
+        except Exception as e:
+            app.logger.warning(f"[GEO] Cache persistant désactivé ({cache_path}): {e}")
+
+        if cfg.get("GEO_ONLINE_LOOKUP", True):
+            # Quota partagé via le cache SQLite ; à défaut, divisé entre les workers gunicorn (gunicorn_config.py)
+            workers = min(int(os.environ.get("GUNICORN_WORKERS", 4)), 4)
+            backends.append(IpApiBackend(limiter=persistent, workers=workers))
+
+        return cls(
+            backends,
+            LRUCache(cfg.get("GEO_CACHE_SIZE", 10000), cfg.get("GEO_CACHE_TTL", 86400)),
+            persistent,
+            logger=app.logger,
+        )
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.counters[key] += 1
+
+    def resolve(self, ip_address: str) -> dict:
+        """Retourne un dict city/region/country/isp (valeurs None si inconnues)."""
+        self._count('lookups')
+        prefix = anonymize_prefix(ip_address)
+        if not prefix:
+            self._count('misses')
+            return dict(EMPTY_GEO)
+
+        geo = self.memory.get(prefix)
+        if geo is not None:
+            self._count('memory_hits')
+            return dict(geo)
+
+        if self.persistent is not None:
+            try:
+                geo = self.persistent.get(prefix)
+            except Exception as e:
+                geo = None
+                if self.logger:
+                    self.logger.warning(f"[GEO] Lecture du cache persistant impossible: {e}")
+            if geo is not None:
+                self._count('persistent_hits')
+                self.memory.set(prefix, geo)
+                return dict(geo)
+
+        geo = self._query_backends(prefix)
+        if geo is None:
+            # Échec temporaire (réseau, quota) : cache négatif court, rien sur disque
+            self._count('misses')
+            self.memory.set(prefix, dict(EMPTY_GEO), ttl=self.negative_ttl)
+            return dict(EMPTY_GEO)
+
+        self._count('backend_hits')
+        self.memory.set(prefix, geo)
+        if self.persistent is not None:
+            try:
+                self.persistent.set(prefix, geo)
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning(f"[GEO] Écriture du cache persistant impossible: {e}")
+        return dict(geo)
+
+    def _query_backends(self, prefix: str):
+        for backend in self.backends:
+            stats = self.backend_stats[backend.name]
+            started = time.perf_counter()
+            try:
+                geo = backend.lookup(prefix)
+            except Exception as e:
+                geo = None
+                stats['errors'] += 1
+                if self.logger:
+                    self.logger.warning(f"[GEO] Erreur géolocalisation ({backend.name}) pour {prefix}: {e}")
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            stats['calls'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            if geo is not None:
+                return geo
+        return None
+
+    def stats(self) -> dict:
+        lookups = self.counters['lookups']
+        cached = self.counters['memory_hits'] + self.counters['persistent_hits']
+        return {
+            **self.counters,
+            'memory_entries': len(self.memory),
+            'hit_ratio': round(cached / lookups, 4) if lookups else 0.0,
+            'backends': {
+                name: {
+                    'calls': s['calls'],
+                    'errors': s['errors'],
+                    'avg_ms': round(s['total_ms'] / s['calls'], 3) if s['calls'] else 0.0,
+                    'max_ms': round(s['max_ms'], 3),
+                }
+                for name, s in self.backend_stats.items()
+            },
+        }
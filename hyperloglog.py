@@ -0,0 +1,61 @@
+"""
+Estimation du nombre d'éléments distincts (HyperLogLog), pour les visiteurs
+uniques des statistiques (voir visitor_stats.py).
+
+Chaque bucket agrégé (heure, jour) garde un croquis de ses sessions : 4096
+registres d'un octet, compressés (quelques dizaines d'octets pour une heure
+calme). Les croquis se fusionnent (maximum registre par registre) : les
+visiteurs uniques d'une période se lisent sur les croquis de ses buckets, sans
+relire les visites, et une session présente dans plusieurs buckets n'est
+comptée qu'une fois. Erreur type : 1,6 % (exact en pratique sous quelques
+centaines de sessions, grâce au comptage linéaire).
+"""
+import hashlib
+import math
+import zlib
+
+
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+_ALPHA = 0.7213 / (1 + 1.079 / REGISTERS)
+
+
+def _hash(value: str) -> int:
+    # Empreinte stable d'un processus à l'autre (contrairement à hash())
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    __slots__ = ("registers",)
+
+    def __init__(self, registers: bytes = None):
+        self.registers = bytearray(registers) if registers else bytearray(REGISTERS)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        return cls(zlib.decompress(data))
+
+    def to_bytes(self) -> bytes:
+        return zlib.compress(bytes(self.registers))
+
+    def add(self, value: str) -> None:
+        h = _hash(value)
+        index = h >> (64 - PRECISION)
+        rest = h & ((1 << (64 - PRECISION)) - 1)
+        rank = (64 - PRECISION) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self) -> int:
+        zeros = self.registers.count(0)
+        if zeros == REGISTERS:
+            return 0
+        estimate = _ALPHA * REGISTERS * REGISTERS / sum(2.0 ** -r for r in self.registers)
+        if estimate <= 2.5 * REGISTERS and zeros:
+            # Petites cardinalités : comptage linéaire (quasi exact)
+            estimate = REGISTERS * math.log(REGISTERS / zeros)
+        return int(round(estimate))
@@ -0,0 +1,372 @@
+"""
+Conversion WebP des images uploadées, en arrière-plan.
+
+La requête d'upload ne décode plus l'image : elle enregistre l'original tel
+quel (``upload_file_to_s3``) et répond. Ensuite :
+
+1. après le COMMIT du spectacle, ``enqueue_uploads(show)`` crée une ligne
+   ``image_job`` par image envoyée et la confie au pool de processus du
+   worker (``IMAGE_JOB_WORKERS`` processus, créés à la première tâche) ;
+2. un processus du pool produit les dérivés WebP aux largeurs
+   ``IMAGE_WIDTHS`` (image_processing.to_webp_ladder : une décompression,
+   réduite pour un JPEG, refusée au-delà de ``IMAGE_MAX_PIXELS``,
+   LANCZOS, ``method=6``), nommés ``<original>-<largeur>w.webp`` ;
+3. un thread du worker enregistre les dérivés puis remplace la colonne par
+   le plus large, en une seule requête conditionnelle :
+       UPDATE shows SET file_name = <dérivé>, file_mimetype = 'image/webp'
+       WHERE id = :show_id AND file_name = <original>
+   Si l'image a été remplacée entre-temps, aucune ligne n'est modifiée : la
+   tâche passe en « superseded » et ses dérivés, sans référence, sont laissés
+   au ramasse-miettes (voir media_refs.py), comme l'original remplacé.
+
+Jusqu'au remplacement, la colonne désigne l'original : les templates
+l'affichent tel quel ; ensuite, ``media_img`` ajoute le srcset des autres
+largeurs (voir media.py). Le remplacement passe par la session ORM : caches et
+version du catalogue sont invalidés comme pour toute écriture sur Show.
+
+Reprise : une tâche est prise en charge par un UPDATE conditionnel (un seul
+worker gagne). Les tâches restées en attente, ou prises depuis plus de
+``IMAGE_JOB_STALE_AFTER`` secondes (worker redémarré), sont reprises par le
+balayage périodique de chaque worker, qui relit l'original depuis le
+stockage. Après ``IMAGE_JOB_MAX_ATTEMPTS`` échecs, la tâche passe en
+« failed » et le spectacle garde l'original.
+
+``IMAGE_JOB_WORKERS = 0`` : conversion dans la requête (scripts, tests).
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from functools import partial
+from pathlib import PurePosixPath
+
+from flask import g
+from sqlalchemy import and_, func, or_, select, update
+
+import media_refs
+from image_processing import InvalidUpload, to_webp_ladder
+from media import variant_key
+from models import db
+from models.models import ImageJob, Show
+
+
+# Colonne du nom de fichier → colonne du type MIME
+SLOTS = {"file_name": "file_mimetype", "file_name2": "file_mimetype2", "file_name3": "file_mimetype3"}
+
+PENDING_GRACE = 30  # secondes laissées au worker qui a créé la tâche avant qu'un autre la reprenne
+
+
+def needs_webp(content_type) -> bool:
+    """Fichier à convertir en WebP (images ; les PDF sont enregistrés tels quels)."""
+    return bool(content_type) and content_type.startswith("image/")
+
+
+def store_variants(store, stem: str, variants: list) -> str:
+    """Enregistre les dérivés [(largeur, octets)] ; retourne le nom du plus large (valeur de la colonne)."""
+    result_key = variant_key(stem, variants[-1][0])
+    # Enregistré avant l'envoi : un passage du ramasse-miettes sur ce groupe se termine d'abord
+    media_refs.register(result_key)
+    for width, webp in variants:
+        store.put(variant_key(stem, width), webp, "image/webp")
+    return result_key
+
+
+def swap_image(show_id: int, slot: str, old_key: str, new_key: str) -> bool:
+    """
+    Remplace ``old_key`` par ``new_key`` dans la colonne ``slot`` du spectacle,
+    seulement si elle désigne encore ``old_key`` (UPDATE conditionnel, sans COMMIT).
+    Les références des deux fichiers sont mises à jour dans la même transaction.
+    """
+    swapped = db.session.execute(
+        update(Show)
+        .where(Show.id == show_id, getattr(Show, slot) == old_key)
+        .values({slot: new_key, SLOTS[slot]: "image/webp"})
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+    if swapped:
+        # UPDATE en masse : les événements du mapper (media_refs) ne sont pas appelés
+        conn = db.session.connection()
+        media_refs.acquire(conn, [new_key])
+        media_refs.release(conn, [old_key])
+    return swapped
+
+
+def remember_upload(key: str, data: bytes) -> None:
+    """Original d'une image enregistré pendant la requête, converti après le COMMIT du spectacle."""
+    g.setdefault("image_uploads", {})[key] = data
+
+
+class ImageJobQueue:
+    """Tâches de conversion d'un worker gunicorn : pool de processus paresseux, recréé après un fork."""
+
+    def __init__(self, app):
+        cfg = app.config
+        self.app = app
+        self.workers = cfg.get("IMAGE_JOB_WORKERS", 1)
+        self.start_method = cfg.get("IMAGE_JOB_START_METHOD", "spawn")
+        self.quality = cfg.get("IMAGE_WEBP_QUALITY", 85)
+        self.widths = tuple(cfg.get("IMAGE_WIDTHS", (320, 640, 1024, 1920)))
+        self.max_pixels = cfg.get("IMAGE_MAX_PIXELS", 25_000_000)
+        # Appel envoyé au pool (partial d'une fonction de module : sérialisable)
+        self._convert = partial(to_webp_ladder, widths=self.widths, quality=self.quality, max_pixels=self.max_pixels)
+        self.max_attempts = cfg.get("IMAGE_JOB_MAX_ATTEMPTS", 3)
+        self.stale_after = cfg.get("IMAGE_JOB_STALE_AFTER", 600)
+        self.sweep_interval = cfg.get("IMAGE_JOB_SWEEP_INTERVAL", 60)
+        self.keep_originals = cfg.get("IMAGE_JOB_KEEP_ORIGINALS", False)
+        self._pool = None
+        self._io = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+        self._stats_lock = threading.Lock()
+        self.job_stats = {'done': 0, 'superseded': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+        app.extensions["image_jobs"] = self
+
+    @property
+    def store(self):
+        return self.app.extensions["media_store"]
+
+    def _executors(self, broken=None):
+        pid = os.getpid()
+        if self._pid == pid and self._pool is not None and (broken is None or self._pool is not broken):
+            return self._pool, self._io
+        with self._lock:
+            # Nouveau pool après un fork (les processus et files du pool ne se partagent pas)
+            # ou après la mort brutale d'un processus (pool inutilisable)
+            replace_broken = broken is not None and self._pool is broken
+            if self._pid != pid or self._pool is None or replace_broken:
+                if replace_broken:
+                    broken.shutdown(wait=False)
+                options = {} if self.start_method == "fork" else {"max_tasks_per_child": 200}
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    **options,
+                )
+                if self._pid != pid or self._io is None:
+                    # Envoi du dérivé et écritures en base hors du thread de gestion du pool
+                    self._io = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-jobs")
+                self._pid = pid
+                self.app.logger.info(f"[WebP] Pool de conversion créé (pid {pid}, {self.workers} processus)")
+        return self._pool, self._io
+
+    # ---------------------------
+    # Création et prise en charge
+    # ---------------------------
+    def enqueue_uploads(self, show) -> None:
+        """À appeler après le COMMIT du spectacle : une tâche par image enregistrée pendant la requête."""
+        uploads = g.pop("image_uploads", None)
+        if not uploads:
+            return
+        for slot in SLOTS:
+            key = getattr(show, slot)
+            if key in uploads:
+                self.enqueue(show.id, slot, key, uploads[key])
+
+    def enqueue(self, show_id: int, slot: str, source_key: str, data: bytes = None) -> int:
+        job = ImageJob(show_id=show_id, slot=slot, source_key=source_key, status="pending")
+        db.session.add(job)
+        db.session.commit()
+        job_id = job.id
+        try:
+            token = self._claim(job_id)
+            if token is not None:
+                if data is None:
+                    data = self.store.get(source_key)
+                self._start(job_id, token, data)
+        except Exception as e:
+            # La tâche reste en attente : reprise par le balayage périodique
+            db.session.rollback()
+            self.app.logger.warning(f"[WebP] Tâche {job_id} non démarrée : {e}")
+        return job_id
+
+    def _claim(self, job_id: int):
+        """Prend la tâche pour ce worker ; retourne le jeton (claimed_at) ou None si un autre l'a prise."""
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            update(ImageJob)
+            .where(
+                ImageJob.id == job_id,
+                ImageJob.attempts < self.max_attempts,
+                or_(
+                    ImageJob.status == "pending",
+                    and_(ImageJob.status == "running",
+                         ImageJob.claimed_at < now - timedelta(seconds=self.stale_after)),
+                ),
+            )
+            .values(status="running", claimed_at=now, attempts=ImageJob.attempts + 1)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        return now if claimed == 1 else None
+
+    def _start(self, job_id: int, token: datetime, data: bytes) -> None:
+        started = time.perf_counter()
+        if self.workers <= 0:
+            self._finish(job_id, token, lambda: self._convert(data), started)
+            return
+        pool, io = self._executors()
+        try:
+            future = pool.submit(self._convert, data)
+        except BrokenProcessPool:
+            pool, io = self._executors(broken=pool)
+            future = pool.submit(self._convert, data)
+        future.add_done_callback(lambda f: io.submit(self._finish, job_id, token, f.result, started))
+
+    # ---------------------------
+    # Fin de conversion
+    # ---------------------------
+    def _finish(self, job_id: int, token: datetime, result, started: float) -> None:
+        with self.app.app_context():
+            try:
+                self._complete(job_id, token, result(), started)
+            except Exception as e:
+                db.session.rollback()
+                self._fail(job_id, token, e)
+
+    def _owned(self, job_id: int, token: datetime):
+        """La tâche, si ce worker en est toujours responsable (sinon reprise par un autre)."""
+        job = db.session.get(ImageJob, job_id)
+        return job if job is not None and job.status == "running" and job.claimed_at == token else None
+
+    def _complete(self, job_id: int, token: datetime, variants: list, started: float) -> None:
+        job = self._owned(job_id, token)
+        if job is None:
+            return
+        result_key = store_variants(self.store, PurePosixPath(job.source_key).stem, variants)
+
+        # Remplacement atomique : seulement si la colonne désigne encore l'original
+        swapped = swap_image(job.show_id, job.slot, job.source_key, result_key)
+        if swapped:
+            job.status = "done"
+        else:
+            current = db.session.execute(
+                select(getattr(Show, job.slot)).where(Show.id == job.show_id)
+            ).scalar()
+            job.status = "done" if current == result_key else "superseded"
+        if swapped and self.keep_originals:
+            media_refs.pin(job.source_key)
+        job.result_key = result_key
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self.job_stats[job.status] += 1
+            self.job_stats['total_ms'] += elapsed_ms
+            self.job_stats['max_ms'] = max(self.job_stats['max_ms'], elapsed_ms)
+        self.app.logger.info(
+            f"[WebP] {job.source_key} → {len(variants)} largeur(s) jusqu'à {result_key} "
+            f"({job.status}, {sum(len(webp) for _, webp in variants) / 1024:.1f}KB, {elapsed_ms:.0f} ms)"
+        )
+
+    def _fail(self, job_id: int, token: datetime, error: Exception) -> None:
+        with self._stats_lock:
+            self.job_stats['errors'] += 1
+        try:
+            job = self._owned(job_id, token)
+            if job is None:
+                return
+            job.error = str(error)[:2000]
+            if job.attempts >= self.max_attempts or isinstance(error, InvalidUpload):
+                # Image refusée à la lecture de l'en-tête : un nouvel essai donnerait le même résultat
+                job.status = "failed"
+                job.finished_at = datetime.utcnow()
+            else:
+                job.status = "pending"  # Nouvel essai au prochain balayage
+            db.session.commit()
+            self.app.logger.warning(
+                f"[WebP] Conversion impossible de {job.source_key} (essai {job.attempts}/{self.max_attempts}) : {error}"
+            )
+        except Exception as e:
+            db.session.rollback()
+            self.app.logger.warning(f"[WebP] Échec de la tâche {job_id} non enregistré : {e}")
+
+    # ---------------------------
+    # Reprise des tâches abandonnées
+    # ---------------------------
+    def ensure_started(self) -> None:
+        """Lance un balayage en arrière-plan au plus toutes les IMAGE_JOB_SWEEP_INTERVAL secondes."""
+        if self.workers <= 0 or not self.sweep_interval:
+            return
+        now = time.monotonic()
+        if now < self._next_sweep:
+            return
+        with self._lock:
+            if now < self._next_sweep:
+                return
+            self._next_sweep = now + self.sweep_interval
+        threading.Thread(target=self.sweep, name="image-jobs-sweep", daemon=True).start()
+
+    def sweep(self, limit: int = 20) -> int:
+        """Reprend les tâches en attente ou abandonnées ; retourne le nombre de tâches relancées."""
+        with self.app.app_context():
+            try:
+                now = datetime.utcnow()
+                stale = now - timedelta(seconds=self.stale_after)
+                # Abandonnées après le dernier essai : le spectacle garde l'original
+                db.session.execute(
+                    update(ImageJob)
+                    .where(ImageJob.status == "running", ImageJob.claimed_at < stale,
+                           ImageJob.attempts >= self.max_attempts)
+                    .values(status="failed", finished_at=now, error="Abandonnée (worker arrêté)")
+                    .execution_options(synchronize_session=False)
+                )
+                db.session.commit()
+                job_ids = db.session.execute(
+                    select(ImageJob.id)
+                    .where(
+                        ImageJob.attempts < self.max_attempts,
+                        or_(
+                            and_(ImageJob.status == "pending",
+                                 ImageJob.created_at < now - timedelta(seconds=PENDING_GRACE)),
+                            and_(ImageJob.status == "running", ImageJob.claimed_at < stale),
+                        ),
+                    )
+                    .order_by(ImageJob.id)
+                    .limit(limit)
+                ).scalars().all()
+
+                restarted = 0
+                for job_id in job_ids:
+                    token = self._claim(job_id)
+                    if token is None:
+                        continue
+                    job = db.session.get(ImageJob, job_id)
+                    data = self.store.get(job.source_key)
+                    if data is None:
+                        job.status = "failed"
+                        job.error = "Original introuvable dans le stockage"
+                        job.finished_at = datetime.utcnow()
+                        db.session.commit()
+                        continue
+                    self._start(job_id, token, data)
+                    restarted += 1
+                if restarted:
+                    self.app.logger.info(f"[WebP] {restarted} tâche(s) de conversion reprise(s)")
+                return restarted
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.warning(f"[WebP] Reprise des tâches impossible : {e}")
+                return 0
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            s = dict(self.job_stats)
+        finished = s['done'] + s['superseded']
+        counts = dict(db.session.execute(
+            select(ImageJob.status, func.count()).group_by(ImageJob.status)
+        ).all())
+        return {
+            'pool_ready': self._pool is not None and self._pid == os.getpid(),
+            'workers': self.workers,
+            'done': s['done'],
+            'superseded': s['superseded'],
+            'errors': s['errors'],
+            'avg_ms': round(s['total_ms'] / finished, 3) if finished else 0.0,
+            'max_ms': round(s['max_ms'], 3),
+            'jobs': counts,
+        }
@@ -0,0 +1,168 @@
+"""
+Traitements Pillow des images uploadées, exécutés dans les processus du pool
+d'image_jobs.py.
+
+Fonctions pures (octets en entrée, octets en sortie) : ce module n'importe
+ni Flask ni l'application, un processus du pool le charge en quelques
+millisecondes et les appels sont sérialisables (pickle).
+
+Aucune image n'est décodée sans contrôle préalable : ``inspect_upload`` lit
+la signature du fichier puis seulement l'en-tête de l'image (dimensions,
+format) et refuse au-delà de ``max_pixels``, avant toute décompression. Une
+image de 500 Ko peut annoncer 20 000 × 20 000 pixels (1,2 Go une fois
+décodée). Les JPEG plus grands que la largeur visée sont décodés directement
+à 1/2, 1/4 ou 1/8 de leur taille (``Image.draft``) : mémoire et temps de
+calcul par image restent bornés.
+"""
+import warnings
+from io import BytesIO
+from typing import NamedTuple, Optional
+
+from PIL import Image, UnidentifiedImageError
+
+
+# Signatures (premiers octets) des formats acceptés
+MAGIC_BYTES = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+    (b"%PDF-", "PDF"),
+)
+IMAGE_FORMATS = ("JPEG", "PNG", "GIF", "WEBP")
+MIMETYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "GIF": "image/gif",
+             "WEBP": "image/webp", "PDF": "application/pdf"}
+
+
+class InvalidUpload(ValueError):
+    """Fichier refusé avant décodage (message affichable à l'utilisateur)."""
+
+
+class UploadInfo(NamedTuple):
+    format: str
+    mimetype: str
+    width: Optional[int] = None  # None pour un PDF
+    height: Optional[int] = None
+
+
+def sniff_format(header: bytes):
+    """Format d'après la signature du fichier ("JPEG", "PNG", "GIF", "WEBP", "PDF"), ou None."""
+    for magic, fmt in MAGIC_BYTES:
+        if header.startswith(magic):
+            return fmt
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+
+def _too_large(message: str, max_pixels: Optional[int]) -> str:
+    return f"{message} Maximum : {max_pixels / 1_000_000:g} millions de pixels." if max_pixels else message
+
+
+def _open_header(fp, max_pixels: Optional[int]) -> "Image.Image":
+    """Ouvre l'image sans la décoder (Pillow ne lit que l'en-tête) et vérifie ses dimensions."""
+    with warnings.catch_warnings():
+        # Le contrôle de taille est fait ici, avec max_pixels, et non par l'avertissement global de Pillow
+        warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+        try:
+            img = Image.open(fp, formats=IMAGE_FORMATS)
+        except Image.DecompressionBombError:
+            raise InvalidUpload(_too_large("Image trop grande.", max_pixels))
+        except (UnidentifiedImageError, OSError, SyntaxError) as e:
+            raise InvalidUpload(f"Image illisible ou endommagée ({e}).")
+    width, height = img.size
+    if max_pixels and width * height > max_pixels:
+        raise InvalidUpload(_too_large(f"Image trop grande ({width} × {height} pixels).", max_pixels))
+    return img
+
+
+def inspect_upload(fp, max_pixels: int) -> UploadInfo:
+    """
+    Format et dimensions d'un fichier uploadé (objet fichier binaire, remis au
+    début), lus dans la signature et l'en-tête seulement.
+
+    Lève InvalidUpload si le contenu n'est pas un format accepté, si la
+    signature ne correspond pas à l'image, ou si l'image dépasse ``max_pixels``.
+    """
+    fp.seek(0)
+    fmt = sniff_format(fp.read(16))
+    fp.seek(0)
+    if fmt is None:
+        raise InvalidUpload("Le contenu du fichier n'est pas une image JPEG, PNG, GIF ou WebP, ni un PDF.")
+    if fmt == "PDF":
+        return UploadInfo(fmt, MIMETYPES[fmt])
+    try:
+        img = _open_header(fp, max_pixels)
+        if img.format != fmt:
+            raise InvalidUpload("Le contenu du fichier ne correspond pas à son format annoncé.")
+        return UploadInfo(fmt, MIMETYPES[fmt], img.width, img.height)
+    finally:
+        fp.seek(0)
+
+
+def open_image(data: bytes, max_pixels: Optional[int] = None, target_width: Optional[int] = None) -> "Image.Image":
+    """
+    Image prête à être décodée : dimensions vérifiées sur l'en-tête, et JPEG
+    décodé à échelle réduite (1/2, 1/4, 1/8) si ``target_width`` le permet
+    (le résultat reste au moins aussi large que ``target_width``).
+    """
+    img = _open_header(BytesIO(data), max_pixels)
+    if target_width and img.format == "JPEG" and img.width > target_width:
+        img.draft("RGB", (target_width, max(1, img.height * target_width // img.width)))
+    return img
+
+
+def to_rgb(img: "Image.Image") -> "Image.Image":
+    """Image RVB, transparence aplatie sur fond blanc (WebP avec perte, pas de canal alpha)."""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def to_webp(data: bytes, quality: int = 85, max_width: int = 1920, method: int = 6,
+            max_pixels: Optional[int] = None) -> bytes:
+    """
+    Convertit une image en WebP, réduite à ``max_width`` pixels de large
+    (proportions conservées, jamais agrandie).
+
+    Lève InvalidUpload si l'image dépasse ``max_pixels``, une exception
+    Pillow si les octets ne sont pas une image lisible.
+    """
+    img = to_rgb(open_image(data, max_pixels, max_width))
+    if img.width > max_width:
+        ratio = max_width / img.width
+        img = img.resize((max_width, int(img.height * ratio)), Image.Resampling.LANCZOS)
+    output = BytesIO()
+    img.save(output, format='WebP', quality=quality, method=method)
+    return output.getvalue()
+
+
+def to_webp_ladder(data: bytes, widths, quality: int = 85, method: int = 6,
+                   max_pixels: Optional[int] = None) -> list:
+    """
+    Dérivés WebP d'une image aux largeurs ``widths`` (srcset), en une seule
+    décompression (réduite pour un JPEG, voir open_image) : chaque largeur est
+    réduite depuis la précédente, de la plus grande à la plus petite. Les
+    largeurs supérieures à l'image sont remplacées par une seule version à sa
+    taille d'origine (jamais agrandie).
+
+    Retourne [(largeur réelle, octets)] de la plus petite à la plus grande.
+    """
+    img = to_rgb(open_image(data, max_pixels, max(widths)))
+    largest = min(img.width, max(widths))
+    targets = sorted({width for width in widths if width < largest} | {largest}, reverse=True)
+    variants = []
+    current = img
+    for width in targets:
+        if current.width > width:
+            current = current.resize((width, max(1, round(img.height * width / img.width))), Image.Resampling.LANCZOS)
+        output = BytesIO()
+        current.save(output, format='WebP', quality=quality, method=method)
+        variants.append((width, output.getvalue()))
+    return variants[::-1]
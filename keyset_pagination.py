@@ -0,0 +1,201 @@
+"""
+Pagination par clé (keyset / « seek ») pour les listes publiques.
+
+Au lieu de ``OFFSET (page-1)*n`` (coût proportionnel à la profondeur) et d'un
+``COUNT(*)`` complet à chaque page, la page suivante est lue par
+``WHERE (clés de tri) > (clés du dernier élément) ORDER BY ... LIMIT n+1``,
+ce qui suit l'index du tri quelle que soit la profondeur.
+
+- Les premières pages (``link_pages``) gardent des URL numérotées ``?page=N``
+  (SEO, liens stables) ; au-delà, les liens portent un curseur opaque signé
+  ``?cursor=...`` (sens, clés de l'élément de bord, numéro de page).
+- Le total est un comptage plafonné (``count_cap``) : « 1000+ résultats »
+  au-delà, sans parcourir toute la table.
+- Les valeurs NULL sont considérées comme plus grandes que toutes les autres
+  (ordre par défaut de PostgreSQL, imposé explicitement à SQLite).
+
+Usage :
+    keys = (SortKey(Show.genre_rank), SortKey(Show.created_at, desc=True), SortKey(Show.id, desc=True))
+    pagination = keyset_paginate(query, keys, per_page=16,
+                                 page=request.args.get("page", type=int),
+                                 cursor=request.args.get("cursor"))
+    url_for("catalogue", **pagination.next_args)
+"""
+import math
+from datetime import date, datetime
+from typing import NamedTuple
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy import and_, false, func, literal, or_
+
+from models import db
+
+
+class SortKey(NamedTuple):
+    """Colonne (ou expression) de tri ; la dernière clé doit être unique (id)."""
+    expr: object
+    desc: bool = False
+
+
+# -----------------------------------------------------
+# Curseurs
+# -----------------------------------------------------
+def _serializer() -> URLSafeSerializer:
+    return URLSafeSerializer(current_app.secret_key, salt="keyset-cursor")
+
+
+def _dump_value(value):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    return value
+
+
+def _load_value(value):
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+    return value
+
+
+def encode_cursor(direction: str, values, page: int) -> str:
+    return _serializer().dumps({"d": direction, "k": [_dump_value(v) for v in values], "p": page})
+
+
+def decode_cursor(token: str):
+    """Retourne (sens, valeurs, page) ou None si le curseur est invalide."""
+    try:
+        data = _serializer().loads(token)
+        return data["d"], [_load_value(v) for v in data["k"]], int(data["p"])
+    except (BadSignature, KeyError, TypeError, ValueError):
+        return None
+
+
+# -----------------------------------------------------
+# Prédicats et tri
+# -----------------------------------------------------
+def _order(key: SortKey, reverse: bool):
+    desc = key.desc != reverse
+    # NULL « plus grand » : en fin de tri croissant, en tête de tri décroissant
+    return key.expr.desc().nulls_first() if desc else key.expr.asc().nulls_last()
+
+
+def _beyond(key: SortKey, value, reverse: bool):
+    """Lignes strictement après ``value`` pour cette clé, dans le sens de lecture."""
+    desc = key.desc != reverse
+    if desc:
+        return key.expr.isnot(None) if value is None else key.expr < value
+    return false() if value is None else or_(key.expr > value, key.expr.is_(None))
+
+
+def _seek(keys, values, reverse: bool):
+    """(k1, k2, ...) > (v1, v2, ...) dans l'ordre du tri, développé en OR de préfixes égaux."""
+    clauses, equal = [], []
+    for key, value in zip(keys, values):
+        clauses.append(and_(*equal, _beyond(key, value, reverse)))
+        equal.append(key.expr.is_(None) if value is None else key.expr == value)
+    return or_(*clauses)
+
+
+# -----------------------------------------------------
+# Pagination
+# -----------------------------------------------------
+class KeysetPage:
+    """Page de résultats ; mêmes attributs que la pagination Flask-SQLAlchemy utilisés par les templates."""
+
+    def __init__(self, items, page, per_page, has_prev, has_next, prev_args, next_args,
+                 total, total_exact, link_pages):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.prev_num = page - 1 if has_prev else None
+        self.next_num = page + 1 if has_next else None
+        self.prev_args = prev_args
+        self.next_args = next_args
+        self.total = total
+        self.total_exact = total_exact
+        self.link_pages = link_pages
+        known_pages = math.ceil(total / per_page) if total else 1
+        self.pages = max(known_pages, page + (1 if has_next else 0))
+
+    def iter_pages(self, **_ignored):
+        """Numéros des premières pages (liens ?page=N), None pour une ellipse, puis la page courante."""
+        last_linked = min(self.pages, self.link_pages)
+        yield from range(1, last_linked + 1)
+        if self.page > last_linked:
+            yield None
+            yield self.page
+        elif self.pages > last_linked:
+            yield None
+
+
+def _nav_args(direction: str, edge_values, page: int, link_pages: int) -> dict:
+    if page <= link_pages:
+        return {"page": page}
+    return {"cursor": encode_cursor(direction, edge_values, page)}
+
+
+def count_capped(query, cap: int):
+    """COUNT(*) plafonné : (nombre, exact?)."""
+    limited = query.order_by(None).with_entities(literal(1)).limit(cap + 1).subquery()
+    count = db.session.query(func.count()).select_from(limited).scalar() or 0
+    return min(count, cap), count <= cap
+
+
+def keyset_paginate(query, keys, per_page: int, page=None, cursor=None, order_prefix=None,
+                    link_pages: int = 5, count_cap: int = 1000, with_total: bool = True) -> KeysetPage:
+    """
+    Pagine ``query`` selon ``keys`` (liste de SortKey, dernière clé unique).
+
+    ``order_prefix`` : critères de tri placés avant les clés (pertinence d'une
+    recherche) ; la pagination se fait alors par numéro de page uniquement.
+    """
+    keys = list(keys)
+    total, total_exact = count_capped(query, count_cap) if with_total else (0, False)
+    key_columns = [key.expr.label(f"_keyset_{i}") for i, key in enumerate(keys)]
+    base = query.order_by(None).add_columns(*key_columns)
+
+    decoded = decode_cursor(cursor) if cursor and not order_prefix else None
+    reverse = False
+    if decoded:
+        direction, values, page = decoded
+        reverse = direction == "b"
+        rows = base.filter(_seek(keys, values, reverse)) \
+            .order_by(*[_order(key, reverse) for key in keys]) \
+            .limit(per_page + 1).all()
+    else:
+        page = max(page or 1, 1)
+        order = [_order(key, False) for key in keys]
+        rows = base.order_by(*(list(order_prefix or []) + order)) \
+            .offset((page - 1) * per_page).limit(per_page + 1).all()
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if reverse:
+        rows.reverse()
+        has_prev, has_next = more, True
+        if not has_prev:
+            page = 1  # Des lignes ont disparu entre-temps : c'est la première page
+    else:
+        has_prev, has_next = page > 1, more
+
+    items = [row[0] for row in rows]
+    edge = [list(row[1:]) for row in rows]
+    prev_args = next_args = None
+    if has_prev:
+        prev_args = {"page": page - 1} if order_prefix or not edge else \
+            _nav_args("b", edge[0], page - 1, link_pages)
+    if has_next:
+        next_args = {"page": page + 1} if order_prefix or not edge else \
+            _nav_args("a", edge[-1], page + 1, link_pages)
+
+    if not with_total:
+        total = (page - 1) * per_page + len(items)
+    return KeysetPage(items, page, per_page, has_prev, has_next, prev_args, next_args,
+                      total, total_exact, link_pages)
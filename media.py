@@ -0,0 +1,338 @@
+"""
+URL des fichiers uploadés (images, PDF) utilisées par les templates.
+
+``media_url(filename)`` (global Jinja) donne au navigateur une URL directe
+vers le stockage, pour que les workers gunicorn ne relaient plus les octets
+des images :
+
+- ``S3_CUSTOM_DOMAIN`` (CDN / domaine du bucket public) : URL permanente ;
+- sinon, S3 configuré : URL présignée courte, mémorisée par clé jusqu'à
+  peu avant son expiration (même URL d'une page à l'autre : le navigateur
+  garde l'image en cache) ;
+- fichier présent dans UPLOAD_FOLDER, S3 absent ou ``MEDIA_URL_MODE=proxy``
+  (bucket privé sans URL présignées) : ``/uploads/<filename>``.
+
+Images converties (voir image_jobs.py) : un dérivé WebP par largeur de
+``IMAGE_WIDTHS``, nommé ``<nom de l'original>-<largeur>w.webp`` ; la colonne
+du spectacle désigne le plus large. ``media_img(filename, sizes)`` (global
+Jinja) en déduit les autres et émet ``src``, ``srcset`` et ``sizes`` : le
+navigateur télécharge la largeur adaptée à l'emplacement de l'image.
+
+``/uploads/<filename>`` reste la seule URL stable (og:image, JSON-LD, liens
+existants) : en mode direct, elle redirige vers l'URL ci-dessus ; en mode
+proxy, ``S3ObjectProxy`` relaie l'objet en flux (Range, 304).
+
+Les URL présignées sont régénérées par fenêtres de
+``MEDIA_PRESIGN_EXPIRES - MEDIA_PRESIGN_MARGIN`` secondes ; une URL reste
+valable au moins ``MEDIA_PRESIGN_MARGIN`` secondes après la fin de sa
+fenêtre. Le numéro de fenêtre (``url_generation()``) fait partie des clés du
+cache de pages et des ETag : une page mémorisée ou revalidée (304) ne
+contient jamais d'URL expirée.
+"""
+import mimetypes
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import quote
+
+from flask import current_app, request, stream_with_context, url_for
+from markupsafe import Markup, escape
+from werkzeug.http import unquote_etag
+
+from geolocation import LRUCache
+
+try:
+    from botocore.exceptions import ClientError
+except ImportError:
+    ClientError = None
+
+
+# Attribut sizes selon l'emplacement de l'image (largeur affichée, voir static/css)
+IMAGE_SIZES = {
+    "card": "(max-width: 600px) 100vw, (max-width: 1024px) 50vw, 400px",  # cartes du catalogue
+    "une": "(max-width: 600px) 50vw, (max-width: 1024px) 33vw, 200px",     # grille « à la une »
+    "header": "180px",                                                     # diaporama du header
+    "detail": "(max-width: 1000px) 100vw, 1000px",                         # fiche spectacle
+}
+
+VARIANT_KEY = re.compile(r"^(?P<stem>.+)-(?P<width>\d+)w\.webp$")
+
+
+def variant_key(stem: str, width: int) -> str:
+    """Nom déterministe du dérivé de largeur ``width`` d'un original (nom sans extension)."""
+    return f"{stem}-{width}w.webp"
+
+
+def image_variants(filename: str, widths) -> list:
+    """
+    Dérivés [(largeur, nom)] d'une image convertie, du plus étroit au plus
+    large ; [] si ``filename`` n'est pas un dérivé (original en attente, PDF,
+    image convertie avant les largeurs fixes).
+    """
+    match = VARIANT_KEY.match(filename or "")
+    if not match:
+        return []
+    stem, largest = match["stem"], int(match["width"])
+    return [(width, variant_key(stem, width)) for width in sorted(widths) if width < largest] + [(largest, filename)]
+
+
+def _origin(domain: str) -> str:
+    domain = domain.strip().rstrip("/")
+    return domain if "://" in domain else f"https://{domain}"
+
+
+def csp_img_sources(config) -> list:
+    """Origines à autoriser dans img-src (Talisman) pour les URL directes."""
+    sources = []
+    if config.get("S3_CUSTOM_DOMAIN"):
+        sources.append(_origin(config["S3_CUSTOM_DOMAIN"]))
+    bucket = config.get("S3_BUCKET")
+    if bucket:
+        # URL présignées « virtual-hosted » : avec ou sans région selon la région du bucket
+        sources.append(f"https://{bucket}.s3.amazonaws.com")
+        if config.get("S3_REGION"):
+            sources.append(f"https://{bucket}.s3.{config['S3_REGION']}.amazonaws.com")
+    return sources
+
+
+class MediaResolver:
+    """Résout le nom d'un fichier uploadé en URL servie directement par le stockage."""
+
+    def __init__(self, storage, upload_folder: str, custom_domain=None, mode: str = "auto",
+                 presign_expires: int = 21600, presign_margin: int = 3600, cache_size: int = 5000,
+                 widths=(320, 640, 1024, 1920)):
+        self.storage = storage
+        self.widths = tuple(widths)
+        self.upload_folder = Path(upload_folder)
+        self.custom_domain = _origin(custom_domain) if custom_domain else None
+        self.mode = mode
+        self.presign_expires = presign_expires
+        self.presign_margin = min(presign_margin, presign_expires - 60)
+        self.presigned = LRUCache(cache_size, presign_expires)
+
+    @classmethod
+    def from_app(cls, app, storage) -> "MediaResolver":
+        cfg = app.config
+        return cls(
+            storage,
+            cfg["UPLOAD_FOLDER"],
+            custom_domain=cfg.get("S3_CUSTOM_DOMAIN"),
+            mode=cfg.get("MEDIA_URL_MODE", "auto"),
+            presign_expires=cfg.get("MEDIA_PRESIGN_EXPIRES", 21600),
+            presign_margin=cfg.get("MEDIA_PRESIGN_MARGIN", 3600),
+            cache_size=cfg.get("MEDIA_URL_CACHE_SIZE", 5000),
+            widths=cfg.get("IMAGE_WIDTHS", (320, 640, 1024, 1920)),
+        )
+
+    @property
+    def direct(self) -> bool:
+        """True si les fichiers S3 sont servis par URL directe (pas de relais par /uploads)."""
+        return self.mode != "proxy" and bool(self.custom_domain or self.storage.configured)
+
+    @property
+    def uses_presigned_urls(self) -> bool:
+        return self.direct and not self.custom_domain
+
+    @property
+    def window(self) -> int:
+        return self.presign_expires - self.presign_margin
+
+    def url_generation(self) -> int:
+        """Numéro de la fenêtre de validité des URL présignées (0 si les URL sont permanentes)."""
+        return int(time.time() // self.window) if self.uses_presigned_urls else 0
+
+    def redirect_max_age(self) -> int:
+        """Durée de cache de la redirection /uploads → URL directe."""
+        return 86400 if self.custom_domain else 300
+
+    def _is_local(self, filename: str) -> bool:
+        # Fichiers enregistrés localement (S3 indisponible lors de l'upload) : servis par /uploads
+        return (self.upload_folder / filename).is_file()
+
+    def _presigned_url(self, key: str):
+        url = self.presigned.get(key)
+        if url is not None:
+            return url
+        client = self.storage.client()
+        if client is None:
+            return None
+        with self.storage.timed("presign"):
+            url = client.generate_presigned_url(
+                "get_object",
+                Params={"Bucket": self.storage.bucket, "Key": key},
+                ExpiresIn=self.presign_expires,
+            )
+        # Mémorisée jusqu'à la fin de la fenêtre courante : encore valable MEDIA_PRESIGN_MARGIN s au-delà
+        now = time.time()
+        window_end = (now // self.window + 1) * self.window
+        self.presigned.set(key, url, ttl=window_end - now)
+        return url
+
+    def url(self, filename: str, external: bool = False) -> str:
+        if not filename:
+            return ""
+        if self.direct and not self._is_local(filename):
+            if self.custom_domain:
+                return f"{self.custom_domain}/{quote(filename)}"
+            url = self._presigned_url(filename)
+            if url:
+                return url
+        return url_for("uploaded_file", filename=filename, _external=external)
+
+    def srcset(self, filename: str) -> str:
+        """Valeur de l'attribut srcset (vide si l'image n'a pas de dérivés)."""
+        variants = image_variants(filename, self.widths)
+        if len(variants) < 2:
+            return ""
+        return ", ".join(f"{self.url(key)} {width}w" for width, key in variants)
+
+    def img_attrs(self, filename: str, sizes: str = "card") -> Markup:
+        """Attributs src, srcset et sizes d'une balise <img>."""
+        attrs = f'src="{escape(self.url(filename))}"'
+        srcset = self.srcset(filename)
+        if srcset:
+            attrs += f' srcset="{escape(srcset)}" sizes="{escape(IMAGE_SIZES.get(sizes, sizes))}"'
+        return Markup(attrs)
+
+
+def url_generation(app) -> int:
+    """Numéro de fenêtre des URL de médias de l'application (0 sans résolveur)."""
+    media = app.extensions.get("media")
+    return media.url_generation() if media else 0
+
+
+def generation_started_at(app):
+    """Début (UTC) de la fenêtre courante des URL présignées, None si les URL sont permanentes."""
+    media = app.extensions.get("media")
+    if not media or not media.uses_presigned_urls:
+        return None
+    return datetime.utcfromtimestamp(media.url_generation() * media.window)
+
+
+# ---------------------------
+# Relais des objets S3 (/uploads en mode proxy)
+# ---------------------------
+class S3ObjectProxy:
+    """
+    Relais en flux des objets S3 : corps lu par morceaux (mémoire constante
+    par requête), ETag / Last-Modified / Content-Length transmis, 304 sur
+    If-None-Match / If-Modified-Since à partir d'un cache des ``head_object``,
+    plages d'octets (Range, lecture des PDF page par page).
+    """
+
+    def __init__(self, storage, head_ttl: float = 300, cache_size: int = 2000, chunk_size: int = 64 * 1024):
+        self.storage = storage
+        self.heads = LRUCache(cache_size, head_ttl)
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def from_app(cls, app, storage) -> "S3ObjectProxy":
+        cfg = app.config
+        return cls(
+            storage,
+            head_ttl=cfg.get("MEDIA_PROXY_HEAD_TTL", 300),
+            cache_size=cfg.get("MEDIA_PROXY_HEAD_CACHE_SIZE", 2000),
+            chunk_size=cfg.get("MEDIA_PROXY_CHUNK_SIZE", 64 * 1024),
+        )
+
+    def head(self, key: str, refresh: bool = False):
+        """Métadonnées de l'objet (etag sans guillemets, date, taille, type), None s'il n'existe pas."""
+        meta = None if refresh else self.heads.get(key)
+        if meta is not None:
+            return meta or None  # {} : absence mémorisée
+        try:
+            with self.storage.timed("head_object"):
+                head = self.storage.client().head_object(Bucket=self.storage.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey", "NotFound"):
+                raise
+            self.heads.set(key, {})
+            return None
+        meta = {
+            "etag": unquote_etag(head["ETag"])[0],
+            "last_modified": head.get("LastModified"),
+            "length": head["ContentLength"],
+            "content_type": head.get("ContentType") or mimetypes.guess_type(key)[0] or "application/octet-stream",
+        }
+        self.heads.set(key, meta)
+        return meta
+
+    def _get(self, key: str, meta: dict, byte_range=None):
+        params = {"Bucket": self.storage.bucket, "Key": key, "IfMatch": f'"{meta["etag"]}"'}
+        if byte_range:
+            params["Range"] = f"bytes={byte_range[0]}-{byte_range[1] - 1}"
+        with self.storage.timed("get_object"):
+            return self.storage.client().get_object(**params)
+
+    def _stream(self, body):
+        try:
+            yield from body.iter_chunks(self.chunk_size)
+        finally:
+            body.close()
+
+    @staticmethod
+    def _range_applies(meta: dict) -> bool:
+        """Une seule plage demandée (sinon objet complet), et If-Range correspond encore à l'objet."""
+        if not request.range or len(request.range.ranges) != 1:
+            return False
+        if_range = request.if_range
+        if if_range.etag:
+            return if_range.etag == meta["etag"]
+        if if_range.date:
+            return bool(meta["last_modified"]) and meta["last_modified"].replace(microsecond=0) <= if_range.date
+        return True
+
+    def response(self, key: str, max_age: int = 31536000):
+        """Réponse Flask pour l'objet ``key`` ; None s'il n'existe pas."""
+        meta = self.head(key)
+        if meta is None:
+            return None
+
+        def conditional_headers(response):
+            response.set_etag(meta["etag"])
+            if meta["last_modified"]:
+                response.last_modified = meta["last_modified"]
+            response.headers["Cache-Control"] = f"public, max-age={max_age}"
+            response.headers["Accept-Ranges"] = "bytes"
+            return response
+
+        # 304 sans lire l'objet
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(meta["etag"]) or request.if_none_match.star_tag
+        else:
+            since = request.if_modified_since
+            not_modified = bool(since and meta["last_modified"] and meta["last_modified"].replace(microsecond=0) <= since)
+        if not_modified:
+            return conditional_headers(current_app.response_class(status=304))
+
+        byte_range = None
+        if self._range_applies(meta):
+            byte_range = request.range.range_for_length(meta["length"])
+            if byte_range is None:
+                response = current_app.response_class(status=416)
+                response.headers["Content-Range"] = f"bytes */{meta['length']}"
+                return response
+
+        try:
+            s3_response = self._get(key, meta, byte_range)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "PreconditionFailed":
+                raise
+            # Objet remplacé depuis la mise en cache du head_object : relire ses métadonnées
+            meta = self.head(key, refresh=True)
+            if meta is None:
+                return None
+            byte_range = byte_range and request.range.range_for_length(meta["length"])
+            s3_response = self._get(key, meta, byte_range)
+
+        response = current_app.response_class(
+            stream_with_context(self._stream(s3_response["Body"])),
+            status=206 if byte_range else 200,
+            mimetype=meta["content_type"],
+            direct_passthrough=True,
+        )
+        response.headers["Content-Length"] = str(s3_response["ContentLength"])
+        if byte_range:
+            response.headers["Content-Range"] = f"bytes {byte_range[0]}-{byte_range[1] - 1}/{meta['length']}"
+        return conditional_headers(response)
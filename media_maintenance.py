@@ -0,0 +1,432 @@
+"""
+Maintenance de la médiathèque : conversion et régénération en masse des
+images des spectacles (S3 ou stockage local).
+
+Remplace le parcours séquentiel de migrate_images_to_webp.py :
+    - conversions réparties sur un pool de processus (--workers) ;
+    - lectures / envois vers le stockage limités à --io-workers en parallèle
+      (autant d'images en mémoire au plus) ;
+    - progression enregistrée dans un fichier de reprise (--checkpoint) :
+      une exécution interrompue reprend là où elle s'est arrêtée ;
+    - même remplacement conditionnel des colonnes que les tâches d'upload
+      (image_jobs.swap_image) : une image modifiée pendant l'exécution n'est
+      pas écrasée ;
+    - les fichiers remplacés ne sont pas supprimés ici : sans référence, ils
+      sont laissés au ramasse-miettes (media_refs.py), un même fichier
+      pouvant servir à plusieurs spectacles.
+
+Modes :
+    (défaut)        Convertit les images sans dérivés de largeurs fixes
+                    (originaux JPG/PNG/GIF, WebP d'avant les largeurs fixes)
+    --regenerate    Régénère les dérivés de toutes les images (--widths,
+                    --quality) depuis l'original s'il a été conservé, sinon
+                    depuis le dérivé le plus large. Les nouveaux noms portent
+                    une empreinte des réglages : navigateurs et CDN ne
+                    resservent pas l'ancienne version.
+    --dry-run       Convertit en mémoire sans rien écrire : tailles avant / après
+    --report        Taille des fichiers actuels par type d'image, sans conversion
+    --gc            Enregistre les fichiers du stockage inconnus de la table
+                    media_object, puis supprime les fichiers sans référence
+                    depuis plus de MEDIA_GC_GRACE secondes (avec --dry-run :
+                    compte seulement)
+
+Options :
+    --widths 320,640,1024,1920   Largeurs des dérivés (défaut : IMAGE_WIDTHS)
+    --quality N                  Qualité WebP (défaut : IMAGE_WEBP_QUALITY)
+    --workers N                  Processus de conversion (défaut : nombre de CPU)
+    --io-workers N               Transferts simultanés (défaut : 8)
+    --limit N                    Traiter au plus N images
+    --checkpoint CHEMIN          Fichier de reprise (défaut : instance/media_maintenance.json)
+    --restart                    Ignorer le fichier de reprise existant
+    --keep-originals             Conserver les fichiers remplacés (jamais supprimés par le ramasse-miettes)
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from pathlib import Path, PurePosixPath
+from typing import NamedTuple
+
+from sqlalchemy import select, update
+
+import media_refs
+from image_jobs import SLOTS, store_variants, swap_image
+from image_processing import to_webp_ladder
+from media import VARIANT_KEY, image_variants
+from models import db
+from models.models import ImageJob, Show
+
+
+IMAGE_EXTENSIONS = ("jpg", "jpeg", "png", "gif", "webp")
+CHECKPOINT_EVERY = 20  # images traitées entre deux écritures du fichier de reprise
+
+
+class Task(NamedTuple):
+    show_id: int
+    slot: str
+    key: str
+
+    @property
+    def id(self) -> str:
+        return f"{self.show_id}:{self.slot}:{self.key}"
+
+
+# ---------------------------
+# Noms de fichiers
+# ---------------------------
+def settings_tag(widths, quality: int) -> str:
+    """Empreinte courte des réglages, ajoutée aux noms des dérivés régénérés."""
+    raw = f"{','.join(map(str, sorted(widths)))}|{quality}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:6]
+
+
+def base_name(key: str) -> str:
+    """Nom de l'upload d'origine (sans extension, largeur ni empreinte de réglages)."""
+    match = VARIANT_KEY.match(key)
+    stem = match["stem"] if match else PurePosixPath(key).stem
+    return stem.split("-", 1)[0]
+
+
+def target_stem(key: str, tag=None) -> str:
+    return f"{base_name(key)}-{tag}" if tag else PurePosixPath(key).stem
+
+
+def is_image(key) -> bool:
+    return bool(key) and key.rsplit(".", 1)[-1].lower() in IMAGE_EXTENSIONS
+
+
+def collect_tasks(tag=None, include_all: bool = False) -> list:
+    """
+    Images à traiter, par ordre de spectacle. Sans ``tag`` : images sans
+    dérivés ; avec ``tag`` : images dont les dérivés n'ont pas ces réglages.
+    """
+    tasks = []
+    query = select(Show.id, Show.file_name, Show.file_name2, Show.file_name3) \
+        .order_by(Show.id).execution_options(yield_per=500)
+    for row in db.session.execute(query):
+        for slot, key in zip(SLOTS, row[1:]):
+            if not is_image(key):
+                continue
+            match = VARIANT_KEY.match(key)
+            if not include_all:
+                if tag and match and match["stem"] == target_stem(key, tag):
+                    continue  # Déjà régénérée avec ces réglages
+                if not tag and match:
+                    continue  # Déjà convertie
+            tasks.append(Task(row.id, slot, key))
+    return tasks
+
+
+# ---------------------------
+# Fichier de reprise
+# ---------------------------
+class Checkpoint:
+    """Images déjà traitées (JSON réécrit atomiquement), pour une signature de réglages donnée."""
+
+    def __init__(self, path: str, signature: str, restart: bool = False):
+        self.path = Path(path)
+        self.signature = signature
+        self.done = set()
+        self.failed = {}
+        self._unsaved = 0
+        if self.path.exists() and not restart:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if data.get("signature") == signature:
+                self.done = set(data.get("done", ()))
+                self.failed = data.get("failed", {})
+
+    def mark(self, task: Task, error=None) -> None:
+        if error is None:
+            self.done.add(task.id)
+            self.failed.pop(task.id, None)
+        else:
+            self.failed[task.id] = str(error)[:500]
+        self._unsaved += 1
+        if self._unsaved >= CHECKPOINT_EVERY:
+            self.save()
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({
+            "signature": self.signature,
+            "done": sorted(self.done),
+            "failed": self.failed,
+        }), encoding="utf-8")
+        os.replace(tmp, self.path)
+        self._unsaved = 0
+
+
+# ---------------------------
+# Traitement d'une image (thread de transfert)
+# ---------------------------
+def _stored_size(store, keys) -> int:
+    return sum(store.size(key) or 0 for key in keys)
+
+
+def _kept_original(store, task: Task):
+    """Original conservé à l'upload (IMAGE_JOB_KEEP_ORIGINALS) dont ``task.key`` est le dérivé."""
+    source_key = db.session.execute(
+        select(ImageJob.source_key)
+        .where(ImageJob.show_id == task.show_id, ImageJob.slot == task.slot,
+               ImageJob.result_key == task.key, ImageJob.status == "done")
+        .order_by(ImageJob.id.desc())
+    ).scalars().first()
+    return source_key if source_key and store.size(source_key) is not None else None
+
+
+def fetch_task(app, task: Task, opts):
+    """Lecture de l'image à convertir (thread de transfert) : (nom source, octets, taille actuelle)."""
+    store = app.extensions["media_store"]
+    all_widths = sorted(set(opts.widths) | set(app.config["IMAGE_WIDTHS"]))
+    current_keys = [key for _, key in image_variants(task.key, all_widths)] or [task.key]
+    with app.app_context():
+        source_key = (_kept_original(store, task) if opts.tag else None) or task.key
+        data = store.get(source_key)
+        if data is None:
+            raise FileNotFoundError(f"Fichier introuvable : {source_key}")
+        before = len(data) if current_keys == [source_key] else _stored_size(store, current_keys)
+    return source_key, data, before
+
+
+def store_task(app, task: Task, opts, source_key: str, before: int, variants: list) -> dict:
+    """Envoi des dérivés et remplacement de la colonne (thread de transfert)."""
+    store = app.extensions["media_store"]
+    after = sum(len(webp) for _, webp in variants)
+    if opts.dry_run:
+        return {"status": "dry-run", "before": before, "after": after, "key": None}
+    with app.app_context():
+        new_key = store_variants(store, target_stem(task.key, opts.tag), variants)
+        swapped = swap_image(task.show_id, task.slot, task.key, new_key)
+        if swapped and opts.keep_originals:
+            media_refs.pin(task.key)
+        if swapped and source_key != task.key:
+            # L'original conservé reste retrouvable à la prochaine régénération
+            db.session.execute(
+                update(ImageJob)
+                .where(ImageJob.show_id == task.show_id, ImageJob.slot == task.slot,
+                       ImageJob.result_key == task.key)
+                .values(result_key=new_key)
+            )
+        db.session.commit()
+        if not swapped:
+            current = db.session.execute(
+                select(getattr(Show, task.slot)).where(Show.id == task.show_id)
+            ).scalar()
+            if current != new_key:
+                # Image remplacée pendant l'exécution : dérivés sans référence, laissés au ramasse-miettes
+                return {"status": "superseded", "before": before, "after": 0, "key": None}
+        return {"status": "converted", "before": before, "after": after, "key": new_key}
+
+
+def process_task(app, pool, io, task: Task, opts) -> Future:
+    """
+    Lecture, conversion et envoi d'une image, enchaînés sans bloquer de thread :
+    la conversion est confiée au pool de processus depuis le thread de transfert,
+    l'envoi repart sur un thread de transfert une fois la conversion terminée
+    (comme image_jobs.py). --workers et --io-workers sont ainsi indépendants.
+    """
+    result = Future()
+
+    def fail_on_error(step):
+        def callback(future):
+            try:
+                step(future.result())
+            except Exception as e:
+                result.set_exception(e)
+        return callback
+
+    def convert(fetched):
+        source_key, data, before = fetched
+        conversion = pool.submit(to_webp_ladder, data, opts.widths, opts.quality,
+                                 max_pixels=app.config.get("IMAGE_MAX_PIXELS"))
+        conversion.add_done_callback(fail_on_error(
+            lambda variants: io.submit(store_task, app, task, opts, source_key, before, variants)
+            .add_done_callback(fail_on_error(result.set_result))
+        ))
+
+    io.submit(fetch_task, app, task, opts).add_done_callback(fail_on_error(convert))
+    return result
+
+
+def _kb(size: int) -> str:
+    return f"{size / 1024:,.0f} KB"
+
+
+def run(app, opts) -> dict:
+    """Traite toutes les images concernées ; retourne les totaux."""
+    totals = {"converted": 0, "superseded": 0, "dry-run": 0, "errors": 0, "skipped": 0, "before": 0, "after": 0}
+    with app.app_context():
+        tasks = collect_tasks(opts.tag)
+    checkpoint = None
+    if not opts.dry_run:
+        signature = f"{'regenerate' if opts.tag else 'convert'}:{settings_tag(opts.widths, opts.quality)}"
+        checkpoint = Checkpoint(opts.checkpoint, signature, restart=opts.restart)
+        remaining = [task for task in tasks if task.id not in checkpoint.done]
+        totals["skipped"] = len(tasks) - len(remaining)
+        tasks = remaining
+    if opts.limit:
+        tasks = tasks[:opts.limit]
+
+    print(f"📊 {len(tasks)} image(s) à traiter"
+          + (f" ({totals['skipped']} déjà faite(s), fichier de reprise)" if totals["skipped"] else ""))
+    if not tasks:
+        return totals
+
+    started = time.perf_counter()
+    context = multiprocessing.get_context(app.config.get("IMAGE_JOB_START_METHOD", "spawn"))
+    with ProcessPoolExecutor(max_workers=opts.workers, mp_context=context) as pool, \
+            ThreadPoolExecutor(max_workers=opts.io_workers, thread_name_prefix="media-io") as io:
+
+        def handle(futures):
+            for future in futures:
+                task = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    totals["errors"] += 1
+                    print(f"  ❌ #{task.show_id} {task.slot} : {task.key} ({e})")
+                    if checkpoint:
+                        checkpoint.mark(task, error=e)
+                    continue
+                totals[result["status"]] += 1
+                totals["before"] += result["before"]
+                totals["after"] += result["after"]
+                target = result["key"] or result["status"]
+                print(f"  ✅ #{task.show_id} {task.slot} : {task.key} → {target} "
+                      f"({_kb(result['before'])} → {_kb(result['after'])})")
+                if checkpoint:
+                    checkpoint.mark(task)
+
+        # Fenêtre bornée : les tâches en attente ne gardent aucune image en mémoire ;
+        # assez large pour occuper à la fois les processus et les transferts
+        window = (opts.workers + opts.io_workers) * 2
+        in_flight = {}
+        for task in tasks:
+            if len(in_flight) >= window:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                handle(done)
+            in_flight[process_task(app, pool, io, task, opts)] = task
+        handle(list(wait(in_flight).done))
+
+    if checkpoint:
+        checkpoint.save()
+    totals["elapsed_s"] = round(time.perf_counter() - started, 1)
+    return totals
+
+
+def report(app, opts) -> dict:
+    """Taille des fichiers actuels : originaux, WebP sans dérivés, dérivés de largeurs fixes."""
+    store = app.extensions["media_store"]
+    widths = app.config["IMAGE_WIDTHS"]
+    with app.app_context():
+        tasks = collect_tasks(include_all=True)
+
+    def measure(task):
+        keys = [key for _, key in image_variants(task.key, widths)]
+        if keys:
+            kind = "dérivés"
+        elif task.key.lower().endswith(".webp"):
+            kind = "webp sans dérivés"
+        else:
+            kind = "originaux"
+        return kind, len(keys) or 1, _stored_size(store, keys or [task.key])
+
+    summary = {}
+    with ThreadPoolExecutor(max_workers=opts.io_workers, thread_name_prefix="media-io") as io:
+        for kind, files, size in io.map(measure, tasks):
+            entry = summary.setdefault(kind, {"images": 0, "files": 0, "bytes": 0})
+            entry["images"] += 1
+            entry["files"] += files
+            entry["bytes"] += size
+    return summary
+
+
+def parse_args(argv=None, config=None):
+    config = config or {}
+    parser = argparse.ArgumentParser(description="Conversion / régénération en masse des images des spectacles")
+    parser.add_argument("--regenerate", action="store_true")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--report", action="store_true")
+    parser.add_argument("--gc", action="store_true")
+    parser.add_argument("--widths", default=",".join(map(str, config.get("IMAGE_WIDTHS", (320, 640, 1024, 1920)))))
+    parser.add_argument("--quality", type=int, default=config.get("IMAGE_WEBP_QUALITY", 85))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--io-workers", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--checkpoint", default=str(Path("instance") / "media_maintenance.json"))
+    parser.add_argument("--restart", action="store_true")
+    parser.add_argument("--keep-originals", action="store_true")
+    opts = parser.parse_args(argv)
+    opts.widths = tuple(sorted(int(w) for w in opts.widths.split(",")))
+    opts.tag = settings_tag(opts.widths, opts.quality) if opts.regenerate else None
+    return opts
+
+
+def main(argv=None) -> None:
+    from app import app  # Import tardif : les processus du pool n'ont pas à créer l'application
+
+    opts = parse_args(argv, app.config)
+    if opts.report:
+        print("📏 Taille des images stockées...")
+        summary = report(app, opts)
+        for kind, entry in sorted(summary.items()):
+            print(f"  {kind:<18} {entry['images']:>6} image(s)  {entry['files']:>6} fichier(s)  {_kb(entry['bytes']):>12}")
+        print(f"  {'total':<18} {sum(e['images'] for e in summary.values()):>6} image(s)  "
+              f"{sum(e['files'] for e in summary.values()):>6} fichier(s)  "
+              f"{_kb(sum(e['bytes'] for e in summary.values())):>12}")
+        return
+
+    if opts.gc:
+        store = app.extensions["media_store"]
+        grace = app.config.get("MEDIA_GC_GRACE", 24 * 3600)
+        print(f"🧹 Ramasse-miettes : fichiers sans référence depuis plus de {grace / 3600:g} h"
+              + (" (dry-run : rien n'est supprimé)" if opts.dry_run else ""))
+        with app.app_context():
+            unknown = media_refs.scan_storage(store, dry_run=opts.dry_run)
+            print(f"  🔍 {unknown} fichier(s) du stockage absent(s) de media_object"
+                  + ("" if opts.dry_run else " : enregistré(s), supprimé(s) au prochain passage après le délai"))
+            totals = {"candidates": 0, "objects": 0, "files": 0, "kept": 0, "repaired": 0}
+            while True:
+                result = media_refs.collect_garbage(store, grace, limit=opts.limit or 500, dry_run=opts.dry_run)
+                for name in totals:
+                    totals[name] += result[name]
+                if opts.dry_run or opts.limit or result["objects"] == 0:
+                    break
+        print("=" * 60)
+        if opts.dry_run:
+            print(f"ℹ️  {totals['objects']} fichier(s) seraient supprimés")
+        else:
+            print(f"✅ Fichiers libérés: {totals['objects']} ({totals['files']} supprimé(s) du stockage)")
+        print(f"⊘  Conservés (dérivé du même contenu encore utilisé): {totals['kept']}")
+        if totals["repaired"]:
+            print(f"🔧 Comptes de références corrigés: {totals['repaired']}")
+        return
+
+    mode = "Régénération des dérivés" if opts.regenerate else "Conversion des images sans dérivés"
+    print(f"🔄 {mode} : largeurs {', '.join(map(str, opts.widths))}, qualité {opts.quality}, "
+          f"{opts.workers} processus, {opts.io_workers} transferts simultanés"
+          + (" (dry-run : rien n'est écrit)" if opts.dry_run else ""))
+    totals = run(app, opts)
+
+    print("=" * 60)
+    if opts.dry_run:
+        print(f"ℹ️  {totals['dry-run']} image(s) seraient converties")
+    else:
+        print(f"✅ Images converties: {totals['converted']}")
+        print(f"⊘  Images remplacées entre-temps: {totals['superseded']}")
+    print(f"❌ Erreurs: {totals['errors']}")
+    if totals["before"]:
+        reduction = (totals["before"] - totals["after"]) / totals["before"] * 100
+        print(f"📦 Taille: {_kb(totals['before'])} → {_kb(totals['after'])} ({reduction:.1f}% de réduction)")
+    if "elapsed_s" in totals:
+        print(f"⏱️  Durée: {totals['elapsed_s']}s")
+    if totals["errors"] and not opts.dry_run:
+        print("⏸️  Relancer le script pour réessayer les images en erreur (les autres sont ignorées).")
+
+
+if __name__ == "__main__":
+    main()
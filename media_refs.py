@@ -0,0 +1,393 @@
+"""
+Fichiers uploadés adressés par leur contenu, comptage de références et
+ramasse-miettes.
+
+Nom d'un upload : empreinte SHA-256 des octets reçus (32 premiers caractères
+hexadécimaux) + extension normalisée. Une même affiche envoyée pour trois
+spectacles, ou renvoyée à chaque modification, est enregistrée une seule
+fois, et ses dérivés WebP (``<empreinte>-<largeur>w.webp``, voir
+image_jobs.py) ne sont produits qu'une fois : ``upload_file_to_s3`` réutilise
+directement le dérivé existant.
+
+La table ``media_object`` compte, pour chaque fichier, les colonnes
+``file_name*`` des spectacles qui le désignent. Le compte suit les écritures
+ORM sur Show (événements du mapper, dans la transaction du spectacle) et le
+remplacement conditionnel des tâches WebP (``image_jobs.swap_image``). Aucune
+route ne supprime plus de fichier : un fichier qui n'est plus référencé est
+supprimé par ``collect_garbage`` (S3 et local, avec ses dérivés) après
+``MEDIA_GC_GRACE`` secondes, en vérifiant de nouveau qu'aucun spectacle ne le
+désigne. Le délai couvre les requêtes en cours qui réutilisent un fichier
+libéré (une réutilisation remet le compte à un).
+
+``media_maintenance.py --gc`` enregistre aussi les fichiers du stockage que la
+table ne connaît pas (uploads abandonnés, fichiers d'avant le comptage) puis
+lance le ramasse-miettes.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import PurePosixPath
+
+from sqlalchemy import case, delete, event, func, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+
+from media import VARIANT_KEY
+from models import db
+from models.models import MediaObject, Show, StatsWatermark
+
+
+FILE_COLUMNS = ("file_name", "file_name2", "file_name3")
+
+# Noms donnés par l'application : empreinte (ou uuid4 avant le stockage par contenu),
+# empreinte de réglages des dérivés régénérés, largeur. Les autres fichiers du bucket ne sont jamais touchés.
+UPLOAD_KEY = re.compile(r"^[0-9a-f]{32}(?:-[0-9a-f]{6})?(?:-\d+w)?\.[a-z0-9]+$")
+
+EXTENSION_ALIASES = {".jpeg": ".jpg", ".jpe": ".jpg", ".tif": ".tiff"}
+
+GC_MARK = "media_gc"
+REFS_MARK = "media_refs"
+
+
+def content_key(data: bytes, extension: str) -> str:
+    """Nom de stockage d'un upload : empreinte du contenu + extension (".png", "JPEG"...) normalisée."""
+    ext = f".{extension.lower().lstrip('.')}" if extension else ""
+    return f"{hashlib.sha256(data).hexdigest()[:32]}{EXTENSION_ALIASES.get(ext, ext)}"
+
+
+def group_of(key: str) -> str:
+    """Préfixe commun à un fichier et à ses dérivés de largeurs fixes."""
+    match = VARIANT_KEY.match(key)
+    return f"{match['stem']}-" if match else key
+
+
+# ---------------------------
+# Comptage des références
+# ---------------------------
+def _insert_missing(conn, keys, released_at) -> None:
+    """Crée les lignes absentes, sans référence (INSERT ... ON CONFLICT DO NOTHING)."""
+    rows = [{"key": key, "refcount": 0, "pinned": False, "created_at": datetime.utcnow(),
+             "released_at": released_at} for key in keys]
+    if not rows:
+        return
+    table = MediaObject.__table__
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        for row in rows:
+            try:
+                with conn.begin_nested():
+                    conn.execute(table.insert().values(**row))
+            except IntegrityError:
+                pass
+        return
+    conn.execute(insert(table).on_conflict_do_nothing(), rows)
+
+
+def acquire(conn, keys) -> None:
+    """Ajoute une référence à chaque nom de ``keys`` (plusieurs si le nom y figure plusieurs fois)."""
+    counts = Counter(key for key in keys if key)
+    if not counts:
+        return
+    _insert_missing(conn, list(counts), None)
+    table = MediaObject.__table__
+    for key, count in counts.items():
+        conn.execute(
+            update(table).where(table.c.key == key)
+            .values(refcount=table.c.refcount + count, released_at=None)
+        )
+
+
+def release(conn, keys) -> None:
+    """Retire une référence ; un fichier qui n'en a plus est daté pour le ramasse-miettes."""
+    counts = Counter(key for key in keys if key)
+    table = MediaObject.__table__
+    now = datetime.utcnow()
+    for key, count in counts.items():
+        conn.execute(
+            update(table).where(table.c.key == key)
+            .values(
+                refcount=case((table.c.refcount > count, table.c.refcount - count), else_=0),
+                released_at=case((table.c.refcount <= count, now), else_=table.c.released_at),
+            )
+        )
+
+
+def register(key: str) -> bool:
+    """
+    Enregistre un fichier qui vient d'être écrit (sans référence tant qu'aucun
+    spectacle ne le désigne), dans la transaction de la session.
+
+    Retourne True si le fichier était déjà connu : il n'est pas renvoyé, et son
+    délai de grâce repart de zéro s'il n'était plus référencé.
+    """
+    now = datetime.utcnow()
+    known = db.session.execute(
+        update(MediaObject)
+        .where(MediaObject.key == key)
+        .values(released_at=case((MediaObject.refcount == 0, now), else_=MediaObject.released_at))
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+    if not known:
+        _insert_missing(db.session.connection(), [key], now)
+    return known
+
+
+def pin(key: str) -> None:
+    """Fichier à ne jamais supprimer (original conservé après conversion)."""
+    _insert_missing(db.session.connection(), [key], datetime.utcnow())
+    db.session.execute(
+        update(MediaObject).where(MediaObject.key == key).values(pinned=True)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def find_derivative(key: str):
+    """Dérivé WebP le plus large déjà produit pour l'upload ``key`` (même contenu), ou None."""
+    stem = PurePosixPath(key).stem
+    rows = db.session.execute(
+        select(MediaObject.key)
+        .where(MediaObject.key.startswith(f"{stem}-", autoescape=True))
+        .order_by((MediaObject.refcount > 0).desc(), MediaObject.created_at.desc())
+    ).scalars()
+    for candidate in rows:
+        match = VARIANT_KEY.match(candidate)
+        if match and match["stem"].split("-", 1)[0] == stem:
+            return candidate
+    return None
+
+
+def _load_previous_key(target, value, oldvalue, initiator):
+    """Rien à faire : l'écouteur charge l'ancien nom avant l'affectation (libéré au flush)."""
+
+
+for _column in FILE_COLUMNS:
+    event.listen(getattr(Show, _column), "set", _load_previous_key, active_history=True)
+
+
+@event.listens_for(Show, "after_insert")
+def _acquire_new_show_files(mapper, connection, show):
+    acquire(connection, [getattr(show, column) for column in FILE_COLUMNS])
+
+
+@event.listens_for(Show, "after_update")
+def _swap_show_files(mapper, connection, show):
+    state = inspect(show)
+    added, removed = [], []
+    for column in FILE_COLUMNS:
+        history = state.attrs[column].history
+        if history.has_changes():
+            added.extend(history.added)
+            removed.extend(history.deleted)
+    acquire(connection, added)
+    release(connection, removed)
+
+
+@event.listens_for(Show, "before_delete")
+def _release_show_files(mapper, connection, show):
+    columns = [Show.__table__.c[column] for column in FILE_COLUMNS]
+    row = connection.execute(select(*columns).where(Show.__table__.c.id == show.id)).first()
+    if row:
+        release(connection, list(row))
+
+
+def referenced_keys(keys) -> Counter:
+    """Nombre de colonnes file_name* désignant chacun de ``keys`` (tous les fichiers si None)."""
+    counts = Counter()
+    for column in FILE_COLUMNS:
+        attr = getattr(Show, column)
+        query = select(attr, func.count()).where(attr.isnot(None)).group_by(attr)
+        if keys is not None:
+            query = query.where(attr.in_(list(keys)))
+        for key, count in db.session.execute(query):
+            counts[key] += count
+    return counts
+
+
+def init_media_refs(app) -> None:
+    """
+    Compte les références existantes au démarrage si la table est vide (première mise en production).
+
+    Un seul worker compte : la ligne ``media_refs`` de stats_watermark est insérée dans la même
+    transaction que le comptage ; les autres workers attendent son COMMIT puis échouent sur la
+    clé primaire (et recommencent au prochain démarrage si le comptage a échoué).
+    """
+    try:
+        if db.session.get(StatsWatermark, REFS_MARK) is not None:
+            return
+        db.session.add(StatsWatermark(name=REFS_MARK, processed_until=datetime.utcnow()))
+        db.session.flush()
+        counts = Counter()
+        if db.session.execute(select(MediaObject.key).limit(1)).first() is None:
+            counts = referenced_keys(None)
+            conn = db.session.connection()
+            for key, count in counts.items():
+                acquire(conn, [key] * count)
+        db.session.commit()
+        if counts:
+            app.logger.info(f"[MEDIA] Références comptées pour {len(counts)} fichier(s)")
+    except IntegrityError:
+        # Un autre worker a compté les références
+        db.session.rollback()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.warning(f"[MEDIA] Comptage des références impossible : {e}")
+
+
+# ---------------------------
+# Ramasse-miettes
+# ---------------------------
+def scan_storage(store, dry_run: bool = False) -> int:
+    """
+    Enregistre (sans référence) les fichiers du stockage absents de la table :
+    uploads d'un formulaire abandonné, fichiers d'avant le comptage. Le
+    ramasse-miettes les supprime après le délai de grâce s'ils restent inutilisés.
+    """
+    known = {group_of(key) for key in db.session.execute(select(MediaObject.key)).scalars()}
+    known.update(group_of(key) for key in referenced_keys(None))
+    unknown = sorted(key for key in store.keys() if UPLOAD_KEY.match(key) and group_of(key) not in known)
+    if unknown and not dry_run:
+        _insert_missing(db.session.connection(), unknown, datetime.utcnow())
+        db.session.commit()
+    return len(unknown)
+
+
+def collect_garbage(store, grace: float, limit: int = 500, dry_run: bool = False, logger=None) -> dict:
+    """
+    Supprime les fichiers sans référence depuis plus de ``grace`` secondes,
+    avec leurs dérivés, sur S3 et en local. Un fichier et ses dérivés ne sont
+    supprimés que si aucun nom du groupe n'est encore utilisé.
+    """
+    started = time.perf_counter()
+    cutoff = datetime.utcnow() - timedelta(seconds=grace)
+    collectable = (MediaObject.refcount == 0) & (MediaObject.pinned.is_(False)) \
+        & (MediaObject.released_at < cutoff)
+    candidates = db.session.execute(
+        select(MediaObject.key).where(collectable).order_by(MediaObject.released_at).limit(limit)
+    ).scalars().all()
+    result = {"candidates": len(candidates), "objects": 0, "files": 0, "kept": 0, "repaired": 0}
+
+    # Vérification contre les spectacles : le compte peut avoir dérivé (écriture SQL hors ORM)
+    still_used = referenced_keys(candidates)
+    if still_used:
+        conn = db.session.connection()
+        for key, count in still_used.items():
+            acquire(conn, [key] * count)
+        db.session.commit()
+        result["repaired"] = len(still_used)
+
+    groups = {}
+    for key in candidates:
+        if key not in still_used:
+            groups.setdefault(group_of(key), []).append(key)
+    for prefix, keys in groups.items():
+        members = keys
+        if prefix.endswith("-"):
+            members = [key for key in db.session.execute(
+                select(MediaObject.key).where(MediaObject.key.startswith(prefix, autoescape=True))
+            ).scalars() if group_of(key) == prefix]
+            if set(members) - set(keys):
+                result["kept"] += len(keys)  # Un autre dérivé du même contenu est encore utilisé
+                continue
+        if dry_run:
+            result["objects"] += len(members)
+            continue
+        # Suppression conditionnelle : un upload a pu réutiliser le fichier entre-temps
+        deleted = db.session.execute(
+            delete(MediaObject).where(MediaObject.key.in_(members), collectable)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if deleted != len(members):
+            db.session.rollback()
+            result["kept"] += len(members)
+            continue
+        # Fichiers supprimés avant le COMMIT : les lignes restent verrouillées, un upload du même
+        # contenu (register) attend la fin de la transaction puis renvoie le fichier
+        try:
+            files = {key for key in store.keys(prefix) if group_of(key) == prefix} if prefix.endswith("-") else set()
+            files.update(members)
+            for key in files:
+                store.delete(key)
+        except Exception:
+            db.session.rollback()
+            raise
+        db.session.commit()
+        result["objects"] += len(members)
+        result["files"] += len(files)
+
+    result["elapsed_s"] = round(time.perf_counter() - started, 2)
+    if logger and (result["objects"] or result["repaired"]):
+        logger.info(
+            f"[MEDIA] Ramasse-miettes : {result['objects']} fichier(s) libéré(s), {result['files']} supprimé(s) "
+            f"du stockage, {result['kept']} conservé(s), {result['repaired']} compte(s) corrigé(s)"
+        )
+    return result
+
+
+def claim_run(interval: float) -> bool:
+    """Réserve le passage du ramasse-miettes pour ce worker (compare-and-swap sur stats_watermark)."""
+    now = datetime.utcnow()
+    claimed = db.session.execute(
+        update(StatsWatermark)
+        .where(StatsWatermark.name == GC_MARK,
+               StatsWatermark.processed_until <= now - timedelta(seconds=interval))
+        .values(processed_until=now, updated_at=now)
+    ).rowcount
+    if not claimed and db.session.get(StatsWatermark, GC_MARK) is None:
+        db.session.add(StatsWatermark(name=GC_MARK, processed_until=now))
+        try:
+            db.session.commit()
+            return True
+        except IntegrityError:
+            # Un autre worker a créé la ligne en même temps
+            db.session.rollback()
+            return False
+    db.session.commit()
+    return bool(claimed)
+
+
+class MediaGarbageCollector:
+    """Passage périodique du ramasse-miettes (un seul worker à la fois, thread lancé par une requête)."""
+
+    def __init__(self, app):
+        self.app = app
+        self.grace = float(app.config.get("MEDIA_GC_GRACE", 24 * 3600))
+        self.interval = float(app.config.get("MEDIA_GC_INTERVAL", 3600))
+        self.batch_size = app.config.get("MEDIA_GC_BATCH_SIZE", 500)
+        self._lock = threading.Lock()
+        self._next_run = 0.0
+        self._pid = None
+        self.last_result = None
+        app.extensions["media_gc"] = self
+
+    def ensure_started(self) -> None:
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self._pid == os.getpid() and now < self._next_run:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and now < self._next_run:
+                return
+            self._pid = os.getpid()
+            self._next_run = now + self.interval
+        threading.Thread(target=self.run, name="media-gc", daemon=True).start()
+
+    def run(self) -> None:
+        with self.app.app_context():
+            try:
+                if not claim_run(self.interval):
+                    return
+                self.last_result = collect_garbage(
+                    self.app.extensions["media_store"], self.grace,
+                    limit=self.batch_size, logger=self.app.logger,
+                )
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.warning(f"[MEDIA] Ramasse-miettes impossible : {e}")
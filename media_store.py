@@ -0,0 +1,113 @@
+"""
+Lecture / écriture des fichiers uploadés, quel que soit leur emplacement.
+
+S3 si configuré (client partagé, voir s3_storage.py), repli sur
+``UPLOAD_FOLDER`` si S3 est absent ou si l'envoi échoue. La lecture et la
+suppression essaient les deux emplacements : un fichier enregistré
+localement lors d'une panne S3 reste accessible.
+"""
+from pathlib import Path
+
+try:
+    from botocore.exceptions import ClientError
+except ImportError:
+    ClientError = None
+
+
+class MediaStore:
+    """Fichiers uploadés : S3 (repli local) ou dossier UPLOAD_FOLDER."""
+
+    def __init__(self, storage, upload_folder: str, logger=None):
+        self.storage = storage
+        self.upload_folder = Path(upload_folder)
+        self.logger = logger
+
+    @classmethod
+    def from_app(cls, app, storage) -> "MediaStore":
+        return cls(storage, app.config["UPLOAD_FOLDER"], logger=app.logger)
+
+    def _log(self, level: str, message: str) -> None:
+        if self.logger:
+            getattr(self.logger, level)(message)
+
+    def put(self, key: str, data: bytes, content_type: str) -> str:
+        """Enregistre ``data`` sous ``key`` ; retourne "s3" ou "local". Lève une exception si tout échoue."""
+        client = self.storage.client()
+        if client is not None:
+            try:
+                with self.storage.timed("upload", key):
+                    client.put_object(Bucket=self.storage.bucket, Key=key, Body=data, ContentType=content_type)
+                self._log("info", f"[S3] Fichier uploadé avec succès: {key}")
+                return "s3"
+            except Exception as e:
+                self._log("error", f"[S3] Erreur upload S3, fallback local: {e}")
+
+        path = self.upload_folder / key
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+        except Exception as e:
+            self._log("error", f"[LOCAL] Erreur sauvegarde locale: {e}")
+            raise Exception(f"Impossible de sauvegarder le fichier : {e}")
+        self._log("info", f"[LOCAL] Fichier sauvegardé localement: {key}")
+        return "local"
+
+    def get(self, key: str):
+        """Contenu du fichier, ou None s'il n'existe nulle part."""
+        path = self.upload_folder / key
+        if path.is_file():
+            return path.read_bytes()
+        client = self.storage.client()
+        if client is None:
+            return None
+        try:
+            with self.storage.timed("get_object", key):
+                return client.get_object(Bucket=self.storage.bucket, Key=key)["Body"].read()
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def size(self, key: str):
+        """Taille en octets du fichier, ou None s'il n'existe nulle part."""
+        path = self.upload_folder / key
+        if path.is_file():
+            return path.stat().st_size
+        client = self.storage.client()
+        if client is None:
+            return None
+        try:
+            with self.storage.timed("head_object", key):
+                return client.head_object(Bucket=self.storage.bucket, Key=key)["ContentLength"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def keys(self, prefix: str = "") -> set:
+        """Noms des fichiers commençant par ``prefix``, dans les deux emplacements."""
+        found = set()
+        if self.upload_folder.is_dir():
+            found.update(path.name for path in self.upload_folder.iterdir()
+                         if path.is_file() and path.name.startswith(prefix))
+        client = self.storage.client()
+        if client is not None:
+            with self.storage.timed("list", prefix):
+                for page in client.get_paginator("list_objects_v2").paginate(Bucket=self.storage.bucket, Prefix=prefix):
+                    found.update(obj["Key"] for obj in page.get("Contents", ()))
+        return found
+
+    def delete(self, key: str) -> None:
+        """Supprime le fichier des deux emplacements (best-effort)."""
+        client = self.storage.client()
+        if client is not None:
+            try:
+                with self.storage.timed("delete", key):
+                    client.delete_object(Bucket=self.storage.bucket, Key=key)
+                self._log("info", f"[S3] Fichier supprimé: {key}")
+            except Exception as e:
+                self._log("warning", f"[S3] Suppression impossible ({key}): {e}")
+        try:
+            (self.upload_folder / key).unlink(missing_ok=True)
+        except OSError as e:
+            self._log("warning", f"[LOCAL] Suppression impossible ({key}): {e}")
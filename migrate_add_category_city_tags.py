@@ -0,0 +1,28 @@
+"""
+Migration : étiquettes normalisées des spectacles (voir catalogue_tags.py).
+    - tables category / city (libellé + slug unique)
+    - tables d'association show_category / show_city (+ index par étiquette)
+    - découpage des champs texte shows.category / shows.location existants
+
+L'application complète les étiquettes manquantes au démarrage ; ce script
+recalcule celles de tous les spectacles (après un import SQL direct par exemple).
+"""
+from app import app, db
+import catalogue_tags
+from models.models import Category, City
+
+
+def migrate():
+    with app.app_context():
+        print("🏷️  Création des tables d'étiquettes...")
+        db.create_all()
+
+        print("🔄 Découpage des catégories et villes de chaque spectacle...")
+        with db.engine.begin() as conn:
+            count = catalogue_tags.backfill_tags(conn)
+        print(f"✅ {count} spectacle(s) traité(s)")
+        print(f"📊 {Category.query.count()} catégorie(s), {City.query.count()} ville(s)")
+
+
+if __name__ == "__main__":
+    migrate()
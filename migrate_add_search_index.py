@@ -0,0 +1,25 @@
+"""
+Migration : index plein texte du catalogue (voir catalogue_search.py).
+    - PostgreSQL : colonne shows.search_vector (tsvector) + index GIN
+    - SQLite : table virtuelle FTS5 shows_fts
+
+L'application crée et complète l'index au démarrage ; ce script sert à le
+reconstruire entièrement (après un import SQL direct par exemple).
+"""
+from app import app
+import catalogue_search
+
+
+def migrate():
+    with app.app_context():
+        backend = catalogue_search.get_backend()
+        if backend is None:
+            print("⚠️  Aucun index plein texte disponible pour cette base : la recherche reste en ILIKE.")
+            return
+        print(f"🔎 Reconstruction de l'index plein texte ({backend.name})...")
+        count = catalogue_search.rebuild_index()
+        print(f"✅ {count} spectacle(s) indexé(s)")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,113 @@
+"""
+Migration PostgreSQL (optionnelle) : partitionne 'visitor_log' par mois.
+
+La purge RGPD devient alors un simple DROP des partitions expirées au lieu de
+DELETE massifs (voir visitor_retention.py). Les nouvelles partitions sont
+créées à l'avance par clean_visitor_logs.py et par le planificateur intégré.
+
+Exécuter sur Render via : python migrate_visitor_log_partitions_postgres.py
+Options :
+    --keep-legacy   Conserve l'ancienne table sous le nom 'visitor_log_legacy'
+
+La migration se fait dans une seule transaction (la table est verrouillée
+pendant la copie : à lancer en heure creuse).
+"""
+import sys
+from datetime import datetime
+
+from app import app, db
+import visitor_retention
+
+
+def migrate(keep_legacy=False):
+    with app.app_context():
+        if db.engine.dialect.name != "postgresql":
+            print("ℹ️  Partitionnement disponible uniquement sur PostgreSQL : rien à faire.")
+            return
+        if visitor_retention.is_partitioned():
+            print("ℹ️  La table 'visitor_log' est déjà partitionnée.")
+            return
+
+        try:
+            print("🔧 Partitionnement de 'visitor_log' par mois (PostgreSQL)...")
+            sequence = db.session.execute(db.text(
+                "SELECT pg_get_serial_sequence('visitor_log', 'id')"
+            )).scalar()
+            first_visit = db.session.execute(db.text("SELECT MIN(visited_at) FROM visitor_log")).scalar()
+
+            # 1. Mettre l'ancienne table de côté (la séquence des id est conservée)
+            db.session.execute(db.text(f"ALTER SEQUENCE {sequence} OWNED BY NONE"))
+            db.session.execute(db.text("ALTER TABLE visitor_log RENAME TO visitor_log_legacy"))
+            # Renommer aussi ses index (dont la clé primaire) pour libérer les noms
+            legacy_indexes = db.session.execute(db.text(
+                "SELECT indexname FROM pg_indexes WHERE tablename = 'visitor_log_legacy'"
+            )).scalars().all()
+            for index_name in legacy_indexes:
+                db.session.execute(db.text(
+                    f"ALTER INDEX {index_name} RENAME TO {index_name.replace('visitor_log', 'visitor_log_legacy', 1)}"
+                ))
+
+            # 2. Table partitionnée (la clé de partition doit faire partie de la clé primaire)
+            db.session.execute(db.text(f"""
+                CREATE TABLE visitor_log (
+                    id INTEGER NOT NULL DEFAULT nextval('{sequence}'),
+                    visited_at TIMESTAMP NOT NULL,
+                    page_url VARCHAR(300) NOT NULL,
+                    referrer VARCHAR(300),
+                    user_agent VARCHAR(300),
+                    ip_anonymized VARCHAR(20),
+                    session_id VARCHAR(50),
+                    user_id INTEGER REFERENCES users(id),
+                    city VARCHAR(100),
+                    region VARCHAR(100),
+                    country VARCHAR(50),
+                    isp VARCHAR(150),
+                    is_bot BOOLEAN NOT NULL DEFAULT FALSE,
+                    PRIMARY KEY (id, visited_at)
+                ) PARTITION BY RANGE (visited_at)
+            """))
+            db.session.execute(db.text(f"ALTER SEQUENCE {sequence} OWNED BY visitor_log.id"))
+            # Filet de sécurité pour les dates hors des partitions mensuelles
+            db.session.execute(db.text("CREATE TABLE visitor_log_default PARTITION OF visitor_log DEFAULT"))
+
+            # 3. Partitions mensuelles (historique + mois à venir)
+            created = visitor_retention.ensure_partitions(
+                app.config.get("RETENTION_PARTITIONS_AHEAD", 2),
+                from_month=first_visit or datetime.utcnow(),
+                commit=False,
+            )
+            print(f"✅ {len(created)} partitions créées ({created[0]} → {created[-1]})")
+
+            # 4. Copie des données
+            copied = db.session.execute(db.text("""
+                INSERT INTO visitor_log
+                    (id, visited_at, page_url, referrer, user_agent, ip_anonymized, session_id,
+                     user_id, city, region, country, isp, is_bot)
+                SELECT id, visited_at, page_url, referrer, user_agent, ip_anonymized, session_id,
+                       user_id, city, region, country, isp, COALESCE(is_bot, FALSE)
+                FROM visitor_log_legacy
+            """)).rowcount
+            print(f"✅ {copied} visites copiées")
+
+            # 5. Ancienne table
+            if not keep_legacy:
+                db.session.execute(db.text("DROP TABLE visitor_log_legacy"))
+
+            # 6. Index (propagés automatiquement à chaque partition)
+            db.session.execute(db.text("CREATE INDEX ix_visitor_log_visited_at ON visitor_log (visited_at)"))
+            db.session.execute(db.text("CREATE INDEX ix_visitor_log_session_id ON visitor_log (session_id)"))
+            db.session.execute(db.text("CREATE INDEX ix_visitor_log_is_bot ON visitor_log (is_bot)"))
+
+            db.session.commit()
+            print("✅ Table 'visitor_log' partitionnée avec succès!")
+            if keep_legacy:
+                print("ℹ️  Ancienne table conservée : 'visitor_log_legacy' (à supprimer après vérification).")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Erreur lors de la migration (aucune modification appliquée) : {e}")
+            raise
+
+
+if __name__ == "__main__":
+    migrate(keep_legacy="--keep-legacy" in sys.argv)
@@ -1,5 +1,6 @@
 # models/models.py
 from datetime import datetime
+from sqlalchemy import case, event, func
 from werkzeug.security import generate_password_hash, check_password_hash
 from . import db
 
@@ -29,6 +30,10 @@ class DemandeAnimation(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+# Listes publiques des appels d'offres : ORDER BY created_at DESC, id DESC (pagination par curseur)
+db.Index("ix_demande_animation_created", DemandeAnimation.created_at.desc(), DemandeAnimation.id.desc())
+
+
 class User(db.Model):
     __tablename__ = "users"
 
@@ -51,6 +56,39 @@ class User(db.Model):
         return check_password_hash(self.password_hash, password)
 
 
+# Étiquettes normalisées des spectacles (catégories et villes), synchronisées
+# depuis Show.category / Show.location (voir catalogue_tags.py)
+show_category = db.Table(
+    "show_category",
+    db.Column("show_id", db.Integer, db.ForeignKey("shows.id", ondelete="CASCADE"), primary_key=True),
+    db.Column("category_id", db.Integer, db.ForeignKey("category.id", ondelete="CASCADE"), primary_key=True),
+    db.Index("ix_show_category_category_show", "category_id", "show_id"),
+)
+
+show_city = db.Table(
+    "show_city",
+    db.Column("show_id", db.Integer, db.ForeignKey("shows.id", ondelete="CASCADE"), primary_key=True),
+    db.Column("city_id", db.Integer, db.ForeignKey("city.id", ondelete="CASCADE"), primary_key=True),
+    db.Index("ix_show_city_city_show", "city_id", "show_id"),
+)
+
+
+class Category(db.Model):
+    __tablename__ = "category"
+
+    id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(200), unique=True, nullable=False)  # minuscules, sans accents : "spectacle-enfant"
+    name = db.Column(db.String(200), nullable=False)  # libellé affiché : "Spectacle enfant"
+
+
+class City(db.Model):
+    __tablename__ = "city"
+
+    id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(200), unique=True, nullable=False)  # "saint-etienne"
+    name = db.Column(db.String(200), nullable=False)  # "Saint-Étienne"
+
+
 class Show(db.Model):
     __tablename__ = "shows"
 
@@ -71,6 +109,7 @@ class Show(db.Model):
     file_name3 = db.Column(db.String(255), nullable=True)
     file_mimetype3 = db.Column(db.String(120), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     approved = db.Column(db.Boolean, default=False)
     is_featured = db.Column(db.Boolean, default=False)  # True = affiché "à la une" sur la page d'accueil
@@ -79,11 +118,17 @@ class Show(db.Model):
     contact_phone = db.Column(db.String(20), nullable=True)
     site_internet = db.Column(db.String(255), nullable=True)
     display_order = db.Column(db.Integer, default=0)  # Ordre d'affichage (0 = ordre par défaut, plus petit = plus haut)
+    # Priorité de genre dans le catalogue, recalculée à chaque enregistrement (voir genre_rank())
+    genre_rank = db.Column(db.SmallInteger, default=2, server_default="2", nullable=False)
 
     # ⬇⬇⬇ Association au propriétaire (compagnie)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
     user = db.relationship("User", backref="shows")
 
+    # Étiquettes (lecture seule : écrites par catalogue_tags à partir de category / location)
+    categories = db.relationship("Category", secondary=show_category, viewonly=True, order_by="Category.name")
+    cities = db.relationship("City", secondary=show_city, viewonly=True, order_by="City.name")
+
     def is_pdf(self) -> bool:
         return (self.file_mimetype or "").lower().startswith("application/pdf")
 
@@ -123,6 +168,41 @@ class Show(db.Model):
         return len(self.get_all_images())
 
 
+def genre_rank(category) -> int:
+    """Tri du catalogue : à la une (0), enfant (1), autres (2), atelier (3)."""
+    cat = (category or '').strip().lower()
+    if 'à la une' in cat or 'a la une' in cat or 'une' in cat:
+        return 0
+    elif 'enfant' in cat:
+        return 1
+    elif 'atelier' in cat:
+        return 3
+    else:
+        return 2
+
+
+def genre_rank_sql(column):
+    """Équivalent SQL de genre_rank() (remplissage des lignes existantes)."""
+    cat = func.lower(func.coalesce(column, ''))
+    return case(
+        (cat.contains('une'), 0),
+        (cat.contains('enfant'), 1),
+        (cat.contains('atelier'), 3),
+        else_=2,
+    )
+
+
+@event.listens_for(Show, "before_insert")
+@event.listens_for(Show, "before_update")
+def _set_genre_rank(mapper, connection, show):
+    show.genre_rank = genre_rank(show.category)
+
+
+# Tri du catalogue entièrement en base : ORDER BY genre_rank, display_order, created_at DESC, id DESC
+# (id : clé unique de la pagination par curseur, voir keyset_pagination.py)
+db.Index("ix_shows_catalogue_order_v2", Show.genre_rank, Show.display_order, Show.created_at.desc(), Show.id.desc())
+
+
 # Modèle pour les demandes d'écoles (thèmes pédagogiques)
 class DemandeEcole(db.Model):
     __tablename__ = "demande_ecole"
@@ -190,6 +270,10 @@ class PageVisit(db.Model):
 # Modèle pour le tracking anonymisé des visiteurs (conforme RGPD)
 class VisitorLog(db.Model):
     __tablename__ = "visitor_log"
+    __table_args__ = (
+        # Lecture des sessions récentes (depuis le filigrane) : visiteurs uniques, derniers visiteurs
+        db.Index('ix_visitor_log_visited_session', 'visited_at', 'session_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     visited_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
@@ -211,3 +295,101 @@ class VisitorLog(db.Model):
     
     # Relation avec l'utilisateur (optionnel, si connecté)
     user = db.relationship('User', backref='visit_logs')
+
+
+# Statistiques pré-agrégées par heure / par jour (alimentées par visitor_stats.py)
+class VisitStatsRollup(db.Model):
+    __tablename__ = "visit_stats_rollup"
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'bucket_start', name='uq_visit_stats_rollup_bucket'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(5), nullable=False)  # 'hour' ou 'day'
+    bucket_start = db.Column(db.DateTime, nullable=False, index=True)  # Début de l'heure / du jour (UTC)
+    visits = db.Column(db.Integer, default=0, nullable=False)
+    human_visits = db.Column(db.Integer, default=0, nullable=False)
+    bot_visits = db.Column(db.Integer, default=0, nullable=False)
+    unique_sessions = db.Column(db.Integer, default=0, nullable=False)  # Sessions distinctes dans le bucket
+    unique_humans = db.Column(db.Integer, default=0, nullable=False)
+    unique_bots = db.Column(db.Integer, default=0, nullable=False)
+    # Croquis HyperLogLog des sessions du bucket (voir hyperloglog.py) : fusionnés pour les
+    # visiteurs uniques d'une période ; NULL pour les rollups antérieurs aux croquis
+    sessions_sketch = db.Column(db.LargeBinary, nullable=True)
+    humans_sketch = db.Column(db.LargeBinary, nullable=True)
+    bots_sketch = db.Column(db.LargeBinary, nullable=True)
+
+
+# Répartition des visites par page / référent / ville / région / utilisateur et par bucket
+class VisitStatsDimension(db.Model):
+    __tablename__ = "visit_stats_dimension"
+    __table_args__ = (
+        db.Index('ix_visit_stats_dimension_lookup', 'granularity', 'dimension', 'bucket_start'),
+        db.UniqueConstraint('granularity', 'bucket_start', 'dimension', 'value',
+                            name='uq_visit_stats_dimension_value'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(5), nullable=False)  # 'hour' ou 'day'
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    dimension = db.Column(db.String(20), nullable=False)  # 'page', 'referrer', 'city', 'region', 'user'
+    value = db.Column(db.String(300), nullable=False)
+    visits = db.Column(db.Integer, default=0, nullable=False)
+    human_visits = db.Column(db.Integer, default=0, nullable=False)
+
+
+# Filigranes des tâches de fond : 'hour'/'day' = tout ce qui précède processed_until est agrégé,
+# 'aggregation' = agrégation en cours depuis processed_until (un seul processus à la fois),
+# 'retention' = date de la dernière purge RGPD
+class StatsWatermark(db.Model):
+    __tablename__ = "stats_watermark"
+
+    name = db.Column(db.String(50), primary_key=True)  # 'hour', 'day', 'aggregation', 'retention'...
+    processed_until = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# Version des données publiques du catalogue : incrémentée à chaque écriture sur un spectacle
+# ou un appel d'offres (voir catalogue_cache.CatalogueVersion), partagée par tous les workers
+class CacheVersion(db.Model):
+    __tablename__ = "cache_version"
+
+    name = db.Column(db.String(50), primary_key=True)  # 'catalogue'
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+# Conversion WebP d'une image uploadée, faite en arrière-plan (voir image_jobs.py) : la colonne
+# file_name* du spectacle garde l'original jusqu'à ce que le dérivé la remplace
+class ImageJob(db.Model):
+    __tablename__ = "image_job"
+    __table_args__ = (
+        db.Index('ix_image_job_status', 'status', 'claimed_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    show_id = db.Column(db.Integer, db.ForeignKey("shows.id", ondelete="CASCADE"), nullable=False, index=True)
+    slot = db.Column(db.String(20), nullable=False)  # 'file_name', 'file_name2' ou 'file_name3'
+    source_key = db.Column(db.String(255), nullable=False)  # Original enregistré à l'upload
+    result_key = db.Column(db.String(255), nullable=True)  # Dérivé WebP une fois produit
+    status = db.Column(db.String(12), nullable=False, default="pending")  # pending, running, done, failed, superseded
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime, nullable=True)  # Prise en charge par un worker (reprise si trop ancienne)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+
+# Fichier uploadé (S3 ou local) et nombre de colonnes file_name* qui le désignent (voir media_refs.py) :
+# un fichier qui n'est plus référencé est supprimé par le ramasse-miettes après MEDIA_GC_GRACE
+class MediaObject(db.Model):
+    __tablename__ = "media_object"
+    __table_args__ = (
+        db.Index('ix_media_object_released', 'refcount', 'released_at'),
+    )
+
+    key = db.Column(db.String(255), primary_key=True)  # Nom dans le stockage (dérivé le plus large pour une image)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+    pinned = db.Column(db.Boolean, nullable=False, default=False)  # Original conservé (IMAGE_JOB_KEEP_ORIGINALS)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    released_at = db.Column(db.DateTime, nullable=True)  # Dernier passage à zéro référence (None si référencé)
@@ -0,0 +1,233 @@
+"""
+Cache des pages publiques pour les visiteurs anonymes.
+
+Pour un visiteur non connecté, le HTML de l'accueil, du catalogue sans
+filtre, des événements, des pages thématiques SEO et des pages villes ne
+dépend que de l'URL et du contenu du catalogue. La réponse rendue est
+mémorisée sous la clé « version du catalogue + hôte + chemin + query string
+normalisée » :
+
+- une LRU en mémoire par worker (``PAGE_CACHE_MAX_ENTRIES``, ``PAGE_CACHE_TTL``) ;
+- optionnellement un fichier SQLite partagé par les workers
+  (``PAGE_CACHE_SHARED_PATH``), lu en cas d'absence en mémoire.
+
+Toute écriture sur un spectacle ou un appel d'offres incrémente la version
+du catalogue (voir catalogue_cache.CatalogueVersion) : les anciennes clés ne
+sont plus lues, elles sortent de la LRU ou expirent.
+
+Passent à côté du cache : utilisateurs connectés, messages flash en attente,
+méthodes autres que GET/HEAD, paramètres non prévus par la page (filtres),
+réponses autres que 200 text/html, ayant généré un jeton CSRF ou posé un
+cookie. L'en-tête ``X-Cache`` (HIT / MISS / BYPASS) permet de le vérifier.
+
+Usage (sous @app.route) :
+    @page_cache.cached(allowed_args=("page", "cursor"))
+"""
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import current_app, g, make_response, request, session
+from sqlalchemy.exc import SQLAlchemyError
+
+from geolocation import LRUCache
+from media import url_generation
+
+
+# Paramètres de suivi publicitaire, sans effet sur le contenu de la page
+IGNORED_ARGS = ("fbclid", "gclid", "msclkid")
+IGNORED_PREFIXES = ("utm_",)
+
+
+def normalized_query(allowed_args=()):
+    """Query string triée sans valeurs vides ni paramètres de suivi ; None si un paramètre n'est pas prévu."""
+    items = []
+    for name, value in request.args.items(multi=True):
+        if not value or name in IGNORED_ARGS or name.startswith(IGNORED_PREFIXES):
+            continue
+        if name not in allowed_args:
+            return None
+        items.append((name, value))
+    return urlencode(sorted(items))
+
+
+def is_anonymous_request() -> bool:
+    """Visiteur non connecté sans message flash en attente : HTML identique pour tous."""
+    return not (session.get("username") or session.get("_flashes"))
+
+
+class SharedPageStore:
+    """Pages partagées entre workers dans un fichier SQLite (une connexion par thread et par processus)."""
+
+    PURGE_EVERY = 200  # écritures entre deux purges des entrées expirées
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS page_cache (
+                    key TEXT PRIMARY KEY,
+                    body BLOB NOT NULL,
+                    content_type TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _conn(self) -> sqlite3.Connection:
+        # Nouvelle connexion après un fork (les connexions SQLite ne se partagent pas)
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.conn = self._connect()
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def get(self, key: str):
+        """((corps, content-type), secondes restantes) ou None."""
+        row = self._conn().execute(
+            "SELECT body, content_type, expires_at FROM page_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if not row:
+            return None
+        remaining = row[2] - time.time()
+        if remaining <= 0:
+            return None
+        return (row[0], row[1]), remaining
+
+    def set(self, key: str, entry: tuple, ttl: float) -> None:
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO page_cache (key, body, content_type, expires_at) VALUES (?, ?, ?, ?)",
+            (key, entry[0], entry[1], time.time() + ttl),
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM page_cache WHERE expires_at < ?", (time.time(),))
+        conn.commit()
+
+
+class PageCache:
+    """Cache des réponses HTML anonymes, indexé par la version du catalogue."""
+
+    def __init__(self, version, ttl: float = 300, maxsize: int = 500, shared=None, enabled: bool = True):
+        self.version = version
+        self.ttl = ttl
+        self.enabled = enabled
+        self.memory = LRUCache(maxsize, ttl)
+        self.shared = shared
+
+    @classmethod
+    def from_app(cls, app, version) -> "PageCache":
+        cfg = app.config
+        shared = None
+        shared_path = cfg.get("PAGE_CACHE_SHARED_PATH")
+        if shared_path:
+            try:
+                shared = SharedPageStore(shared_path)
+            except Exception as e:
+                app.logger.warning(f"[PAGE_CACHE] Cache partagé désactivé ({shared_path}): {e}")
+        return cls(
+            version,
+            ttl=cfg.get("PAGE_CACHE_TTL", 300),
+            maxsize=cfg.get("PAGE_CACHE_MAX_ENTRIES", 500),
+            shared=shared,
+            enabled=cfg.get("PAGE_CACHE_ENABLED", True),
+        )
+
+    # ---------------------------
+    # Stockage
+    # ---------------------------
+    def get(self, key: str):
+        entry = self.memory.get(key)
+        if entry is not None or self.shared is None:
+            return entry
+        try:
+            found = self.shared.get(key)
+        except sqlite3.Error as e:
+            current_app.logger.warning(f"[PAGE_CACHE] Lecture du cache partagé impossible : {e}")
+            return None
+        if found is None:
+            return None
+        entry, remaining = found
+        self.memory.set(key, entry, ttl=remaining)
+        return entry
+
+    def set(self, key: str, entry: tuple) -> None:
+        self.memory.set(key, entry)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, entry, self.ttl)
+            except sqlite3.Error as e:
+                current_app.logger.warning(f"[PAGE_CACHE] Écriture du cache partagé impossible : {e}")
+
+    # ---------------------------
+    # Requêtes
+    # ---------------------------
+    def key_for_request(self, allowed_args=()):
+        """Clé de la requête courante, ou None si elle ne doit pas passer par le cache."""
+        if not self.enabled or request.method not in ("GET", "HEAD"):
+            return None
+        if not is_anonymous_request():
+            return None
+        query = normalized_query(allowed_args)
+        if query is None:
+            return None
+        try:
+            version, _ = self.version.get()
+        except SQLAlchemyError as e:
+            current_app.logger.warning(f"[PAGE_CACHE] Version du catalogue illisible : {e}")
+            return None
+        # Fenêtre des URL présignées des images (voir media.py) : jamais d'URL expirée en cache
+        return f"{version}.{url_generation(current_app)}:{request.host}{request.path}?{query}"
+
+    @staticmethod
+    def storable(response) -> bool:
+        csrf_field = current_app.config.get("WTF_CSRF_FIELD_NAME", "csrf_token")
+        return (
+            response.status_code == 200
+            and response.mimetype == "text/html"
+            and not response.direct_passthrough
+            and "Set-Cookie" not in response.headers
+            and csrf_field not in g
+        )
+
+    def cached(self, allowed_args=(), before=None):
+        """
+        Décorateur de vue. ``allowed_args`` : paramètres de query string qui
+        changent la page sans la personnaliser (pagination) ; tout autre
+        paramètre non vide fait passer la requête à côté du cache.
+        ``before`` : fonction exécutée à chaque requête, y compris servie depuis le cache.
+        """
+        allowed_args = tuple(allowed_args)
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if before is not None:
+                    before()
+                key = self.key_for_request(allowed_args)
+                if key is not None:
+                    entry = self.get(key)
+                    if entry is not None:
+                        response = current_app.response_class(entry[0], content_type=entry[1])
+                        response.headers["X-Cache"] = "HIT"
+                        return response
+
+                response = make_response(view(*args, **kwargs))
+                if key is not None and self.storable(response):
+                    self.set(key, (response.get_data(), response.content_type))
+                    response.headers["X-Cache"] = "MISS"
+                else:
+                    response.headers["X-Cache"] = "BYPASS"
+                return response
+            return wrapper
+        return decorator
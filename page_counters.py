@@ -0,0 +1,173 @@
+"""
+Compteurs de visites par page (table ``page_visit``) sans écriture par requête.
+
+Les incréments sont accumulés en mémoire dans chaque worker puis écrits
+périodiquement par un ``UPDATE page_visit SET visit_count = visit_count + :n``
+atomique : aucune mise à jour perdue entre workers, une seule requête par page
+et par intervalle quelle que soit l'affluence.
+
+La lecture renvoie la dernière valeur lue en base (rafraîchie à chaque flush)
+plus les incréments locaux pas encore écrits, y compris ceux en cours
+d'écriture : le compteur affiché ne baisse jamais pendant un flush.
+
+Usage :
+    counters = current_app.extensions["page_counters"]
+    counters.increment("home")
+    counters.get("home")
+"""
+import atexit
+import os
+import threading
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+from models.models import PageVisit
+
+
+class PageCounters:
+    """Compteurs en mémoire + flush atomique périodique."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._pending = Counter()
+        self._inflight = Counter()  # Incréments en cours d'écriture, comptés jusqu'au rafraîchissement de _values
+        self._values = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.app = app
+        # 0 = écriture immédiate (scripts, tests)
+        self.flush_interval = float(app.config.get("PAGE_COUNTER_FLUSH_INTERVAL", 10))
+        app.extensions["page_counters"] = self
+        atexit.register(self.shutdown)
+
+    # -------------------------------------------------
+    # Côté requête
+    # -------------------------------------------------
+    def increment(self, page_name: str, n: int = 1) -> None:
+        with self._lock:
+            self._pending[page_name] += n
+        if self.flush_interval <= 0:
+            self.flush()
+        else:
+            self._ensure_worker()
+
+    def get(self, page_name: str) -> int:
+        """Valeur en base (mise en cache) + incréments locaux en attente ou en cours d'écriture."""
+        with self._lock:
+            value = self._values.get(page_name)
+            pending = self._pending.get(page_name, 0) + self._inflight.get(page_name, 0)
+        if value is None:
+            value = self._load(page_name)
+        return value + pending
+
+    def _load(self, page_name: str) -> int:
+        value = db.session.execute(
+            select(PageVisit.visit_count).where(PageVisit.page_name == page_name)
+        ).scalar() or 0
+        with self._lock:
+            self._values.setdefault(page_name, value)
+        return value
+
+    def _ensure_worker(self) -> None:
+        """Démarre le thread de flush (paresseusement, et à nouveau après un fork)."""
+        pid = os.getpid()
+        if self._thread is not None and self._thread.is_alive() and self._pid == pid:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == pid:
+                return
+            if self._pid is not None and self._pid != pid:
+                # Processus enfant : les incréments du parent lui appartiennent
+                self._pending = Counter()
+                self._inflight = Counter()
+            self._pid = pid
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="page-counters", daemon=True)
+            self._thread.start()
+
+    # -------------------------------------------------
+    # Côté thread d'arrière-plan
+    # -------------------------------------------------
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self) -> int:
+        """Écrit les incréments en attente puis rafraîchit les valeurs en cache. Retourne le nombre de pages écrites."""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._inflight.update(pending)
+            names = set(self._values) | set(pending)
+        if not names:
+            return 0
+
+        with self.app.app_context():
+            try:
+                now = datetime.utcnow()
+                for page_name, n in pending.items():
+                    self._add(page_name, n, now)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                # Remettre les incréments en attente pour le prochain flush
+                with self._lock:
+                    self._inflight.subtract(pending)
+                    self._inflight += Counter()  # Retire les entrées à zéro
+                    self._pending.update(pending)
+                self.app.logger.warning(f"[COMPTEUR] Erreur lors de l'écriture des compteurs: {e}")
+                return 0
+
+            try:
+                rows = db.session.execute(
+                    select(PageVisit.page_name, PageVisit.visit_count).where(PageVisit.page_name.in_(names))
+                ).all()
+                with self._lock:
+                    self._values.update({name: count or 0 for name, count in rows})
+                    self._inflight.subtract(pending)
+                    self._inflight += Counter()
+            except Exception as e:
+                db.session.rollback()
+                # Incréments écrits mais valeurs non relues : les reporter dans le cache
+                with self._lock:
+                    for page_name, n in pending.items():
+                        if page_name in self._values:
+                            self._values[page_name] += n
+                    self._inflight.subtract(pending)
+                    self._inflight += Counter()
+                self.app.logger.warning(f"[COMPTEUR] Erreur lors de la lecture des compteurs: {e}")
+        return len(pending)
+
+    def _add(self, page_name: str, n: int, now: datetime) -> None:
+        updated = db.session.execute(
+            update(PageVisit)
+            .where(PageVisit.page_name == page_name)
+            .values(visit_count=PageVisit.visit_count + n, last_visit=now)
+        ).rowcount
+        if updated:
+            return
+        # Première visite de cette page : créer la ligne (un autre worker peut la créer en même temps)
+        try:
+            with db.session.begin_nested():
+                db.session.add(PageVisit(page_name=page_name, visit_count=n, last_visit=now))
+        except IntegrityError:
+            db.session.execute(
+                update(PageVisit)
+                .where(PageVisit.page_name == page_name)
+                .values(visit_count=PageVisit.visit_count + n, last_visit=now)
+            )
+
+    def shutdown(self) -> None:
+        """Écrit les incréments restants avant l'arrêt du worker (appelé via atexit)."""
+        self._stop.set()
+        if self.app is not None and self._pid in (None, os.getpid()) and self._pending:
+            self.flush()
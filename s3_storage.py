@@ -0,0 +1,144 @@
+"""
+Client S3 partagé par tous les accès au stockage (upload, suppression,
+lecture /uploads, health check).
+
+Un seul client boto3 par processus, créé à la première utilisation (donc
+après le fork des workers gunicorn) et recréé si le PID change : création
+de session, résolution de l'endpoint et poignées TLS ne sont faites qu'une
+fois, les connexions HTTPS sont réutilisées par le pool de botocore.
+
+Réglages (config.py) : taille du pool (``S3_MAX_POOL_CONNECTIONS``),
+tentatives au total (``S3_MAX_ATTEMPTS``, mode « standard »), délais de connexion
+et de lecture (``S3_CONNECT_TIMEOUT`` / ``S3_READ_TIMEOUT``).
+
+Chaque appel passé par ``timed(operation)`` est chronométré (nombre,
+erreurs, durée moyenne / max / dernière) ; les compteurs sont exposés par
+/health/s3.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+except ImportError:
+    boto3 = None
+    BotoConfig = None
+
+
+class S3Storage:
+    """Client S3 paresseux, un par processus, et chronométrage des appels."""
+
+    def __init__(self, bucket=None, key=None, secret=None, region=None,
+                 max_pool_connections: int = 20, max_attempts: int = 3,
+                 connect_timeout: float = 3, read_timeout: float = 10, logger=None):
+        self.bucket = bucket
+        self.region = region
+        self._credentials = (key, secret)
+        self.max_pool_connections = max_pool_connections
+        self.max_attempts = max_attempts
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.logger = logger
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.op_stats = {}
+
+    @classmethod
+    def from_app(cls, app) -> "S3Storage":
+        cfg = app.config
+        return cls(
+            bucket=cfg.get("S3_BUCKET"),
+            key=cfg.get("S3_KEY"),
+            secret=cfg.get("S3_SECRET"),
+            region=cfg.get("S3_REGION"),
+            max_pool_connections=cfg.get("S3_MAX_POOL_CONNECTIONS", 20),
+            max_attempts=cfg.get("S3_MAX_ATTEMPTS", 3),
+            connect_timeout=cfg.get("S3_CONNECT_TIMEOUT", 3),
+            read_timeout=cfg.get("S3_READ_TIMEOUT", 10),
+            logger=app.logger,
+        )
+
+    @property
+    def configured(self) -> bool:
+        key, secret = self._credentials
+        return bool(self.bucket and key and secret and boto3)
+
+    def client(self):
+        """Client S3 du processus courant, ou None si S3 n'est pas configuré."""
+        if not self.configured:
+            return None
+        if self._pid == os.getpid() and self._client is not None:
+            return self._client
+        with self._lock:
+            # Nouveau client après un fork (le pool de connexions ne se partage pas entre processus)
+            if self._pid != os.getpid() or self._client is None:
+                key, secret = self._credentials
+                # Session dédiée : la session boto3 par défaut n'est pas thread-safe
+                session = boto3.session.Session(
+                    aws_access_key_id=key,
+                    aws_secret_access_key=secret,
+                    region_name=self.region,
+                )
+                self._client = session.client("s3", config=BotoConfig(
+                    max_pool_connections=self.max_pool_connections,
+                    retries={"total_max_attempts": self.max_attempts, "mode": "standard"},
+                    connect_timeout=self.connect_timeout,
+                    read_timeout=self.read_timeout,
+                    tcp_keepalive=True,
+                    # URL présignées sur l'hôte régional du bucket (voir media.csp_img_sources)
+                    signature_version="s3v4",
+                    s3={"addressing_style": "virtual"},
+                ))
+                self._pid = os.getpid()
+                if self.logger:
+                    self.logger.info(f"[S3] Client créé (pid {self._pid}, pool {self.max_pool_connections})")
+        return self._client
+
+    # ---------------------------
+    # Chronométrage
+    # ---------------------------
+    @contextmanager
+    def timed(self, operation: str, key: str = ""):
+        started = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._stats_lock:
+                stats = self.op_stats.setdefault(
+                    operation, {'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'last_ms': 0.0}
+                )
+                stats['calls'] += 1
+                stats['errors'] += failed
+                stats['total_ms'] += elapsed_ms
+                stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+                stats['last_ms'] = elapsed_ms
+            if self.logger and operation == "upload":
+                self.logger.info(f"[S3] {operation} {key} : {elapsed_ms:.0f} ms{' (échec)' if failed else ''}")
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                'client_ready': self._client is not None and self._pid == os.getpid(),
+                'pid': os.getpid(),
+                'max_pool_connections': self.max_pool_connections,
+                'operations': {
+                    name: {
+                        'calls': s['calls'],
+                        'errors': s['errors'],
+                        'avg_ms': round(s['total_ms'] / s['calls'], 3) if s['calls'] else 0.0,
+                        'max_ms': round(s['max_ms'], 3),
+                        'last_ms': round(s['last_ms'], 3),
+                    }
+                    for name, s in self.op_stats.items()
+                },
+            }
@@ -0,0 +1,208 @@
+"""
+Génération du sitemap : XML envoyé en flux, mis en cache jusqu'à la
+prochaine écriture sur le catalogue, découpé selon les limites du protocole.
+
+Trois sections :
+    - ``pages``      : accueil, formulaires, pages thématiques SEO
+    - ``villes``     : pages SEO des villes (seo_cities.py)
+    - ``spectacles`` : fiches des spectacles validés (seules les colonnes
+      id et date de modification sont lues, par lots)
+
+Tant que le total tient dans un seul fichier (``SITEMAP_MAX_URLS``, 50 000
+URL selon le protocole), ``/sitemap.xml`` est une urlset complète. Au-delà,
+``/sitemap.xml`` devient un index (sitemapindex) vers
+``/sitemap-<section>-<n>.xml``, chacun limité à ``SITEMAP_MAX_URLS`` URL.
+Une entrée fait moins de 300 octets : 50 000 URL restent loin de la limite
+de 50 Mo par fichier non compressé.
+
+Chaque fichier est mémorisé (LRU par worker) sous la version du catalogue :
+la première requête après une écriture sur un spectacle le régénère.
+"""
+import math
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+from flask import Response, current_app, request, stream_with_context, url_for
+from sqlalchemy import func, select
+from werkzeug.routing import BuildError
+
+from geolocation import LRUCache
+from models import db
+from models.models import Show
+from seo_cities import get_all_city_slugs
+
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+NAMESPACE = "http://www.sitemaps.org/schemas/sitemap/0.9"
+BATCH_SIZE = 500  # URL par morceau envoyé / lignes lues par lot
+
+# Pages fixes : (endpoint, changefreq, priority)
+STATIC_PAGES = (
+    ("home", "daily", "1.0"),
+    ("demande_animation", "monthly", "0.8"),
+    # Pages thématiques SEO (haute priorité)
+    ("spectacles_enfants", "weekly", "0.9"),
+    ("animations_enfants", "weekly", "0.9"),
+    ("spectacles_noel", "weekly", "0.85"),
+    ("animations_entreprises", "weekly", "0.9"),
+    ("marionnettes", "weekly", "0.85"),
+    ("magiciens", "weekly", "0.85"),
+    ("clowns", "weekly", "0.85"),
+    ("animations_anniversaire", "weekly", "0.85"),
+    ("booker_artiste", "weekly", "0.8"),
+    ("demandes_animation", "weekly", "0.8"),
+)
+
+
+def url_entry(loc: str, lastmod=None, changefreq=None, priority=None) -> str:
+    parts = [f"  <url>\n    <loc>{escape(loc)}</loc>\n"]
+    if lastmod:
+        parts.append(f"    <lastmod>{lastmod.strftime('%Y-%m-%d')}</lastmod>\n")
+    if changefreq:
+        parts.append(f"    <changefreq>{changefreq}</changefreq>\n")
+    if priority:
+        parts.append(f"    <priority>{priority}</priority>\n")
+    parts.append("  </url>\n")
+    return "".join(parts)
+
+
+def _catalogue_changed_at():
+    _, changed_at = current_app.extensions["catalogue_version"].get()
+    return changed_at
+
+
+# ---------------------------
+# Sections : (nombre d'URL, entrées [offset, offset + limit[)
+# ---------------------------
+def _static_entries(offset: int, limit: int):
+    # Accueil daté de la dernière écriture sur le catalogue (stable entre deux écritures)
+    home_lastmod = _catalogue_changed_at() or datetime.utcnow()
+    for endpoint, changefreq, priority in STATIC_PAGES[offset:offset + limit]:
+        try:
+            loc = url_for(endpoint, _external=True)
+        except BuildError:
+            continue  # Route absente : ignorée
+        yield url_entry(loc, home_lastmod if endpoint == "home" else None, changefreq, priority)
+
+
+def _city_entries(offset: int, limit: int):
+    for city_slug in get_all_city_slugs()[offset:offset + limit]:
+        yield url_entry(url_for("city_spectacles", city_slug=city_slug, _external=True), None, "weekly", "0.8")
+
+
+def _show_count() -> int:
+    return db.session.query(func.count(Show.id)).filter(Show.approved.is_(True)).scalar() or 0
+
+
+def _show_entries(offset: int, limit: int):
+    query = select(Show.id, func.coalesce(Show.updated_at, Show.created_at)) \
+        .where(Show.approved.is_(True)).order_by(Show.id).offset(offset).limit(limit) \
+        .execution_options(yield_per=BATCH_SIZE)
+    for show_id, modified_at in db.session.execute(query):
+        yield url_entry(url_for("show_detail", show_id=show_id, _external=True), modified_at, "weekly", "0.7")
+
+
+SECTIONS = {
+    "pages": (lambda: len(STATIC_PAGES), _static_entries),
+    "villes": (lambda: len(get_all_city_slugs()), _city_entries),
+    "spectacles": (_show_count, _show_entries),
+}
+
+
+def _batched(entries):
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= BATCH_SIZE:
+            yield "".join(batch)
+            batch = []
+    if batch:
+        yield "".join(batch)
+
+
+class Sitemap:
+    """Fichiers du sitemap, générés en flux et mémorisés par version du catalogue."""
+
+    def __init__(self, max_urls: int = 50000, cache_ttl: float = 86400, cache_size: int = 8):
+        self.max_urls = max_urls
+        # Peu d'entrées : un fichier peut peser plusieurs Mo
+        self.cache = LRUCache(cache_size, cache_ttl)
+
+    @classmethod
+    def from_app(cls, app) -> "Sitemap":
+        return cls(
+            max_urls=app.config.get("SITEMAP_MAX_URLS", 50000),
+            cache_ttl=app.config.get("SITEMAP_CACHE_TTL", 86400),
+        )
+
+    @staticmethod
+    def counts() -> dict:
+        return {name: count() for name, (count, _) in SECTIONS.items()}
+
+    def shards(self, counts: dict) -> list:
+        """[(section, numéro)] des fichiers de l'index."""
+        return [
+            (name, page)
+            for name, count in counts.items()
+            for page in range(1, math.ceil(count / self.max_urls) + 1)
+        ]
+
+    # ---------------------------
+    # Génération
+    # ---------------------------
+    def _urlset(self, parts):
+        """parts : [(section, offset, limit)]"""
+        yield XML_HEADER + f'<urlset xmlns="{NAMESPACE}">\n'
+        for name, offset, limit in parts:
+            _, entries = SECTIONS[name]
+            yield from _batched(entries(offset, limit))
+        yield "</urlset>\n"
+
+    def _index(self, shards):
+        lastmod = _catalogue_changed_at() or datetime.utcnow()
+        yield XML_HEADER + f'<sitemapindex xmlns="{NAMESPACE}">\n'
+        for name, page in shards:
+            loc = url_for("sitemap_section", section=name, page=page, _external=True)
+            yield f"  <sitemap>\n    <loc>{escape(loc)}</loc>\n" \
+                  f"    <lastmod>{lastmod.strftime('%Y-%m-%d')}</lastmod>\n  </sitemap>\n"
+        yield "</sitemapindex>\n"
+
+    def _respond(self, name: str, build):
+        """Réponse depuis le cache, sinon XML envoyé au fil de la génération puis mémorisé."""
+        version, _ = current_app.extensions["catalogue_version"].get()
+        key = f"{version}:{request.url_root}{name}"
+        body = self.cache.get(key)
+        if body is not None:
+            return Response(body, mimetype="application/xml")
+        chunks = build()
+        if chunks is None:
+            return None
+
+        def stream():
+            sent = []
+            for chunk in chunks:
+                sent.append(chunk)
+                yield chunk
+            self.cache.set(key, "".join(sent))
+
+        return Response(stream_with_context(stream()), mimetype="application/xml")
+
+    def root_response(self):
+        """/sitemap.xml : urlset complète, ou index si le total dépasse la limite d'un fichier."""
+        def build():
+            counts = self.counts()
+            if sum(counts.values()) > self.max_urls:
+                return self._index(self.shards(counts))
+            return self._urlset([(name, 0, count) for name, count in counts.items()])
+        return self._respond("sitemap.xml", build)
+
+    def section_response(self, section: str, page: int):
+        """/sitemap-<section>-<n>.xml ; None si la section ou le numéro n'existe pas."""
+        def build():
+            if section not in SECTIONS:
+                return None
+            count, _ = SECTIONS[section]
+            if page < 1 or (page - 1) * self.max_urls >= max(count(), 1):
+                return None
+            return self._urlset([(section, (page - 1) * self.max_urls, self.max_urls)])
+        return self._respond(f"sitemap-{section}-{page}.xml", build)
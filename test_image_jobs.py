@@ -0,0 +1,135 @@
+"""
+Conversion WebP des uploads (image_jobs.py) avec IMAGE_JOB_WORKERS = 0 : remplacement
+conditionnel de la colonne, tâche « superseded », image refusée à l'en-tête
+"""
+import struct
+import unittest
+import uuid
+import zlib
+from io import BytesIO
+
+from PIL import Image
+
+from app import app
+from image_jobs import ImageJobQueue
+from image_processing import to_webp_ladder
+from models import db
+from models.models import ImageJob, MediaObject, Show
+
+
+WIDTHS = (320, 640)
+
+
+class MemoryStore:
+    """Stockage en mémoire (mêmes méthodes que media_store utilisées par les tâches)."""
+
+    def __init__(self):
+        self.files = {}
+
+    def put(self, key, data, content_type=None):
+        self.files[key] = data
+
+    def get(self, key):
+        return self.files.get(key)
+
+
+def jpeg(size=(1200, 800)) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", size, (30, 120, 200)).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def declared_png(width: int, height: int) -> bytes:
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(b"")) + chunk(b"IEND", b"")
+
+
+class ImageJobsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.test_request_context("/")
+        self.ctx.push()
+        self.saved_extensions = {name: app.extensions.get(name) for name in ("image_jobs", "media_store")}
+        self.saved_config = {name: app.config.get(name) for name in ("IMAGE_JOB_WORKERS", "IMAGE_WIDTHS")}
+        app.config.update(IMAGE_JOB_WORKERS=0, IMAGE_WIDTHS=WIDTHS)
+        self.store = MemoryStore()
+        app.extensions["media_store"] = self.store
+        self.queue = ImageJobQueue(app)
+        self.shows = []
+
+    def tearDown(self):
+        db.session.rollback()
+        for show in self.shows:
+            ImageJob.query.filter_by(show_id=show.id).delete()
+            if db.session.get(Show, show.id) is not None:
+                db.session.delete(show)
+        db.session.commit()
+        app.config.update(self.saved_config)
+        app.extensions.update(self.saved_extensions)
+        self.ctx.pop()
+
+    def add_show(self, data: bytes, extension: str = "jpg") -> Show:
+        key = f"{uuid.uuid4().hex}.{extension}"
+        self.store.put(key, data)
+        show = Show(title="image-jobs-test", file_name=key, file_mimetype="image/jpeg")
+        db.session.add(show)
+        db.session.commit()
+        self.shows.append(show)
+        return show
+
+    def reload(self, model, ident):
+        db.session.expire_all()
+        return db.session.get(model, ident)
+
+    def test_conversion_swaps_column(self):
+        show = self.add_show(jpeg())
+        original = show.file_name
+        job_id = self.queue.enqueue(show.id, "file_name", original, self.store.get(original))
+
+        job = self.reload(ImageJob, job_id)
+        stem = original.rsplit(".", 1)[0]
+        self.assertEqual(job.status, "done")
+        self.assertEqual(job.result_key, f"{stem}-640w.webp")
+        show = self.reload(Show, show.id)
+        self.assertEqual((show.file_name, show.file_mimetype), (job.result_key, "image/webp"))
+        self.assertIn(f"{stem}-320w.webp", self.store.files)
+        # Références : le dérivé est utilisé, l'original est libéré pour le ramasse-miettes
+        self.assertEqual(self.reload(MediaObject, job.result_key).refcount, 1)
+        self.assertEqual(self.reload(MediaObject, original).refcount, 0)
+
+    def test_replaced_image_is_superseded(self):
+        show = self.add_show(jpeg())
+        original, replacement = show.file_name, f"{uuid.uuid4().hex}.jpg"
+
+        def convert_while_replaced(data):
+            # Nouvelle image enregistrée pendant la conversion
+            db.session.get(Show, show.id).file_name = replacement
+            db.session.commit()
+            return to_webp_ladder(data, WIDTHS)
+
+        self.queue._convert = convert_while_replaced
+        job_id = self.queue.enqueue(show.id, "file_name", original, self.store.get(original))
+
+        job = self.reload(ImageJob, job_id)
+        self.assertEqual(job.status, "superseded")
+        self.assertEqual(self.reload(Show, show.id).file_name, replacement)
+        # Dérivés sans référence : laissés au ramasse-miettes
+        derivative = self.reload(MediaObject, job.result_key)
+        self.assertEqual(derivative.refcount, 0)
+        self.assertIsNotNone(derivative.released_at)
+        self.assertEqual(self.reload(MediaObject, replacement).refcount, 1)
+        self.assertEqual(self.queue.stats()["superseded"], 1)
+
+    def test_rejected_image_fails_without_retry(self):
+        show = self.add_show(declared_png(20000, 20000), "png")
+        job_id = self.queue.enqueue(show.id, "file_name", show.file_name, self.store.get(show.file_name))
+
+        job = self.reload(ImageJob, job_id)
+        self.assertEqual((job.status, job.attempts), ("failed", 1))
+        self.assertIn("Image trop grande", job.error)
+        self.assertEqual(self.reload(Show, show.id).file_name, show.file_name)
+
+
+if __name__ == "__main__":
+    unittest.main()
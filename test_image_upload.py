@@ -0,0 +1,79 @@
+"""
+Contrôle des uploads avant décodage (image_processing.inspect_upload / open_image)
+"""
+import struct
+import time
+import unittest
+import zlib
+from io import BytesIO
+
+from PIL import Image
+
+from image_processing import InvalidUpload, inspect_upload, open_image
+
+
+MAX_PIXELS = 25_000_000
+
+
+def png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def declared_png(width: int, height: int) -> bytes:
+    """PNG de quelques octets dont l'en-tête annonce width × height pixels."""
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + png_chunk(b"IHDR", header)
+            + png_chunk(b"IDAT", zlib.compress(b"")) + png_chunk(b"IEND", b""))
+
+
+def encoded(size, fmt: str) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", size, (200, 40, 40)).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+class InspectUploadTestCase(unittest.TestCase):
+    def test_rejects_declared_decompression_bomb(self):
+        data = declared_png(20000, 20000)
+        self.assertLess(len(data), 100)
+        started = time.perf_counter()
+        with self.assertRaises(InvalidUpload) as raised:
+            inspect_upload(BytesIO(data), MAX_PIXELS)
+        # Refus sur l'en-tête seul : aucune décompression de 400 millions de pixels
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertIn("Image trop grande", str(raised.exception))
+        self.assertIn("25 millions", str(raised.exception))
+
+    def test_rejects_image_above_max_pixels(self):
+        # Sous le seuil de Pillow (DecompressionBombError) : c'est max_pixels qui refuse
+        with self.assertRaises(InvalidUpload) as raised:
+            inspect_upload(BytesIO(declared_png(9000, 9000)), MAX_PIXELS)
+        self.assertIn("9000 × 9000", str(raised.exception))
+
+    def test_accepts_image_and_rewinds(self):
+        fp = BytesIO(encoded((640, 480), "JPEG"))
+        info = inspect_upload(fp, MAX_PIXELS)
+        self.assertEqual((info.format, info.mimetype, info.width, info.height), ("JPEG", "image/jpeg", 640, 480))
+        self.assertEqual(fp.tell(), 0)
+
+    def test_pdf_is_identified_by_signature(self):
+        info = inspect_upload(BytesIO(b"%PDF-1.4\n%test"), MAX_PIXELS)
+        self.assertEqual((info.format, info.mimetype, info.width), ("PDF", "application/pdf", None))
+
+    def test_rejects_unknown_or_damaged_content(self):
+        with self.assertRaises(InvalidUpload):
+            inspect_upload(BytesIO(b"<html>pas une image</html>"), MAX_PIXELS)
+        with self.assertRaises(InvalidUpload):
+            inspect_upload(BytesIO(b"\x89PNG\r\n\x1a\n" + b"\x00" * 64), MAX_PIXELS)
+
+    def test_open_image_drafts_large_jpeg(self):
+        img = open_image(encoded((3000, 2000), "JPEG"), MAX_PIXELS, target_width=700)
+        # Décodage réduit (1/2 ou 1/4) mais jamais sous la largeur visée
+        self.assertGreaterEqual(img.width, 700)
+        self.assertLessEqual(img.width, 1500)
+        with self.assertRaises(InvalidUpload):
+            open_image(declared_png(20000, 20000), MAX_PIXELS)
+
+
+if __name__ == "__main__":
+    unittest.main()
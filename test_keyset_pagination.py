@@ -0,0 +1,94 @@
+"""
+Pagination par clé (keyset_pagination.py) : curseurs et parcours avec des clés NULL
+"""
+import unittest
+from datetime import datetime, timedelta
+
+from app import app
+from keyset_pagination import SortKey, decode_cursor, encode_cursor, keyset_paginate
+from models import db
+from models.models import Show
+
+
+PREFIX = "keyset-test-"
+KEYS = (SortKey(Show.display_order), SortKey(Show.created_at, desc=True), SortKey(Show.id, desc=True))
+
+
+def expected_order(shows):
+    """Ordre attendu : NULL plus grand que toute valeur (fin en croissant, tête en décroissant)."""
+    def key(show):
+        created = show.created_at.timestamp() if show.created_at else None
+        return (
+            (show.display_order is None, show.display_order or 0),
+            (created is not None, -(created or 0)),
+            -show.id,
+        )
+    return [show.id for show in sorted(shows, key=key)]
+
+
+class KeysetPaginationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.test_request_context("/")
+        self.ctx.push()
+        base = datetime(2024, 1, 1)
+        shows = []
+        for i in range(23):
+            shows.append(Show(
+                title=f"{PREFIX}{i}",
+                display_order=None if i % 4 == 0 else i % 3,
+                created_at=base + timedelta(hours=i % 7),
+            ))
+        db.session.add_all(shows)
+        db.session.commit()
+        # created_at a une valeur par défaut : les NULL sont posés après l'insertion
+        for show in shows[::5]:
+            show.created_at = None
+        db.session.commit()
+        self.expected = expected_order(shows)
+
+    def tearDown(self):
+        Show.query.filter(Show.title.like(f"{PREFIX}%")).delete(synchronize_session=False)
+        db.session.commit()
+        self.ctx.pop()
+
+    def query(self):
+        return Show.query.filter(Show.title.like(f"{PREFIX}%"))
+
+    def paginate(self, **args):
+        return keyset_paginate(self.query(), KEYS, per_page=5, link_pages=1, **args)
+
+    def test_cursor_round_trip(self):
+        values = [None, datetime(2024, 5, 6, 7, 8, 9), 42]
+        token = encode_cursor("b", values, 7)
+        self.assertEqual(decode_cursor(token), ("b", values, 7))
+        self.assertIsNone(decode_cursor(token[:-2] + "xx"))
+        self.assertIsNone(decode_cursor("pas-un-curseur"))
+
+    def test_forward_and_backward_with_nulls(self):
+        pages, page = [], self.paginate(page=1)
+        while True:
+            pages.append([show.id for show in page.items])
+            if not page.has_next:
+                break
+            # Au-delà de link_pages, la page suivante est lue par curseur (seek)
+            self.assertIn("cursor", page.next_args)
+            page = self.paginate(**page.next_args)
+        self.assertEqual([show_id for items in pages for show_id in items], self.expected)
+        self.assertEqual(len(pages), 5)
+
+        # Retour en arrière depuis la dernière page : mêmes pages dans l'ordre inverse
+        back = [[show.id for show in page.items]]
+        while page.has_prev:
+            page = self.paginate(**page.prev_args)
+            back.append([show.id for show in page.items])
+        self.assertEqual(back[::-1], pages)
+        self.assertEqual(page.page, 1)
+
+    def test_numbered_page_matches_offset(self):
+        page = self.paginate(page=3)
+        self.assertEqual([show.id for show in page.items], self.expected[10:15])
+        self.assertEqual(page.total, 23)
+
+
+if __name__ == "__main__":
+    unittest.main()
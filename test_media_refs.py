@@ -0,0 +1,157 @@
+"""
+Comptage des références des fichiers uploadés et ramasse-miettes (media_refs.py)
+"""
+import unittest
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from app import app
+import media_refs
+from models import db
+from models.models import MediaObject, Show
+
+
+class MemoryStore:
+    """Stockage en mémoire (mêmes méthodes que media_store utilisées par le ramasse-miettes)."""
+
+    def __init__(self, keys=()):
+        self.files = {key: b"x" for key in keys}
+
+    def keys(self, prefix=""):
+        return [key for key in self.files if key.startswith(prefix)]
+
+    def delete(self, key):
+        self.files.pop(key, None)
+
+
+def new_key(suffix=".jpg"):
+    return f"{uuid.uuid4().hex}{suffix}"
+
+
+class MediaRefsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.shows = []
+
+    def tearDown(self):
+        db.session.rollback()
+        for show in self.shows:
+            if db.session.get(Show, show.id) is not None:
+                db.session.delete(show)
+        db.session.commit()
+        self.ctx.pop()
+
+    def add_show(self, **files):
+        show = Show(title="media-refs-test", **files)
+        db.session.add(show)
+        db.session.commit()
+        self.shows.append(show)
+        return show
+
+    def state(self, key):
+        db.session.expire_all()
+        obj = db.session.get(MediaObject, key)
+        return None if obj is None else (obj.refcount, obj.released_at is not None)
+
+    def age(self, key, seconds=7200):
+        """Libération datée dans le passé (au-delà du délai de grâce)."""
+        db.session.execute(
+            update(MediaObject).where(MediaObject.key == key)
+            .values(released_at=datetime.utcnow() - timedelta(seconds=seconds))
+        )
+        db.session.commit()
+
+    def test_refcount_follows_show_writes(self):
+        poster, other = new_key(), new_key()
+        show = self.add_show(file_name=poster, file_name2=poster)
+        self.assertEqual(self.state(poster), (2, False))
+
+        show.file_name2 = other
+        db.session.commit()
+        self.assertEqual(self.state(poster), (1, False))
+        self.assertEqual(self.state(other), (1, False))
+
+        db.session.delete(show)
+        db.session.commit()
+        self.assertEqual(self.state(poster), (0, True))
+        self.assertEqual(self.state(other), (0, True))
+
+    def test_gc_waits_for_grace_then_deletes_group(self):
+        poster = new_key()
+        stem = poster.split(".")[0]
+        variants = [f"{stem}-320w.webp", f"{stem}-1024w.webp"]
+        store = MemoryStore([poster] + variants)
+        for key in variants:
+            media_refs.register(key)
+        show = self.add_show(file_name=poster)
+        db.session.delete(show)
+        db.session.commit()
+
+        media_refs.collect_garbage(store, grace=3600)
+        self.assertEqual(sorted(store.files), sorted([poster] + variants))
+        self.assertEqual(self.state(poster), (0, True))
+
+        for key in [poster] + variants:
+            self.age(key)
+        media_refs.collect_garbage(store, grace=3600)
+        self.assertEqual(store.files, {})
+        self.assertIsNone(self.state(poster))
+        self.assertIsNone(self.state(variants[0]))
+
+    def test_gc_keeps_reused_and_still_referenced_files(self):
+        reused, drifted, pinned = new_key(), new_key(), new_key()
+        store = MemoryStore([reused, drifted, pinned])
+        for key in (reused, drifted, pinned):
+            media_refs.register(key)
+            self.age(key)
+        media_refs.pin(pinned)
+        db.session.commit()
+
+        # Nouvel upload du même contenu : le délai de grâce repart de zéro
+        self.assertTrue(media_refs.register(reused))
+        db.session.commit()
+        # Référence posée hors ORM : le compte est corrigé au lieu de supprimer le fichier
+        show = self.add_show()
+        db.session.execute(update(Show).where(Show.id == show.id).values(file_name=drifted))
+        db.session.commit()
+
+        result = media_refs.collect_garbage(store, grace=3600)
+        self.assertEqual(sorted(store.files), sorted([reused, drifted, pinned]))
+        self.assertGreaterEqual(result["repaired"], 1)
+        self.assertEqual(self.state(drifted), (1, False))
+        self.assertEqual(self.state(reused), (0, True))
+
+    def test_gc_groups_variants_of_the_same_content(self):
+        converted, superseded = new_key(), new_key()
+        used, spare = (f"{converted.split('.')[0]}-{w}w.webp" for w in (320, 1024))
+        orphans = [f"{superseded.split('.')[0]}-{w}w.webp" for w in (320, 1024)]
+        store = MemoryStore([converted, used, spare, superseded] + orphans)
+        # Conversion terminée : le spectacle désigne un dérivé, l'original n'est plus référencé
+        self.add_show(file_name=used)
+        # Conversion remplacée entre-temps : l'original reste utilisé, ses dérivés ne le sont pas
+        self.add_show(file_name=superseded)
+        for key in [converted, spare] + orphans:
+            media_refs.register(key)
+            self.age(key)
+
+        result = media_refs.collect_garbage(store, grace=3600)
+        # Un dérivé encore utilisé garde tout son groupe ; l'original converti est libéré
+        self.assertIn(spare, store.files)
+        self.assertNotIn(converted, store.files)
+        self.assertGreaterEqual(result["kept"], 1)
+        # Dérivés orphelins supprimés, original toujours utilisé conservé
+        self.assertIn(superseded, store.files)
+        for key in orphans:
+            self.assertNotIn(key, store.files)
+
+    def test_content_key(self):
+        self.assertEqual(media_refs.content_key(b"abc", "JPEG"), media_refs.content_key(b"abc", ".jpeg"))
+        self.assertTrue(media_refs.content_key(b"abc", "PNG").endswith(".png"))
+        self.assertRegex(media_refs.content_key(b"abc", "jpg"), media_refs.UPLOAD_KEY)
+
+
+if __name__ == "__main__":
+    unittest.main()
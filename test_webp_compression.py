@@ -22,30 +22,13 @@ with app.app_context():
     
     print(f"   Taille JPEG originale : {jpeg_size/1024:.1f} KB")
     
-    # Créer un objet FileStorage simulé
-    class FakeFile:
-        def __init__(self, buffer):
-            self.buffer = buffer
-            self.content_type = 'image/jpeg'
-            self.filename = 'test.jpg'
-        
-        def seek(self, position, whence=0):
-            self.buffer.seek(position, whence)
-        
-        def tell(self):
-            return self.buffer.tell()
-        
-        def read(self):
-            return self.buffer.read()
-    
-    fake_file = FakeFile(jpeg_buffer)
-    
-    # Tester la compression WebP
-    print("\n2. Test de la fonction optimize_image_to_webp()...")
-    from app import optimize_image_to_webp
+    # Tester la compression WebP (fonction utilisée par les tâches de conversion)
+    print("\n2. Test de la fonction image_processing.to_webp()...")
+    from image_processing import to_webp
     
     try:
-        result = optimize_image_to_webp(fake_file, quality=85, max_width=1920)
+        result = BytesIO(to_webp(jpeg_buffer.getvalue(), quality=85, max_width=1920,
+                                 max_pixels=app.config.get("IMAGE_MAX_PIXELS")))
         
         if result:
             webp_size = result.getbuffer().nbytes
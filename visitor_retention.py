@@ -0,0 +1,278 @@
+"""
+Purge RGPD des données de tracking (``visitor_log``).
+
+Les lignes expirées sont supprimées par tranches bornées de clés primaires
+(``DELETE ... WHERE id IN (SELECT id ... LIMIT n)``), une transaction par
+tranche : pas de chargement en mémoire, pas de verrou long, et une purge
+interrompue reprend simplement là où elle s'est arrêtée au prochain passage.
+
+Les statistiques par utilisateur connecté (dimension ``user`` des rollups)
+sont supprimées à la même date ; les autres rollups ne contiennent ni
+identifiant de session ni donnée personnelle (croquis HyperLogLog seulement).
+
+Sur PostgreSQL, ``visitor_log`` peut être partitionnée par mois
+(``migrate_visitor_log_partitions_postgres.py``) : les mois entièrement expirés
+sont alors supprimés par un simple DROP de partition.
+
+Lancement :
+    - ``python clean_visitor_logs.py`` (cron)
+    - planificateur intégré (RETENTION_SCHEDULER_ENABLED) : un thread par worker,
+      un seul worker exécute la purge grâce à un verrou en base.
+"""
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, select, text, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+from models.models import StatsWatermark, VisitorLog, VisitStatsDimension
+import visitor_stats
+
+
+SCHEDULER_MARK = "retention"
+
+
+# -----------------------------------------------------
+# Partitions mensuelles (PostgreSQL)
+# -----------------------------------------------------
+def is_partitioned() -> bool:
+    """True si visitor_log est une table partitionnée PostgreSQL."""
+    if db.engine.dialect.name != "postgresql":
+        return False
+    return bool(db.session.execute(text("""
+        SELECT 1 FROM pg_partitioned_table p
+        JOIN pg_class c ON c.oid = p.partrelid
+        WHERE c.relname = 'visitor_log'
+    """)).scalar())
+
+
+def month_start(dt: datetime) -> datetime:
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(dt: datetime, months: int) -> datetime:
+    month = dt.month - 1 + months
+    return dt.replace(year=dt.year + month // 12, month=month % 12 + 1, day=1)
+
+
+def partition_name(start: datetime) -> str:
+    return f"visitor_log_{start:%Y_%m}"
+
+
+def ensure_partitions(months_ahead: int = 2, from_month: datetime = None, commit: bool = True) -> list:
+    """Crée les partitions mensuelles manquantes jusqu'à ``months_ahead`` mois dans le futur."""
+    created = []
+    start = month_start(from_month or datetime.utcnow())
+    end = add_months(month_start(datetime.utcnow()), months_ahead + 1)
+    while start < end:
+        name = partition_name(start)
+        exists = db.session.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar()
+        if not exists:
+            db.session.execute(text(
+                f"CREATE TABLE {name} PARTITION OF visitor_log "
+                f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{add_months(start, 1):%Y-%m-%d}')"
+            ))
+            created.append(name)
+        start = add_months(start, 1)
+    if commit:
+        db.session.commit()
+    return created
+
+
+def drop_expired_partitions(cutoff: datetime, dry_run: bool = False) -> list:
+    """Supprime les partitions mensuelles dont toutes les lignes sont antérieures à ``cutoff``."""
+    rows = db.session.execute(text("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'visitor_log' AND c.relname ~ '^visitor_log_[0-9]{4}_[0-9]{2}$'
+        ORDER BY c.relname
+    """)).scalars().all()
+    dropped = []
+    for name in rows:
+        start = datetime.strptime(name[len("visitor_log_"):], "%Y_%m")
+        if add_months(start, 1) <= cutoff:
+            if not dry_run:
+                db.session.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                db.session.commit()
+            dropped.append(name)
+    return dropped
+
+
+# -----------------------------------------------------
+# Purge par tranches
+# -----------------------------------------------------
+def retention_cutoff(days: int) -> datetime:
+    return datetime.utcnow() - timedelta(days=days)
+
+
+def count_expired(cutoff: datetime) -> int:
+    return db.session.execute(
+        select(func.count()).select_from(VisitorLog).where(VisitorLog.visited_at < cutoff)
+    ).scalar() or 0
+
+
+def purge_user_stats(cutoff: datetime) -> int:
+    """Supprime les rollups par utilisateur des buckets commencés avant ``cutoff``. Ne commit pas."""
+    return db.session.execute(
+        delete(VisitStatsDimension)
+        .where(VisitStatsDimension.dimension == "user", VisitStatsDimension.bucket_start < cutoff)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def purge_expired(days: int = 30, chunk_size: int = 5000, max_chunks: int = None,
+                  pause: float = 0.0, dry_run: bool = False, logger=None) -> dict:
+    """
+    Supprime les visites de plus de ``days`` jours.
+
+    Retourne un dict : cutoff, expired (compté en SQL), deleted, chunks,
+    partitions (supprimées), user_stats (rollups par utilisateur supprimés),
+    complete (False si max_chunks a interrompu la purge).
+    """
+    started = time.perf_counter()
+    cutoff = retention_cutoff(days)
+    if not dry_run:
+        # Les rollups statistiques doivent être à jour avant de supprimer les lignes brutes
+        try:
+            visitor_stats.aggregate_pending()
+        except Exception as e:
+            db.session.rollback()
+            if logger:
+                logger.warning(f"[RETENTION] Agrégation préalable impossible: {e}")
+    result = {"cutoff": cutoff, "expired": count_expired(cutoff), "deleted": 0,
+              "chunks": 0, "partitions": [], "user_stats": 0, "complete": True}
+    if not dry_run:
+        try:
+            result["user_stats"] = purge_user_stats(cutoff)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    if dry_run or result["expired"] == 0:
+        result["elapsed_s"] = round(time.perf_counter() - started, 2)
+        return result
+
+    if is_partitioned():
+        result["partitions"] = drop_expired_partitions(cutoff)
+
+    expired_ids = (
+        select(VisitorLog.id)
+        .where(VisitorLog.visited_at < cutoff)
+        .order_by(VisitorLog.id)
+        .limit(chunk_size)
+        .scalar_subquery()
+    )
+    while True:
+        if max_chunks is not None and result["chunks"] >= max_chunks:
+            result["complete"] = False
+            break
+        try:
+            deleted = db.session.execute(
+                delete(VisitorLog)
+                .where(VisitorLog.id.in_(expired_ids))
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        if not deleted:
+            break
+        result["deleted"] += deleted
+        result["chunks"] += 1
+        if logger:
+            logger.info(f"[RETENTION] Tranche {result['chunks']} : {deleted} visites supprimées")
+        if pause:
+            time.sleep(pause)
+
+    # Les lignes des partitions supprimées comptent comme purgées
+    result["deleted"] = max(result["deleted"], result["expired"] - count_expired(cutoff))
+    result["elapsed_s"] = round(time.perf_counter() - started, 2)
+    return result
+
+
+# -----------------------------------------------------
+# Planificateur intégré
+# -----------------------------------------------------
+def claim_run(interval: float) -> bool:
+    """Réserve l'exécution de la purge pour ce worker (compare-and-swap sur stats_watermark)."""
+    now = datetime.utcnow()
+    claimed = db.session.execute(
+        update(StatsWatermark)
+        .where(StatsWatermark.name == SCHEDULER_MARK,
+               StatsWatermark.processed_until <= now - timedelta(seconds=interval))
+        .values(processed_until=now, updated_at=now)
+    ).rowcount
+    if not claimed and db.session.get(StatsWatermark, SCHEDULER_MARK) is None:
+        db.session.add(StatsWatermark(name=SCHEDULER_MARK, processed_until=now))
+        try:
+            db.session.commit()
+            return True
+        except IntegrityError:
+            # Un autre worker a créé la ligne en même temps
+            db.session.rollback()
+            return False
+    db.session.commit()
+    return bool(claimed)
+
+
+class RetentionScheduler:
+    """Thread de purge périodique (démarré paresseusement, relancé après un fork)."""
+
+    def __init__(self, app):
+        self.app = app
+        self.enabled = app.config.get("RETENTION_SCHEDULER_ENABLED", True)
+        self.interval = float(app.config.get("RETENTION_INTERVAL", 6 * 3600))
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.last_result = None
+        app.extensions["retention_scheduler"] = self
+
+    def ensure_started(self) -> None:
+        if not self.enabled:
+            return
+        pid = os.getpid()
+        if self._thread is not None and self._thread.is_alive() and self._pid == pid:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == pid:
+                return
+            self._pid = pid
+            self._thread = threading.Thread(target=self._run, name="visitor-retention", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        # Décalage aléatoire : les workers démarrés ensemble ne se disputent pas le verrou
+        time.sleep(random.uniform(30, 120))
+        while True:
+            self.run_once()
+            time.sleep(self.interval / 4)
+
+    def run_once(self) -> None:
+        cfg = self.app.config
+        with self.app.app_context():
+            try:
+                if not claim_run(self.interval):
+                    return
+                if is_partitioned():
+                    ensure_partitions(cfg.get("RETENTION_PARTITIONS_AHEAD", 2))
+                self.last_result = purge_expired(
+                    days=cfg.get("RETENTION_DAYS", 30),
+                    chunk_size=cfg.get("RETENTION_CHUNK_SIZE", 5000),
+                    pause=cfg.get("RETENTION_CHUNK_PAUSE", 0.1),
+                    logger=self.app.logger,
+                )
+                self.app.logger.info(
+                    f"[RETENTION] {self.last_result['deleted']} visites purgées "
+                    f"({self.last_result['chunks']} tranches, {self.last_result['elapsed_s']}s)"
+                )
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.warning(f"[RETENTION] Purge impossible: {e}")
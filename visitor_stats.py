@@ -0,0 +1,632 @@
+"""
+Statistiques de visites pré-agrégées (tables ``visit_stats_*``).
+
+L'agrégateur transforme les lignes brutes ``VisitorLog`` en compteurs par heure
+puis par jour (visites, sessions uniques, robots / humains) et en répartitions
+par page, référent, ville, région et utilisateur connecté. Il est incrémental :
+un filigrane (``StatsWatermark``) mémorise la dernière heure / le dernier jour
+agrégés et seules les heures closes depuis sont lues. Un seul processus agrège
+à la fois (ligne ``aggregation`` de stats_watermark, réservée par
+compare-and-swap) : le cron, la page de statistiques et la purge de chaque
+worker ne peuvent pas insérer deux fois le même bucket.
+
+Visiteurs uniques : chaque bucket garde, en plus de ses compteurs exacts, un
+croquis HyperLogLog de ses sessions (voir hyperloglog.py). Ceux d'une période
+sont estimés en fusionnant les croquis de ses buckets (une session qui revient
+le lendemain ne compte qu'une fois), sans relire les visites ; ils sont exacts
+pour un seul bucket ou pour des lignes brutes seules.
+
+La page /admin/statistiques combine ensuite :
+    - les rollups journaliers pour les jours entiers de la période,
+    - les rollups horaires pour les heures entières des jours partiels,
+    - les lignes brutes pour l'heure entamée du début de période et depuis
+      le filigrane (l'heure en cours), comme les anciennes requêtes,
+    - les lignes brutes des STATS_RECENT_VISITORS_HOURS dernières heures
+      pour la liste des derniers visiteurs.
+
+Agrégation : ``python aggregate_daily_stats.py`` (cron) et automatiquement à
+l'ouverture de la page de statistiques. Le rapport d'une période est ensuite
+mis en cache par (période, granularité) pendant STATS_CACHE_TTL secondes.
+"""
+import threading
+import time
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import String, and_, case, cast, desc, func, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from hyperloglog import HyperLogLog
+from models import db
+from models.models import StatsWatermark, User, VisitorLog, VisitStatsDimension, VisitStatsRollup
+
+
+COUNTER_FIELDS = (
+    "visits", "human_visits", "bot_visits",
+    "unique_sessions", "unique_humans", "unique_bots",
+)
+Counters = namedtuple("Counters", COUNTER_FIELDS, defaults=(0,) * len(COUNTER_FIELDS))
+UNIQUE_FIELDS = COUNTER_FIELDS[3:]
+# Croquis des rollups, dans l'ordre de UNIQUE_FIELDS
+SKETCH_FIELDS = ("sessions_sketch", "humans_sketch", "bots_sketch")
+
+# Dimensions agrégées : nom -> colonne source
+DIMENSIONS = {
+    "page": VisitorLog.page_url,
+    "referrer": VisitorLog.referrer,
+    "city": VisitorLog.city,
+    "region": VisitorLog.region,
+    "user": cast(VisitorLog.user_id, String),
+}
+# Lignes renvoyées au template (mêmes attributs que les anciennes requêtes)
+TOP_ROW_TYPES = {
+    "page": namedtuple("TopPage", "page_url visits"),
+    "referrer": namedtuple("TopReferrer", "referrer visits"),
+    "city": namedtuple("TopCity", "city visits"),
+    "region": namedtuple("TopRegion", "region visits"),
+}
+ActiveUser = namedtuple("ActiveUser", "username visits")
+SeriesRow = namedtuple("SeriesRow", "date visits visitors")
+
+# Taille des tranches traitées par transaction lors d'un rattrapage
+HOUR_CHUNK = timedelta(hours=24)
+DAY_CHUNK = timedelta(days=7)
+
+AGGREGATION_MARK = "aggregation"
+# Durée après laquelle une agrégation interrompue (worker arrêté) peut être reprise par un autre
+AGGREGATION_LEASE = timedelta(minutes=10)
+AGGREGATION_IDLE = datetime(2000, 1, 1)
+
+
+def add_counters(a: Counters, b: Counters) -> Counters:
+    return Counters(*(x + y for x, y in zip(a, b)))
+
+
+# -----------------------------------------------------
+# Buckets de temps
+# -----------------------------------------------------
+def floor_hour(dt: datetime) -> datetime:
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def ceil_hour(dt: datetime) -> datetime:
+    hour = floor_hour(dt)
+    return hour if hour == dt else hour + timedelta(hours=1)
+
+
+def floor_day(dt: datetime) -> datetime:
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def ceil_day(dt: datetime) -> datetime:
+    day = floor_day(dt)
+    return day if day == dt else day + timedelta(days=1)
+
+
+def bucket_expr(granularity: str):
+    """Expression SQL du début de bucket ('hour' ou 'day') selon le dialecte."""
+    if db.engine.dialect.name == "postgresql":
+        return func.date_trunc(granularity, VisitorLog.visited_at)
+    fmt = "%Y-%m-%d %H:00:00" if granularity == "hour" else "%Y-%m-%d 00:00:00"
+    return func.strftime(fmt, VisitorLog.visited_at)
+
+
+def as_datetime(value) -> datetime:
+    """Normalise un bucket renvoyé par la base (datetime PostgreSQL ou texte SQLite)."""
+    if isinstance(value, str):
+        return datetime.strptime(value[:19], "%Y-%m-%d %H:%M:%S")
+    return value.replace(tzinfo=None)
+
+
+def counter_columns():
+    """Les six compteurs en une seule passe (agrégation conditionnelle)."""
+    human = VisitorLog.is_bot == False  # noqa: E712
+    bot = VisitorLog.is_bot == True  # noqa: E712
+    return (
+        func.count(VisitorLog.id),
+        func.coalesce(func.sum(case((human, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((bot, 1), else_=0)), 0),
+        func.count(func.distinct(VisitorLog.session_id)),
+        func.count(func.distinct(case((human, VisitorLog.session_id)))),
+        func.count(func.distinct(case((bot, VisitorLog.session_id)))),
+    )
+
+
+# -----------------------------------------------------
+# Sessions distinctes
+# -----------------------------------------------------
+class UniqueSessions:
+    """
+    Sessions distinctes (toutes, humaines, robots) d'un ensemble de buckets et de
+    lignes brutes. Exactes pour un seul rollup ou pour des lignes brutes seules ;
+    sinon estimées en fusionnant les croquis. Les rollups sans croquis (agrégés
+    avant leur ajout) sont additionnés.
+    """
+
+    def __init__(self):
+        self.rollups = []  # (compteurs exacts, croquis compressés)
+        self.raw = (set(), set(), set())
+
+    def add_rollup(self, counts, sketches) -> None:
+        self.rollups.append((tuple(counts), tuple(sketches)))
+
+    def add_session(self, session_id: str, is_bot: bool) -> None:
+        self.raw[0].add(session_id)
+        self.raw[2 if is_bot else 1].add(session_id)
+
+    def count(self, index: int) -> int:
+        """Sessions distinctes pour UNIQUE_FIELDS[index]."""
+        if not self.rollups:
+            return len(self.raw[index])
+        if len(self.rollups) == 1 and not self.raw[0]:
+            return self.rollups[0][0][index]
+        sketch, unmerged = HyperLogLog(), 0
+        for counts, sketches in self.rollups:
+            if sketches[index] is None:
+                unmerged += counts[index]
+            else:
+                sketch.merge(HyperLogLog.from_bytes(sketches[index]))
+        for session_id in self.raw[index]:
+            sketch.add(session_id)
+        return sketch.count() + unmerged
+
+    def counts(self) -> dict:
+        return {field: self.count(i) for i, field in enumerate(UNIQUE_FIELDS)}
+
+
+def session_sketches(sessions) -> dict:
+    """Croquis compressés (colonnes SKETCH_FIELDS) de [(session_id, is_bot)]."""
+    sketches = [HyperLogLog() for _ in SKETCH_FIELDS]
+    for session_id, is_bot in sessions:
+        sketches[0].add(session_id)
+        sketches[2 if is_bot else 1].add(session_id)
+    return {field: sketch.to_bytes() for field, sketch in zip(SKETCH_FIELDS, sketches)}
+
+
+# -----------------------------------------------------
+# Lecture des lignes brutes
+# -----------------------------------------------------
+def _raw_filter(query, start, end):
+    query = query.filter(VisitorLog.visited_at >= start)
+    if end is not None:
+        query = query.filter(VisitorLog.visited_at < end)
+    return query
+
+
+def raw_counters(start: datetime, end: datetime = None) -> Counters:
+    row = _raw_filter(db.session.query(*counter_columns()), start, end).one()
+    return Counters(*(int(v or 0) for v in row))
+
+
+def raw_counters_by_bucket(granularity: str, start: datetime, end: datetime = None) -> dict:
+    bucket = bucket_expr(granularity)
+    rows = _raw_filter(db.session.query(bucket, *counter_columns()), start, end).group_by(bucket).all()
+    return {as_datetime(r[0]): Counters(*(int(v or 0) for v in r[1:])) for r in rows}
+
+
+def raw_sessions(granularity: str, start: datetime, end: datetime = None) -> list:
+    """(bucket, session_id, is_bot) distincts de [start, end)."""
+    bucket = bucket_expr(granularity)
+    query = db.session.query(bucket, VisitorLog.session_id, VisitorLog.is_bot).distinct()
+    rows = _raw_filter(query, start, end).filter(VisitorLog.session_id.isnot(None)).all()
+    return [(as_datetime(r[0]), r[1], bool(r[2])) for r in rows]
+
+
+def raw_dimension(dimension: str, start: datetime, end: datetime = None, granularity: str = None) -> list:
+    """(bucket, valeur, visites, visites humaines) ; bucket=None si granularity est None."""
+    column = DIMENSIONS[dimension]
+    human = VisitorLog.is_bot == False  # noqa: E712
+    columns = [column, func.count(VisitorLog.id), func.coalesce(func.sum(case((human, 1), else_=0)), 0)]
+    group_by = [column]
+    if granularity:
+        bucket = bucket_expr(granularity)
+        columns.insert(0, bucket)
+        group_by.insert(0, bucket)
+    query = _raw_filter(db.session.query(*columns), start, end).filter(column.isnot(None), column != "")
+    rows = query.group_by(*group_by).all()
+    if granularity:
+        return [(as_datetime(r[0]), r[1], int(r[2]), int(r[3])) for r in rows]
+    return [(None, r[0], int(r[1]), int(r[2])) for r in rows]
+
+
+# -----------------------------------------------------
+# Agrégation incrémentale
+# -----------------------------------------------------
+def get_watermark(name: str):
+    mark = db.session.get(StatsWatermark, name)
+    return mark.processed_until if mark else None
+
+
+def _set_watermark(name: str, value: datetime) -> None:
+    mark = db.session.get(StatsWatermark, name)
+    if mark is None:
+        db.session.add(StatsWatermark(name=name, processed_until=value))
+    else:
+        mark.processed_until = value
+
+
+def claim_aggregation() -> bool:
+    """Réserve l'agrégation pour ce processus (compare-and-swap sur stats_watermark)."""
+    now = datetime.utcnow()
+    claimed = db.session.execute(
+        update(StatsWatermark)
+        .where(StatsWatermark.name == AGGREGATION_MARK,
+               StatsWatermark.processed_until <= now - AGGREGATION_LEASE)
+        .values(processed_until=now, updated_at=now)
+    ).rowcount
+    if not claimed and db.session.get(StatsWatermark, AGGREGATION_MARK) is None:
+        db.session.add(StatsWatermark(name=AGGREGATION_MARK, processed_until=now))
+        try:
+            db.session.commit()
+            return True
+        except IntegrityError:
+            # Un autre processus a créé la ligne en même temps
+            db.session.rollback()
+            return False
+    db.session.commit()
+    return bool(claimed)
+
+
+def release_aggregation() -> None:
+    db.session.rollback()
+    db.session.execute(
+        update(StatsWatermark).where(StatsWatermark.name == AGGREGATION_MARK)
+        .values(processed_until=AGGREGATION_IDLE)
+    )
+    db.session.commit()
+
+
+@contextmanager
+def aggregation_lock():
+    """``with aggregation_lock() as claimed:`` ; claimed est False si un autre processus agrège."""
+    claimed = claim_aggregation()
+    try:
+        yield claimed
+    finally:
+        if claimed:
+            release_aggregation()
+
+
+def aggregate_range(granularity: str, start: datetime, end: datetime) -> int:
+    """(Ré)agrège [start, end) : remplace les rollups existants. Ne commit pas."""
+    for model in (VisitStatsRollup, VisitStatsDimension):
+        model.query.filter(
+            model.granularity == granularity,
+            model.bucket_start >= start,
+            model.bucket_start < end,
+        ).delete(synchronize_session=False)
+
+    counters = raw_counters_by_bucket(granularity, start, end)
+    sessions = defaultdict(list)
+    for bucket, session_id, is_bot in raw_sessions(granularity, start, end):
+        sessions[bucket].append((session_id, is_bot))
+    if counters:
+        db.session.execute(db.insert(VisitStatsRollup), [
+            {"granularity": granularity, "bucket_start": bucket, **c._asdict(),
+             **session_sketches(sessions[bucket])}
+            for bucket, c in counters.items()
+        ])
+
+    # Regroupées après troncature : une ligne par (bucket, dimension, valeur), voir la contrainte unique
+    dimension_rows = defaultdict(lambda: [0, 0])
+    for dimension in DIMENSIONS:
+        for bucket, value, visits, human_visits in raw_dimension(dimension, start, end, granularity):
+            row = dimension_rows[(bucket, dimension, value[:300])]
+            row[0] += visits
+            row[1] += human_visits
+    if dimension_rows:
+        db.session.execute(db.insert(VisitStatsDimension), [
+            {"granularity": granularity, "bucket_start": bucket, "dimension": dimension,
+             "value": value, "visits": visits, "human_visits": human_visits}
+            for (bucket, dimension, value), (visits, human_visits) in dimension_rows.items()
+        ])
+    return len(counters)
+
+
+def _catch_up(granularity: str, start: datetime, cutoff: datetime, chunk: timedelta) -> int:
+    processed = 0
+    while start < cutoff:
+        end = min(start + chunk, cutoff)
+        try:
+            aggregate_range(granularity, start, end)
+            _set_watermark(granularity, end)
+            # Bail de l'agrégation prolongé à chaque tranche
+            _set_watermark(AGGREGATION_MARK, datetime.utcnow())
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        processed += 1
+        start = end
+    return processed
+
+
+def aggregate_pending(now: datetime = None, grace_seconds: float = 300) -> dict:
+    """
+    Agrège les heures closes depuis le dernier filigrane, puis les jours complets.
+
+    ``grace_seconds`` laisse au tracking asynchrone le temps d'écrire les
+    dernières visites d'une heure avant qu'elle soit figée. Ne fait rien
+    (``skipped``) si un autre processus agrège déjà : les lectures utilisent
+    les lignes brutes depuis le filigrane.
+    """
+    now = now or datetime.utcnow()
+    hour_cutoff = floor_hour(now - timedelta(seconds=grace_seconds))
+    hours = days = 0
+    with aggregation_lock() as claimed:
+        if claimed:
+            hour_mark = get_watermark("hour")
+            if hour_mark is None:
+                first_visit = db.session.query(func.min(VisitorLog.visited_at)).scalar()
+                hour_mark = floor_hour(first_visit) if first_visit else hour_cutoff
+                _set_watermark("hour", hour_mark)
+                db.session.commit()
+            hours = _catch_up("hour", hour_mark, hour_cutoff, HOUR_CHUNK)
+
+            day_cutoff = floor_day(get_watermark("hour"))
+            day_mark = get_watermark("day") or floor_day(hour_mark)
+            days = _catch_up("day", day_mark, day_cutoff, DAY_CHUNK)
+    return {"hour_chunks": hours, "day_chunks": days, "skipped": not claimed,
+            "hour_watermark": get_watermark("hour"), "day_watermark": get_watermark("day")}
+
+
+# -----------------------------------------------------
+# Lecture d'une période
+# -----------------------------------------------------
+def period_segments(start: datetime, now: datetime = None) -> dict:
+    """
+    Découpe [start, now] en plages journalières et horaires (rollups) et en
+    plages brutes : l'heure entamée du début de période et la fin depuis le filigrane.
+    """
+    hour_mark = get_watermark("hour")
+    day_mark = get_watermark("day")
+    rollup_from = ceil_hour(start)
+    raw_from = max(rollup_from, hour_mark) if hour_mark else rollup_from
+    if raw_from == rollup_from:
+        raw = [(start, None)]
+    else:
+        raw = [(start, rollup_from), (raw_from, None)] if start < rollup_from else [(raw_from, None)]
+
+    day_from = ceil_day(rollup_from)
+    day_to = min(day_mark, raw_from) if day_mark else day_from
+    if day_from < day_to:
+        daily = [(day_from, day_to)]
+        hourly = [(rollup_from, day_from), (day_to, raw_from)]
+    else:
+        daily = []
+        hourly = [(rollup_from, raw_from)]
+    return {
+        "daily": daily,
+        "hourly": [(a, b) for a, b in hourly if a < b],
+        "raw": raw,
+    }
+
+
+def _rollup_query(granularity, ranges, *columns):
+    clauses = [
+        and_(VisitStatsRollup.bucket_start >= a, VisitStatsRollup.bucket_start < b)
+        for a, b in ranges
+    ]
+    return db.session.query(*columns).filter(
+        VisitStatsRollup.granularity == granularity, or_(*clauses)
+    )
+
+
+def _rollup_totals(granularity: str, ranges) -> Counters:
+    if not ranges:
+        return Counters()
+    columns = [func.coalesce(func.sum(getattr(VisitStatsRollup, f)), 0) for f in COUNTER_FIELDS]
+    row = _rollup_query(granularity, ranges, *columns).one()
+    return Counters(*(int(v) for v in row))
+
+
+def _rollup_buckets(granularity: str, ranges) -> list:
+    """(début, visites humaines, uniques exacts, croquis) des rollups des plages."""
+    if not ranges:
+        return []
+    rows = _rollup_query(
+        granularity, ranges,
+        VisitStatsRollup.bucket_start, VisitStatsRollup.human_visits,
+        *(getattr(VisitStatsRollup, f) for f in UNIQUE_FIELDS),
+        *(getattr(VisitStatsRollup, f) for f in SKETCH_FIELDS),
+    ).all()
+    return [(r[0], r[1], r[2:5], r[5:8]) for r in rows]
+
+
+def _dimension_totals(granularity: str, dimension: str, ranges) -> list:
+    if not ranges:
+        return []
+    clauses = [
+        and_(VisitStatsDimension.bucket_start >= a, VisitStatsDimension.bucket_start < b)
+        for a, b in ranges
+    ]
+    return db.session.query(
+        VisitStatsDimension.value, func.sum(VisitStatsDimension.visits)
+    ).filter(
+        VisitStatsDimension.granularity == granularity,
+        VisitStatsDimension.dimension == dimension,
+        or_(*clauses),
+    ).group_by(VisitStatsDimension.value).all()
+
+
+def raw_period_buckets(segments: dict) -> dict:
+    """Compteurs par heure des plages brutes de la période (un seul passage par plage)."""
+    buckets = {}
+    for start, end in segments["raw"]:
+        buckets.update(raw_counters_by_bucket("hour", start, end))
+    return buckets
+
+
+def raw_period_sessions(segments: dict) -> list:
+    """(heure, session_id, is_bot) distincts des plages brutes de la période."""
+    sessions = []
+    for start, end in segments["raw"]:
+        sessions.extend(raw_sessions("hour", start, end))
+    return sessions
+
+
+def period_rollups(segments: dict) -> list:
+    return _rollup_buckets("day", segments["daily"]) + _rollup_buckets("hour", segments["hourly"])
+
+
+def period_counters(segments: dict, raw_buckets: dict = None, rollups: list = None,
+                    sessions: list = None) -> Counters:
+    totals = add_counters(_rollup_totals("day", segments["daily"]), _rollup_totals("hour", segments["hourly"]))
+    if raw_buckets is None:
+        raw_buckets = raw_period_buckets(segments)
+    for counters in raw_buckets.values():
+        totals = add_counters(totals, counters)
+
+    # Les uniques par bucket ne s'additionnent pas : croquis fusionnés sur toute la période
+    uniques = UniqueSessions()
+    for _, _, counts, sketches in (rollups if rollups is not None else period_rollups(segments)):
+        uniques.add_rollup(counts, sketches)
+    for _, session_id, is_bot in (sessions if sessions is not None else raw_period_sessions(segments)):
+        uniques.add_session(session_id, is_bot)
+    return totals._replace(**uniques.counts())
+
+
+def period_series(segments: dict, granularity: str, raw_buckets: dict = None, rollups: list = None,
+                  sessions: list = None) -> list:
+    """Visites et visiteurs uniques HUMAINS par heure ou par jour (pour le graphique)."""
+    visits = defaultdict(int)
+    visitors = defaultdict(UniqueSessions)
+    fmt = "%Y-%m-%d %H:00:00" if granularity == "hour" else "%Y-%m-%d"
+
+    def key(bucket):
+        return (floor_hour(bucket) if granularity == "hour" else floor_day(bucket)).strftime(fmt)
+
+    if granularity == "hour":
+        # Graphique horaire : rollups horaires y compris pour les jours entiers
+        rollups = _rollup_buckets("hour", segments["hourly"] + segments["daily"])
+    elif rollups is None:
+        rollups = period_rollups(segments)
+    if raw_buckets is None:
+        raw_buckets = raw_period_buckets(segments)
+    if sessions is None:
+        sessions = raw_period_sessions(segments)
+    for bucket, human_visits, counts, sketches in rollups:
+        visits[key(bucket)] += human_visits
+        visitors[key(bucket)].add_rollup(counts, sketches)
+    for bucket, c in raw_buckets.items():
+        visits[key(bucket)] += c.human_visits
+    for bucket, session_id, is_bot in sessions:
+        visitors[key(bucket)].add_session(session_id, is_bot)
+
+    series = []
+    for date in sorted(set(visits) | set(visitors)):
+        row = SeriesRow(date, visits[date], visitors[date].count(1) if date in visitors else 0)
+        if row.visits or row.visitors:
+            series.append(row)
+    return series
+
+
+def period_dimension(segments: dict, dimension: str) -> dict:
+    """Visites par valeur de la dimension sur la période : {valeur: visites}."""
+    totals = defaultdict(int)
+    for granularity, ranges in (("day", segments["daily"]), ("hour", segments["hourly"])):
+        for value, visits in _dimension_totals(granularity, dimension, ranges):
+            totals[value] += int(visits)
+    for start, end in segments["raw"]:
+        for _, value, visits, _ in raw_dimension(dimension, start, end):
+            totals[value[:300]] += visits
+    return totals
+
+
+def period_top(segments: dict, dimension: str, limit: int = 10) -> list:
+    row_type = TOP_ROW_TYPES[dimension]
+    ranked = sorted(period_dimension(segments, dimension).items(), key=lambda item: item[1], reverse=True)
+    return [row_type(value, visits) for value, visits in ranked[:limit]]
+
+
+def active_users(segments: dict, limit: int = 10) -> list:
+    """Utilisateurs connectés ayant le plus de visites sur la période (dimension 'user')."""
+    ranked = sorted(period_dimension(segments, "user").items(), key=lambda item: item[1], reverse=True)
+    ids = [int(value) for value, _ in ranked if value.isdigit()]
+    names = dict(db.session.query(User.id, User.username).filter(User.id.in_(ids)).all()) if ids else {}
+    rows = [ActiveUser(names[int(value)], visits) for value, visits in ranked
+            if value.isdigit() and int(value) in names]
+    return rows[:limit]
+
+
+def recent_visitors(since: datetime, limit: int = 50) -> list:
+    """
+    Derniers visiteurs depuis ``since`` (une ligne par session et attributs, avec le
+    nombre de pages vues), lus sur les lignes brutes : ``since`` est une fenêtre courte.
+    """
+    return db.session.query(
+        VisitorLog.session_id,
+        func.min(VisitorLog.visited_at).label('first_visit'),
+        func.max(VisitorLog.visited_at).label('last_visit'),
+        func.count(VisitorLog.id).label('page_count'),
+        VisitorLog.city,
+        VisitorLog.region,
+        VisitorLog.country,
+        VisitorLog.isp,
+        VisitorLog.ip_anonymized,
+        VisitorLog.user_agent,
+        VisitorLog.user_id,
+        func.max(case((VisitorLog.is_bot == True, 1), else_=0)).label('is_bot'),  # noqa: E712
+    ).filter(VisitorLog.visited_at >= since).\
+        group_by(
+            VisitorLog.session_id,
+            VisitorLog.city,
+            VisitorLog.region,
+            VisitorLog.country,
+            VisitorLog.isp,
+            VisitorLog.ip_anonymized,
+            VisitorLog.user_agent,
+            VisitorLog.user_id,
+        ).\
+        order_by(desc('first_visit')).\
+        limit(limit).all()
+
+
+def period_report(start: datetime, granularity: str, recent_since: datetime = None) -> dict:
+    """
+    Compteurs, graphique, tops et derniers visiteurs d'une période.
+
+    Les lignes brutes (début de période et depuis le filigrane) et les rollups
+    sont lus une seule fois : ce passage alimente à la fois les compteurs et le
+    graphique. ``recent_since`` borne la liste des derniers visiteurs (défaut : ``start``).
+    """
+    segments = period_segments(start)
+    raw_buckets = raw_period_buckets(segments)
+    sessions = raw_period_sessions(segments)
+    rollups = period_rollups(segments)
+    return {
+        "counters": period_counters(segments, raw_buckets, rollups, sessions),
+        "series": period_series(segments, granularity, raw_buckets, rollups, sessions),
+        "top_pages": period_top(segments, "page"),
+        "top_referrers": period_top(segments, "referrer"),
+        "top_cities": period_top(segments, "city"),
+        "top_regions": period_top(segments, "region"),
+        "active_users": active_users(segments),
+        "recent_visitors": recent_visitors(max(start, recent_since) if recent_since else start),
+    }
+
+
+# -----------------------------------------------------
+# Cache des résultats (par worker)
+# -----------------------------------------------------
+_result_cache = {}
+_result_cache_lock = threading.Lock()
+
+
+def cached(key, ttl: float, builder, refresh: bool = False):
+    """Retourne le résultat mémorisé pour ``key`` ou le recalcule via ``builder()`` après ``ttl`` secondes."""
+    now = time.monotonic()
+    with _result_cache_lock:
+        entry = _result_cache.get(key)
+        if entry is not None and entry[0] > now and not refresh:
+            return entry[1]
+    value = builder()
+    with _result_cache_lock:
+        _result_cache[key] = (now + ttl, value)
+    return value
+
+
+def clear_cache() -> None:
+    with _result_cache_lock:
+        _result_cache.clear()
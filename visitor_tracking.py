@@ -0,0 +1,220 @@
+"""
+Pipeline asynchrone de tracking des visiteurs (conforme RGPD).
+
+Le hook ``before_request`` se contente d'empiler un événement compact dans une
+file bornée en mémoire. Un thread d'arrière-plan (un par worker gunicorn)
+vide la file par lots : il géolocalise les IP, détecte les robots puis insère
+les lignes ``VisitorLog`` en une seule requête, dès que le lot atteint
+``TRACKING_BATCH_SIZE`` événements ou que ``TRACKING_FLUSH_INTERVAL`` secondes
+se sont écoulées.
+
+Si la file est pleine (rafale de crawlers, base lente), les événements sont
+abandonnés plutôt que de ralentir les pages : le compteur ``dropped`` permet
+de le surveiller via ``/health/tracking``.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from models import db
+from models.models import VisitorLog
+
+
+# Événement compact empilé par le hook (l'IP brute ne quitte jamais la mémoire)
+VisitEvent = namedtuple(
+    "VisitEvent",
+    "visited_at page_url referrer user_agent ip ip_anonymized session_id user_id",
+)
+
+
+class VisitorTracker:
+    """File bornée + flusher par lots pour les ``VisitorLog``."""
+
+    def __init__(self, app=None, geolocate=None, classify=None):
+        self.app = None
+        self._geolocate = geolocate
+        self._classify = classify
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        # Compteurs exposés par stats()
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self.last_flush_at = None
+        if app is not None:
+            self.init_app(app, geolocate, classify)
+
+    def init_app(self, app, geolocate, classify) -> None:
+        self.app = app
+        self._geolocate = geolocate
+        self._classify = classify
+        self.async_mode = app.config.get("TRACKING_ASYNC", True)
+        self.batch_size = max(1, int(app.config.get("TRACKING_BATCH_SIZE", 100)))
+        self.flush_interval = float(app.config.get("TRACKING_FLUSH_INTERVAL", 5))
+        self._queue = queue.Queue(maxsize=int(app.config.get("TRACKING_QUEUE_SIZE", 5000)))
+        app.extensions["visitor_tracker"] = self
+        atexit.register(self.shutdown)
+
+    # -------------------------------------------------
+    # Côté requête
+    # -------------------------------------------------
+    def enqueue(self, event: VisitEvent) -> bool:
+        """Empile un événement sans bloquer. Retourne False s'il a été abandonné."""
+        if not self.async_mode:
+            # Mode synchrone (scripts, tests) : écriture immédiate
+            self.enqueued += 1
+            self.flush([event])
+            return True
+
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(event)
+            self.enqueued += 1
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _ensure_worker(self) -> None:
+        """Démarre le thread de flush (paresseusement, et à nouveau après un fork)."""
+        pid = os.getpid()
+        if self._thread is not None and self._thread.is_alive() and self._pid == pid:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == pid:
+                return
+            if self._pid is not None and self._pid != pid:
+                # Processus enfant : la file héritée du parent n'est pas partagée
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._pid = pid
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="visitor-tracker", daemon=True
+            )
+            self._thread.start()
+
+    # -------------------------------------------------
+    # Côté thread d'arrière-plan
+    # -------------------------------------------------
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self.flush(batch)
+
+    def _collect_batch(self) -> list:
+        """Attend le premier événement puis complète le lot jusqu'au seuil de taille ou de temps."""
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self) -> list:
+        events = []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                return events
+
+    def flush(self, events) -> int:
+        """Géolocalise, classe et insère un lot d'événements. Retourne le nombre de lignes écrites."""
+        if not events:
+            return 0
+        started = time.perf_counter()
+        with self.app.app_context():
+            try:
+                rows = self._build_rows(events)
+                db.session.execute(db.insert(VisitorLog), rows)
+                db.session.commit()
+                self.written += len(rows)
+            except Exception as e:
+                db.session.rollback()
+                self.failed += len(events)
+                self.app.logger.warning(f"[TRACKING] Erreur lors de l'écriture du lot ({len(events)} visites): {e}")
+                return 0
+            finally:
+                self._record_flush(started)
+        return len(events)
+
+    def _build_rows(self, events) -> list:
+        # Une seule géolocalisation par IP au sein d'un lot
+        geo_by_ip = {}
+        rows = []
+        for event in events:
+            geo = geo_by_ip.get(event.ip)
+            if geo is None:
+                geo = self._geolocate(event.ip)
+                geo_by_ip[event.ip] = geo
+            rows.append({
+                "visited_at": event.visited_at,
+                "page_url": event.page_url,
+                "referrer": event.referrer,
+                "user_agent": event.user_agent,
+                "ip_anonymized": event.ip_anonymized,
+                "session_id": event.session_id,
+                "user_id": event.user_id,
+                "city": geo["city"],
+                "region": geo["region"],
+                "country": geo["country"],
+                "isp": geo["isp"],
+                "is_bot": self._classify(event.user_agent, geo["isp"]),
+            })
+        return rows
+
+    def _record_flush(self, started: float) -> None:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self.total_flush_ms += elapsed_ms
+        self.last_flush_at = datetime.utcnow()
+
+    def shutdown(self) -> None:
+        """Vide la file avant l'arrêt du worker (appelé via atexit)."""
+        self._stop.set()
+        if self._queue is None or self._pid != os.getpid():
+            return
+        pending = self._drain()
+        for i in range(0, len(pending), self.batch_size):
+            self.flush(pending[i:i + self.batch_size])
+
+    def stats(self) -> dict:
+        return {
+            "async": self.async_mode,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "queue_capacity": self._queue.maxsize if self._queue is not None else 0,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+            "flushes": self.flushes,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "avg_flush_ms": round(self.total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+            "last_flush_at": self.last_flush_at.isoformat() if self.last_flush_at else None,
+            "worker_alive": bool(self._thread and self._thread.is_alive()),
+        }